@@ -8,17 +8,34 @@ Date: 11/07/2021
 
 
 import argparse
-import json
+import itertools
+import math
 import sys
-import textwrap as tw
 import pandas as pd
-import grequests
+import http_client
 import time
 import datetime
-import pymysql
+import multiprocessing
+import gevent
+import gevent.event
+import gevent.lock
+import gevent.queue
+import gevent.select
 import selenium.common.exceptions
 
+import bulk_writer
+import checkpoint
+import data_enrichment
+import dimension_cache
+import http_listing
+import known_urls
+import metrics
+import next_data
+import output_sinks
+import sql_script
+import storage
 import enrichment_api
+from article import Article, ArticleBatch
 from config import *
 from bs4 import BeautifulSoup
 from selenium import webdriver
@@ -32,128 +49,6 @@ from datetime import date
 from datetime import timedelta
 
 
-class Article:
-    """
-        A class to represent an article.
-
-        Attributes
-        ----------
-        article_num : int
-            Number article instance created.
-        title: str
-            Article title.
-        summary: str
-            Article summary.
-        author: str or list of strings
-            Article author(s).
-        link: str
-            Link to article webpage (url).
-        tags: list of str
-            Article hashtags.
-        date_published: datetime
-            Date and time article was published.
-        categories: (str)
-            Categories article falls under.
-
-
-        Methods
-        -------
-        get_article_num():
-            Returns article number of instance created.
-
-        get_title(self):
-            Returns article title
-
-        get_summary(self):
-            Returns article summary
-
-        get_link(self):
-            Returns URL to article page
-
-        get_tags(self):
-            Returns article tags
-
-        get_date_published(self):
-            Returns date and time article was published
-
-        get_categories(self):
-            Returns article category
-
-        get_authors(self):
-            Returns article author(s)
-        """
-    article_num = 0
-
-    def __init__(self, title, summary, author, link, tags, date_published, categories, source):
-        """
-        Constructs all necessary attributes of the vehicle object.
-        """
-        Article.article_num += 1
-        self.article_num = Article.article_num
-        self.title = title
-        self.summary = summary
-        self.author = author
-        self.link = link
-        self.tags = tags
-        self.date_published = date_published
-        self.categories = categories
-        self.source = source
-
-    def __str__(self):
-        """
-        Constructs a table when print is called on the article.
-        :return: table
-        """
-        return tabulate(tabular_data=[
-            ['Title', self.title],
-            ['Summary', '\n'.join(tw.wrap(self.summary, width=90))],
-            ['Author', ', '.join(self.author)],
-            ['Source', self.source],
-            ['Categories', ', '.join(self.categories)],
-            ['Link', self.link],
-            ['Tags', ', '.join(self.tags)],
-            ['Date/Time Published', self.date_published]
-        ],
-            headers=['#', self.article_num],
-            tablefmt='plain')
-
-    def get_article_num(self):
-        """:return: article number (int)"""
-        return self.article_num
-
-    def get_title(self):
-        """:return: article title (str)"""
-        return self.title
-
-    def get_summary(self):
-        """:return: article summary"""
-        return self.summary
-
-    def get_link(self):
-        """:return: url (str) to article webpage"""
-        return self.link
-
-    def get_tags(self):
-        """:return: article tags (list)"""
-        return self.tags
-
-    def get_date_published(self):
-        """:return: date and time article was published."""
-        return self.date_published
-
-    def get_categories(self):
-        """:return: the categories the article belongs to"""
-        return self.categories
-
-    def get_authors(self):
-        """:return: the authors that wrote the article"""
-        return self.author
-
-    def get_source(self):
-        """:return: the source that the article came from"""
-        return self.source
-
-
 # Overriding error function in order to display the help message
 # whenever the error method is triggered - UX purposes.
 class MyParser(argparse.ArgumentParser):
@@ -178,56 +73,127 @@ def welcome():
     Gets the category and number of articles required by the user, with argparser,
     and outputs the relevant URL suffix for these articles together with the number of articles.
     the program also response to the flag -h for help.
-    return:    category: relevant category URL suffix.
+    return:    categories: names of the categories to scrape.
                scrape_by: number of articles requested by the user
                username: username for mysql
                password: password for mysql
                host: url of database server
                database: database that the program is going to save the data to
+               enrich: whether to enrich the data with articles from other sources
+               pipeline: whether to run fetching, parsing and saving as concurrent stages
+               listing: how to page through the category listing (http or selenium)
+               incremental: whether to skip articles that are already stored
+               resume: whether to continue the previous run from its checkpoint
+               output: how to print the scraped articles (none, table, jsonl or csv)
+               output_file: file to write the articles to, '-' for the terminal
+               top_tags: number of tags to enrich
+               top_days: pick the tags to enrich by the articles of the last days (None for all)
+               enrich_articles: number of articles to enrich each tag with
+               enrich_days: enrich only with articles of the last days (None for any date)
+               trends: whether to store the Google Trends regions of the enriched tags
+               metrics_file: file to write the json metrics report of the run to, or None
+               prometheus_file: file to keep the Prometheus text metrics in during the run, or None
+               metrics_port: port to serve the Prometheus metrics at /metrics on during the run, or None
     """
 
-    category_dict = {
-        'tech': DEFAULT_PREFIX + 'tech',
-        'business': DEFAULT_PREFIX + 'business',
-        'people': DEFAULT_PREFIX + 'people',
-        'regulation': DEFAULT_PREFIX + 'policy-regulation',
-        'features': '/features',
-        'markets': '/markets',
-        'opinion': '/opinion',
-        'latest': '/news',
-    }
-
     coindesk_reader = MyParser(add_help=False)
 
     date_or_num = coindesk_reader.add_mutually_exclusive_group(required=True)
-    coindesk_reader.add_argument('category', type=str.lower, metavar='category',
-                                 help='Choose one of the following categories: '
+    coindesk_reader.add_argument('category', type=str.lower, metavar='category', nargs='+',
+                                 help='Choose one or more of the following categories: '
                                       'latest, tech, business, regulation, people, '
-                                      'features, opinion, markets.',
-                                 choices=['latest', 'tech', 'business', 'regulation', 'people', 'opinion', 'markets'])
-    date_or_num.add_argument('-num', type=int, metavar='num_articles',
+                                      'features, opinion, markets, or all of them with "all".',
+                                 choices=list(CATEGORY_URLS) + [ALL_CATEGORIES])
+    date_or_num.add_argument('-num', metavar='num_articles',
                              help=f'You can choose one of the two options: -num or -date.'
                                   f'\nChoose number of articles, from 1 to {MAX_ARTICLES} '
                                   f'in "-num [your number]" format.',
-                             choices=list(range(1, MAX_ARTICLES + 1)))
+                             type=article_count)
     date_or_num.add_argument('-date', type=lambda s: datetime.strptime(s, '%Y-%m-%d'), metavar='from_date',
                              help=f'You can choose one of the two options: -num or -date. '
                                   f' Enter Date in "-date YYYY-MM-DD" format. '
                                   f'You will get articles published after that date')
     coindesk_reader.add_argument('-u', '--username', help='username of mysql', default=USER)
+    coindesk_reader.add_argument('--listing', help='How to page through the category listing: over plain HTTP, '
+                                                   'or by clicking "MORE" in Chrome (http falls back to selenium '
+                                                   'if the listing can\'t be read)',
+                                 choices=[HTTP_LISTING, SELENIUM_LISTING], default=HTTP_LISTING)
+    coindesk_reader.add_argument('--incremental', help='Skip articles that are already stored before fetching them',
+                                 action='store_true')
+    coindesk_reader.add_argument('--resume', help='Continue the previous run of the same command from its last '
+                                                  'saved batch', action='store_true')
+    coindesk_reader.add_argument('--pipeline', help='Fetch, parse and save articles as concurrent stages',
+                                 action='store_true')
+    coindesk_reader.add_argument('--output', help='How to print the scraped articles: not at all, as tables, '
+                                                  'as JSON Lines or as CSV',
+                                 choices=[NO_OUTPUT, TABLE_OUTPUT, JSON_LINES_OUTPUT, CSV_OUTPUT], default=TABLE_OUTPUT)
+    coindesk_reader.add_argument('--output-file', help='File to write the articles to (default: the terminal)',
+                                 default=OUTPUT_STDOUT)
     coindesk_reader.add_argument('-$', '--enrich', help='Data enrichment with articles from other sources.'
                                                         ' 1 = Enrich, 0 = Do not enrich',type=lambda x:int(x),
                                  default=0, choices=[1, 0])
-
-    required = coindesk_reader.add_argument_group('required arguments')
-    required.add_argument('-p', '--password', help='password of mysql', required=True)
+    coindesk_reader.add_argument('--top-tags', metavar='N', help='With --enrich, enrich the N most common tags',
+                                 type=int, default=TOP_TAGS_COUNT)
+    coindesk_reader.add_argument('--top-days', metavar='DAYS', help='With --enrich, pick the tags by the articles '
+                                                                    'of the last DAYS days', type=int)
+    coindesk_reader.add_argument('--enrich-articles', metavar='N', help='With --enrich, the number of articles to '
+                                                                        'retrieve per tag, from 1 to '
+                                                                        f'{ENRICHMENT_MAX_ARTICLES}',
+                                 type=int, default=ENRICHMENT_PAGE_SIZE)
+    coindesk_reader.add_argument('--enrich-days', metavar='DAYS', help='With --enrich, retrieve only articles of '
+                                                                       'the last DAYS days', type=int)
+    coindesk_reader.add_argument('--trends', help='With --enrich, also store the regions in which the tags are '
+                                                  'searched on Google (needs pytrends)', action='store_true')
+
+    coindesk_reader.add_argument('--metrics-file', help='Write the json report of the per stage counters and '
+                                                        'latencies to this file at the end of the run '
+                                                        f'({METRICS_FILE} if no file is given)',
+                                 nargs='?', const=METRICS_FILE)
+    coindesk_reader.add_argument('--prometheus-file', help='File to keep the metrics in, in the Prometheus text '
+                                                           f'format, rewritten every {METRICS_FLUSH_INTERVAL} '
+                                                           'seconds during the run')
+    coindesk_reader.add_argument('--metrics-port', metavar='PORT', help='Serve the metrics in the Prometheus text '
+                                                                        'format at /metrics during the run',
+                                 type=int)
+
+    coindesk_reader.add_argument('--storage', help='Database backend: a MySQL server, or an embedded SQLite file',
+                                 choices=[MYSQL_STORAGE, SQLITE_STORAGE], default=MYSQL_STORAGE)
+
+    coindesk_reader.add_argument('-p', '--password', help='password of mysql (required with the mysql storage)')
     coindesk_reader.add_argument('-host', help='url of database server', default=HOST)
-    coindesk_reader.add_argument('-db', '--database', help='Name of database to insert to', default=DATABASE)
+    coindesk_reader.add_argument('-db', '--database', help='Name of database to insert to (the database file '
+                                                           'with sqlite)', default=DATABASE)
 
     args = coindesk_reader.parse_args()
     scrape_by = handle_args_num_and_date(coindesk_reader, args)
-
-    return category_dict[args.category], scrape_by, args.username, args.password, args.host, args.database, args.enrich
+    categories = list(CATEGORY_URLS) if ALL_CATEGORIES in args.category else list(dict.fromkeys(args.category))
+    if args.resume and len(categories) > 1:
+        coindesk_reader.error('--resume is only supported when scraping a single category')
+    if args.storage == MYSQL_STORAGE and args.password is None:
+        coindesk_reader.error('the following arguments are required with the mysql storage: -p/--password')
+    if args.trends and data_enrichment.TrendReq is None:
+        coindesk_reader.error('--trends needs pytrends, install it with "pip install pytrends"')
+    storage.select_backend(args.storage)
+
+    return categories, scrape_by, args.username, args.password, args.host, args.database, \
+        args.enrich, args.pipeline, args.listing, args.incremental, args.resume, args.output, args.output_file, \
+        args.top_tags, args.top_days, args.enrich_articles, args.enrich_days, args.trends, args.metrics_file, \
+        args.prometheus_file, args.metrics_port
+
+
+def article_count(value):
+    """
+    argparse type of -num, checks the range without listing every allowed number as a choice
+    :param value: the argument string
+    :return: number of articles (int)
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid number: {value}')
+    if not 1 <= number <= MAX_ARTICLES:
+        raise argparse.ArgumentTypeError(f'choose a number from 1 to {MAX_ARTICLES}')
+    return number
 
 
 def handle_args_num_and_date(parser, args):
@@ -320,18 +286,280 @@ def get_html(url, scrape_by):
     :param scrape_by: dictionary that details how to scrape
     :return: the page source code as html
     """
-    chrome_options = webdriver.ChromeOptions()
-    chrome_options.headless = True
-    browser = webdriver.Chrome(PATH, options=chrome_options)
+    with metrics.timer('get_html_seconds'):
+        chrome_options = webdriver.ChromeOptions()
+        chrome_options.headless = True
+        browser = webdriver.Chrome(PATH, options=chrome_options)
+        try:
+            browser.get(url)
+            scrape_by[SCRAPE_BY_FUNCTION](scrape_by[SCRAPE_BY_PARAMETERS], browser)
+        except selenium.common.exceptions.WebDriverException as err:
+            print(err.msg)
+            coin_logger.error(err.msg)
+            exit(1)
+        html = browser.page_source
+    return html
+
+
+def resume_checkpoint(category, scrape_by):
+    """
+    loads the checkpoint of the previous run, making sure it was scraping the same thing (the same category,
+    and the same number of articles or date)
+    :param category: category URL suffix
+    :param scrape_by: dictionary that details how to scrape
+    :return: Checkpoint
+    """
+    state = checkpoint.load_checkpoint(CHECKPOINT_FILE)
+    if state is None:
+        print('There is no unfinished scrape to resume.')
+        coin_logger.error('There is no unfinished scrape to resume.')
+        exit(1)
+    if state.category != category or state.scrape_type != scrape_by[SCRAPE_BY_TYPE] or \
+            state.scrape_parameter != scrape_by[SCRAPE_BY_PARAMETERS]:
+        print(f'The unfinished scrape was of {state.category} by {state.scrape_type} ({state.scrape_parameter}), '
+              f'run the same command to resume.')
+        coin_logger.error('Tried to resume a checkpoint of a different scrape.')
+        exit(1)
+    Article.article_num = state.article_num
+    print(f'Resuming from batch {state.committed_batches + 1} of {math.ceil(len(state.links) / state.batch_size)}.')
+    coin_logger.info(f'Resuming scrape from batch {state.committed_batches}.')
+    return state
+
+
+def get_links(category, scrape_by, listing):
+    """
+    Collects the urls of the articles to scrape from the category listing.
+    :param category: category URL suffix
+    :param scrape_by: dictionary that details how to scrape
+    :param listing: HTTP_LISTING to page through the listing over plain HTTP, SELENIUM_LISTING to use Chrome
+    :return: list of urls
+    """
+    if listing == HTTP_LISTING:
+        links = http_listing.http_listing_links(category, scrape_by)
+        if len(links) > 0:
+            return links
+        print('Could not read the listing over HTTP, falling back to Chrome.')
+        coin_logger.warning('Could not read the listing over HTTP, falling back to selenium.')
+    return scrape_main(get_html(URL + category, scrape_by))
+
+
+def filter_stored_links(links, user, password, host, database):
+    """
+    removes the links of articles that are already stored, so they aren't fetched again
+    :param links: list of article urls
+    :param user: username of mysql
+    :param password: password of mysql
+    :param host: url of database server
+    :param database: database to save to
+    :return: list of urls of new articles
+    """
     try:
-        browser.get(url)
-        scrape_by[SCRAPE_BY_FUNCTION](scrape_by[SCRAPE_BY_PARAMETERS], browser)
-    except selenium.common.exceptions.WebDriverException as err:
-        print(err.msg)
-        coin_logger.error(err.msg)
+        with storage.get_storage(host, user, password, database).connection() as connection_instance:
+            new_links = known_urls.KnownUrls().load(connection_instance).filter_new(links, connection_instance)
+    except storage.DatabaseError as err:
+        print(err.args)
+        coin_logger.error(err.args)
         exit(1)
-    html = browser.page_source
-    return html
+    print(f'Skipping {len(links) - len(new_links)} articles that are already stored.')
+    coin_logger.info(f'Skipping {len(links) - len(new_links)} articles that are already stored.')
+    return new_links
+
+
+def get_links_worker(category, scrape_by, listing, connection):
+    """
+    reads the listing of a category in a worker process and sends the links back to the parent,
+    together with the metrics of the worker
+    :param category: category name
+    :param scrape_by: dictionary that details how to scrape
+    :param listing: HTTP_LISTING or SELENIUM_LISTING
+    :param connection: writable end of a pipe to the parent process
+    """
+    metrics.stop_inherited_exporters()
+    try:
+        connection.send((list(get_links(CATEGORY_URLS[category], scrape_by, listing)),
+                         metrics.get_metrics().snapshot()))
+    except SystemExit:
+        connection.send((None, metrics.get_metrics().snapshot()))
+    finally:
+        connection.close()
+
+
+def get_category_links(categories, scrape_by, listing):
+    """
+    reads the listings of several categories at the same time, one worker process per category
+    :param categories: category names
+    :param scrape_by: dictionary that details how to scrape
+    :param listing: HTTP_LISTING or SELENIUM_LISTING
+    :return: dictionary of category name to its list of links (categories that failed are left out)
+    """
+    context = multiprocessing.get_context('fork')
+    workers = []
+    for category in categories:
+        receiver, sender = context.Pipe(duplex=False)
+        worker = context.Process(target=get_links_worker, args=(category, scrape_by, listing, sender))
+        worker.start()
+        sender.close()
+        workers.append((category, worker, receiver))
+    category_links = {}
+    for category, worker, receiver in workers:
+        try:
+            links, snapshot = receiver.recv()
+            metrics.get_metrics().merge(snapshot)
+        except EOFError:
+            links = None
+        worker.join()
+        if links is None:
+            print(f'Could not read the {category} listing, skipping it.')
+            coin_logger.error(f'Could not read the {category} listing.')
+        else:
+            print(f'{category}: found {len(links)} articles.')
+            category_links[category] = links
+    return category_links
+
+
+def dedupe_category_links(category_links):
+    """
+    gives every url to the first category that listed it, the latest news listing coming last, and remembers
+    all the categories that listed it
+    :param category_links: dictionary of category name to its list of links
+    :return: dictionary of category name to the links it should fetch,
+             dictionary of url to the categories whose listings it appeared in
+    """
+    seen = set()
+    claimed = {category: [] for category in category_links}
+    link_categories = {}
+    for category in sorted(category_links, key=lambda name: name == LATEST_CATEGORY):
+        for link in category_links[category]:
+            if category in CATEGORY_NAMES:
+                link_categories.setdefault(link, []).append(CATEGORY_NAMES[category])
+            if link not in seen:
+                seen.add(link)
+                claimed[category].append(link)
+    return claimed, link_categories
+
+
+class WorkerSink:
+    """
+        Sends the articles a category worker scraped to the parent process, which writes them to its output sink,
+        so the output of several workers isn't interleaved.
+
+        Methods
+        -------
+        write(articles):
+            Sends a batch of articles to the parent.
+        """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def write(self, articles):
+        """:param articles: ArticleBatch"""
+        self.connection.send((ARTICLES_MESSAGE, articles))
+
+
+def scrape_category_worker(links, scrape_by, pipeline, user, password, host, database, link_categories,
+                           write_articles, connection):
+    """
+    scrapes the links a category claimed in a worker process, sending the parent the articles to write and
+    finally the number of articles saved (None if the scrape failed) with the metrics of the worker
+    :param links: list of urls claimed by the category
+    :param scrape_by: dictionary that details how to scrape
+    :param pipeline: whether to run fetching, parsing and saving as concurrent stages
+    :param user: username of mysql
+    :param password: password of mysql
+    :param host: url of database server
+    :param database: database to save to
+    :param link_categories: dictionary of url to extra categories to record for the article
+    :param write_articles: whether the parent writes the articles to an output sink
+    :param connection: writable end of a pipe to the parent process
+    """
+    metrics.stop_inherited_exporters()
+    saved = None
+    try:
+        warm_id_caches(user, password, host, database)
+        Article.article_num = 0
+        scrape = pipelined_scraper if pipeline else scraper
+        saved = scrape(links, BATCH, scrape_by, user, password, host, database, link_categories=link_categories,
+                       sink=WorkerSink(connection) if write_articles else None)
+    except SystemExit:
+        pass
+    finally:
+        storage.close_storages()
+        connection.send((DONE_MESSAGE, saved, metrics.get_metrics().snapshot()))
+        connection.close()
+
+
+def start_category_worker(links, scrape_by, pipeline, user, password, host, database, link_categories,
+                          write_articles):
+    """
+    starts scraping the links of a category in a worker process
+    :return: readable end of the pipe from the worker, the worker process
+    """
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    worker = context.Process(target=scrape_category_worker,
+                             args=(links, scrape_by, pipeline, user, password, host, database, link_categories,
+                                   write_articles, sender))
+    worker.start()
+    sender.close()
+    return receiver, worker
+
+
+def scrape_categories(categories, scrape_by, listing, incremental, pipeline, user, password, host, database,
+                      sink=None):
+    """
+    scrapes several categories: their listings are read in parallel, every article is fetched once even if
+    it's listed in several categories, and is saved with all of them. the links each category claimed are then
+    scraped and saved in worker processes, CATEGORY_WORKERS categories at a time
+    :param categories: category names
+    :param scrape_by: dictionary that details how to scrape
+    :param listing: HTTP_LISTING or SELENIUM_LISTING
+    :param incremental: whether to skip articles that are already stored
+    :param pipeline: whether to run fetching, parsing and saving as concurrent stages
+    :param user: username of mysql
+    :param password: password of mysql
+    :param host: url of database server
+    :param database: database to save to
+    :param sink: OutputSink to write the articles to, or None
+    """
+    category_links = get_category_links(categories, scrape_by, listing)
+    claimed, link_categories = dedupe_category_links(category_links)
+    pending = list(claimed.items())
+    running = {}
+    progress = {}
+    while pending or running:
+        # workers are forked here, from the main greenlet, so they don't inherit one waiting on another worker
+        while pending and len(running) < CATEGORY_WORKERS:
+            category, links = pending.pop(0)
+            if incremental:
+                links = filter_stored_links(links, user, password, host, database)
+            print(f'Scraping {category}: {len(links)} articles...')
+            receiver, worker = start_category_worker(links, scrape_by, pipeline, user, password, host, database,
+                                                     link_categories, sink is not None)
+            running[receiver] = (category, worker, len(links))
+        readable, _, _ = gevent.select.select(list(running), [], [])
+        for receiver in readable:
+            try:
+                message = receiver.recv()
+            except EOFError:
+                message = (DONE_MESSAGE, None, None)
+            if message[0] == ARTICLES_MESSAGE:
+                sink.write(message[1])
+                continue
+            kind, saved, snapshot = message
+            category, worker, fetched = running.pop(receiver)
+            receiver.close()
+            worker.join()
+            if snapshot is not None:
+                metrics.get_metrics().merge(snapshot)
+            if saved is None:
+                print(f'Could not scrape the {category} articles.')
+                coin_logger.error(f'Could not scrape the {category} articles.')
+            progress[category] = [category, len(category_links[category]),
+                                  len(category_links[category]) - len(claimed[category]), fetched, saved]
+            coin_logger.info(f'Scraped {category}: {progress[category]}')
+    print(tabulate([progress[category] for category in claimed],
+                   headers=['category', 'listed', 'in other categories', 'fetched', 'saved']))
 
 
 def scrape_main(html):
@@ -340,92 +568,246 @@ def scrape_main(html):
     :param html: str
     :return: list
     """
-    soup = BeautifulSoup(html, 'html.parser').find('div', class_='story-stack')
-    links = pd.Series(
-        [URL + link.get('href') for link in soup.find_all('a', title=True)
-         if str(link.get('href')).count("/") == 1]).unique()
+    with metrics.timer('scrape_main_seconds'):
+        soup = BeautifulSoup(html, 'html.parser').find('div', class_='story-stack')
+        links = pd.Series(
+            [URL + link.get('href') for link in soup.find_all('a', title=True)
+             if str(link.get('href')).count("/") == 1]).unique()
     coin_logger.info('Scraped article urls from main page.')
     return links
 
 
-def scrape_articles(urls):
+def fetch_articles(urls):
     """
-    scraps all of the articles from the url list
+    downloads all of the article pages from the url list
     :param urls: list of urls
-    :return: lists of article data
+    :return: list of responses (None for pages that failed to download)
+    """
+    with metrics.timer('scrape_articles_seconds', stage='fetch'):
+        responses = http_client.get_client().map(urls)
+    metrics.inc('article_pages_total', len(urls))
+    metrics.inc('article_page_failures_total', responses.count(None))
+    return responses
+
+
+def parse_article(response, link, link_categories=None):
+    """
+    parses a downloaded article page
+    :param response: response of the article page, or None if it failed to download
+    :param link: url of the article
+    :param link_categories: dictionary of url to extra categories to record for the article, or None
+    :return: Article, or None if the page has no article data
     """
-    responses = grequests.map((grequests.get(url) for url in urls))
-    soups = [BeautifulSoup(response.content, 'html.parser') for response in responses]
-    data_dicts = []
     # TODO: find better way to check for 404s?
-    for soup in soups:
-        props = json.loads(soup.find(SCRIPT_TAG, id=SCRIPT_ID, type=SCRIPT_TYPE).string)[PROPERTIES_TAG][
-            INITIAL_PROPERTIES_TAG][PAGE_PROPERTIES]
-        if DATA_TAG not in props:  # article doesn't exist anymore (404 page)
-            coin_logger.warning('Encountered link that led to an internal 404 will not scrap its data.')
-            continue
-        else:
-            data_dicts.append(props[DATA_TAG])
+    if response is None:
+        coin_logger.warning(f'Could not download {link}, will not scrap it.')
+        return None
+    page_data = next_data.extract_next_data(response.content)
+    if page_data is None:
+        coin_logger.warning(f'Encountered page without article data, will not scrap it: {link}.')
+        return None
+    props = page_data[PROPERTIES_TAG][INITIAL_PROPERTIES_TAG][PAGE_PROPERTIES]
+    if DATA_TAG not in props:  # article doesn't exist anymore (404 page)
+        coin_logger.warning('Encountered link that led to an internal 404 will not scrap its data.')
+        return None
+    data = props[DATA_TAG]
+    return Article(
+        title=data[TITLE_TAG],
+        summary=data[SUMMARY_TAG],
+        author=[author[AUTHOR_NAME_TAG] for author in data[AUTHORS_TAG]],
+        link=link,
+        tags=[tag[TAG_NAME_TAG] for tag in data[TAGS_TAG]],
+        date_published=datetime.strptime(data[PUBLISHED_DATE_TAG], PUBLISHED_DATE_FORMAT),
+        categories=add_link_categories(data[TAXONOMY_TAG][CATEGORY_TAG], link, link_categories),
+        source='Coindesk'
+    )
+
+
+def parse_articles(link_set, responses, link_categories=None):
+    """
+    parses the downloaded article pages one at a time, letting go of every page once it's parsed
+    :param link_set: list of article urls
+    :param responses: list of responses of the urls, in the same order
+    :param link_categories: dictionary of url to extra categories to record for the article, or None
+    :return: generator of Articles (pages without article data are skipped)
+    """
+    for i, link in enumerate(link_set):
+        response, responses[i] = responses[i], None
+        with metrics.timer('scrape_articles_seconds', stage='parse'):
+            article = parse_article(response, link, link_categories)
+        if article is not None:
+            metrics.inc('articles_parsed_total')
+            yield article
+
+
+def scrape_articles(link_set, link_categories=None):
+    """
+    scraps the articles of a batch of urls
+    :param link_set: list of article urls
+    :param link_categories: dictionary of url to extra categories to record for the article, or None
+    :return: generator of Articles
+    """
+    return parse_articles(link_set, fetch_articles(link_set), link_categories)
+
+
+def take_articles(articles, scrape_by):
+    """
+    collects the articles of a batch until the stop condition is met
+    :param articles: iterable of Articles
+    :param scrape_by: dictionary defining how to scrape
+    :return: ArticleBatch of the articles to save, whether the stop condition was met
+    """
+    taken = ArticleBatch()
+    for article in articles:
+        if stop_condition(article, scrape_by):
+            return taken, True
+        taken.append(article)
+    return taken, False
+
+
+def article_batches(links, batch, scrape_by, state=None, link_categories=None):
+    """
+    streams the articles batch by batch: only one batch of pages is downloaded and held in memory at a time,
+    no matter how many links there are
+    :param links: iterable of article urls
+    :param batch: int size of batch
+    :param scrape_by: dictionary defining how to scrape
+    :param state: Checkpoint to record the progress in (batches it has as committed are skipped), or None
+    :param link_categories: dictionary of url to extra categories to record for the article, or None
+    :return: generator of (batch number, ArticleBatch)
+    """
+    first_batch = 0 if state is None else state.committed_batches
+    for set_number, link_set in enumerate(split_list(links, batch, first_batch), first_batch):
+        articles, stopped = take_articles(scrape_articles(link_set, link_categories), scrape_by)
+        coin_logger.info('Scraped article batch from their pages')
+        yield set_number, articles
+        if stopped:
+            return
 
-    titles = [data[TITLE_TAG] for data in data_dicts]
-    summaries = [data[SUMMARY_TAG] for data in data_dicts]
-    authors = [[author[AUTHOR_NAME_TAG] for author in data[AUTHORS_TAG]] for data in data_dicts]
-    tags = [[tag[TAG_NAME_TAG] for tag in data[TAGS_TAG]] for data in data_dicts]
-    times_published = [datetime.strptime(data[PUBLISHED_DATE_TAG], PUBLISHED_DATE_FORMAT) for data in data_dicts]
-    categories = [data[TAXONOMY_TAG][CATEGORY_TAG] for data in data_dicts]
-    return titles, summaries, authors, tags, times_published, categories
+
+def scraper(links, batch, scrape_by, user, password, host, database, state=None, link_categories=None, sink=None):
+    """
+    scrapes the articles and save the data into the database in batches
+    :param links: iterable of article urls
+    :param batch: int size of batch
+    :param scrape_by: dictionary defining how to scrape
+    :param user: username of mysql
+    :param password: password of mysql
+    :param host: url of database server
+    :param database: database to save to
+    :param state: Checkpoint to record the progress in (batches it has as committed are skipped), or None
+    :param link_categories: dictionary of url to extra categories to record for the article, or None
+    :param sink: OutputSink to write the articles to, or None
+    :return: number of articles saved
+    """
+    saved = 0
+    for set_number, articles in article_batches(links, batch, scrape_by, state, link_categories):
+        if sink is not None:
+            sink.write(articles)
+        saved += insert_batch(articles, batch, host, user, password, database)
+        if state is not None:
+            state.mark_committed(set_number, Article.article_num)
+    coin_logger.info('Finished scraping and saved data to database.')
+    return saved
 
 
-def scraper(html, batch, scrape_by, user, password, host, database):
+def pipelined_scraper(links, batch, scrape_by, user, password, host, database, state=None, link_categories=None,
+                      sink=None):
     """
-    scrapes the html source code and save the data into the database in batches
-    :param html: string of html source code
+    scrapes the articles like scraper, but runs fetching, parsing and saving to the database as
+    concurrent greenlet stages connected by bounded queues, so the network is not idle while the database works.
+    a stage that gets PIPELINE_QUEUE_SIZE batches ahead of the next one blocks until it catches up.
+    :param links: iterable of article urls
     :param batch: int size of batch
     :param scrape_by: dictionary defining how to scrape
     :param user: username of mysql
     :param password: password of mysql
     :param host: url of database server
     :param database: database to save to
-    :return:
+    :param state: Checkpoint to record the progress in (batches it has as committed are skipped), or None
+    :param link_categories: dictionary of url to extra categories to record for the article, or None
+    :param sink: OutputSink to write the articles to, or None
+    :return: number of articles saved
     """
-    links = scrape_main(html)
-    links = list(split_list(links, batch))
+    first_batch = 0 if state is None else state.committed_batches
+    saved = 0
+    fetched = gevent.queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    parsed = gevent.queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stop = gevent.event.Event()
 
-    for set_number, link_set in enumerate(links):
-        articles = []
-        titles, summaries, authors, tags, times_published, categories = scrape_articles(link_set)
-        coin_logger.info('Scraped article batch from their pages')
-        for art_number in range(len(authors)):
-            new_article = Article(
-                title=titles[art_number],
-                summary=summaries[art_number],
-                author=authors[art_number],
-                link=links[set_number][art_number],
-                tags=tags[art_number],
-                date_published=times_published[art_number],
-                categories=categories[art_number],
-                source='Coindesk'
-            )
-            if stop_condition(new_article, scrape_by):
-                insert_batch(articles, batch, host, user, password, database)
-                coin_logger.info('Finished scraping and saved data to database.')
-                return
-            print(new_article, '\n')
-            articles.append(new_article)
-        insert_batch(articles, batch, host, user, password, database)
+    def fetch_stage():
+        try:
+            for set_number, link_set in enumerate(split_list(links, batch, first_batch), first_batch):
+                if stop.is_set():
+                    break
+                responses = fetch_articles(link_set)
+                coin_logger.info('Fetched article batch from their pages')
+                fetched.put((set_number, link_set, responses))
+        finally:
+            if not stop.is_set():
+                fetched.put(None)
+
+    def parse_stage():
+        try:
+            while not stop.is_set():
+                item = fetched.get()
+                if item is None:
+                    break
+                set_number, link_set, responses = item
+                articles, stopped = take_articles(parse_articles(link_set, responses, link_categories), scrape_by)
+                coin_logger.info('Scraped article batch from their pages')
+                if sink is not None:
+                    sink.write(articles)
+                if stopped:
+                    stop.set()
+                parsed.put((set_number, articles, Article.article_num))
+                # let the fetch stage stream the next batch while this one is saved
+                gevent.sleep(0)
+        finally:
+            stop.set()
+            parsed.put(None)
+            # unblock the fetch stage if it is waiting on a full queue
+            while not fetched.empty():
+                fetched.get_nowait()
+
+    stages = [gevent.spawn(fetch_stage), gevent.spawn(parse_stage)]
+    while True:
+        item = parsed.get()
+        if item is None:
+            break
+        set_number, articles, article_num = item
+        saved += insert_batch(articles, batch, host, user, password, database)
+        if state is not None:
+            state.mark_committed(set_number, article_num)
+    gevent.joinall(stages, raise_error=True)
     coin_logger.info('Finished scraping and saved data to database.')
+    return saved
 
 
-def split_list(lst, n):
+def add_link_categories(categories, link, link_categories):
+    """
+    adds the categories whose listings the article was found in to the categories from its page
+    :param categories: list of categories from the article page
+    :param link: url of the article
+    :param link_categories: dictionary of url to extra categories, or None
+    :return: list of categories
     """
-    Yields a generator with lists of n sizes chunks and a remainder if necessary
-    :param lst: list
+    if link_categories is None:
+        return categories
+    return list(dict.fromkeys(list(categories) + link_categories.get(link, [])))
+
+
+def split_list(lst, n, skip=0):
+    """
+    Yields lists of n sized chunks of an iterable, and a remainder if necessary, without materializing it
+    :param lst: iterable
     :param n: int
-    :return:
+    :param skip: number of chunks to skip from the start
+    :return: generator of lists
     """
-    """Yields a generator with lists of n sizes chunks and a remainder if necessary"""
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
+    iterator = iter(lst)
+    chunks = iter(lambda: list(itertools.islice(iterator, n)), [])
+    return itertools.islice(chunks, skip, None)
 
 
 def stop_condition(article, scrape_by):
@@ -442,35 +824,114 @@ def stop_condition(article, scrape_by):
     return False
 
 
+def warm_id_caches(user, password, host, database):
+    """
+    loads the dimension id caches of this process from the database, once before it starts saving articles
+    :param user: username of mysql
+    :param password: password of mysql
+    :param host: url of database server
+    :param database: database to save to
+    """
+    try:
+        with storage.get_storage(host, user, password, database).connection() as connection_instance:
+            with connection_instance.cursor() as cursor:
+                dimension_cache.warm_caches(dimension_cache.get_caches(host, database), cursor)
+    except storage.DatabaseError as err:
+        print(err.args)
+        coin_logger.error(err.args)
+        exit(1)
+
+
 def insert_batch(articles, batch_size, host, user, password, database):
     """
-    insert into database a batch of articles
-    :param articles: list of articles
+    insert into database a batch of articles with the set based bulk writer.
+    if the batch conflicts with rows written meanwhile by someone else, it's saved article by article instead.
+    :param articles: ArticleBatch (or list of articles)
     :param batch_size: int batch size (isn't really needed because the list is going to be batch size)
     :param host: url of database server
     :param user: username of mysql
     :param password: password of mysql
     :param database: database to save to
-    :return:
+    :return: number of articles saved
     """
     try:
-        with pymysql.connect(host=host, user=user, password=password, database=database,
-                             cursorclass=pymysql.cursors.DictCursor) as connection_instance:
-            count = 0
-            for a in articles:
-                if insert_data(a, connection_instance):
-                    count += 1
-                if count == batch_size:
-                    connection_instance.commit()
-                    count = 0
-            connection_instance.commit()
+        caches = dimension_cache.get_caches(host, database)
+        with metrics.timer('insert_batch_seconds'), \
+                storage.get_storage(host, user, password, database).connection() as connection_instance:
+            try:
+                count = bulk_writer.insert_articles(articles, connection_instance, caches)
+                connection_instance.commit()
+                dimension_cache.commit_caches(caches)
+            except storage.IntegrityError as err:
+                connection_instance.rollback()
+                dimension_cache.rollback_caches(caches)
+                coin_logger.warning(f'Bulk insert conflicted ({err.args}), saving the batch article by article.')
+                metrics.inc('insert_batch_fallbacks_total')
+                count = insert_batch_by_article(articles, batch_size, connection_instance, caches)
             coin_logger.info('Finished saving data batch to database')
-    except pymysql.err.Error as err:
+        metrics.inc('articles_saved_total', count)
+        return count
+    except storage.DatabaseError as err:
+        print(err.args)
+        coin_logger.error(err.args)
+        exit(1)
+
+
+def insert_tags(articles, host, user, password, database):
+    """
+    adds tags to stored articles, like the ones another tag of the enrichment found again. if they conflict
+    with rows written meanwhile by someone else, they're skipped with a warning.
+    :param articles: list of Articles, with only the tags to add
+    :param host: url of database server
+    :param user: username of mysql
+    :param password: password of mysql
+    :param database: database to save to
+    :return: number of tag-article relationships added
+    """
+    try:
+        caches = dimension_cache.get_caches(host, database)
+        with storage.get_storage(host, user, password, database).connection() as connection_instance:
+            try:
+                count = bulk_writer.insert_article_tags(articles, connection_instance, caches)
+                connection_instance.commit()
+                dimension_cache.commit_caches(caches)
+            except storage.IntegrityError as err:
+                connection_instance.rollback()
+                dimension_cache.rollback_caches(caches)
+                coin_logger.warning(f'Adding {len(articles)} tags to stored articles conflicted ({err.args}), '
+                                    f'skipped them.')
+                count = 0
+        return count
+    except storage.DatabaseError as err:
         print(err.args)
         coin_logger.error(err.args)
         exit(1)
 
 
+def insert_batch_by_article(articles, batch_size, connection_instance, caches=None):
+    """
+    insert into database a batch of articles one article at a time
+    :param articles: ArticleBatch (or list of articles)
+    :param batch_size: int number of articles to commit together
+    :param connection_instance: connection object
+    :param caches: dictionary of table name to DimensionCache, or None
+    :return: number of articles saved
+    """
+    count = 0
+    saved = 0
+    for a in articles:
+        if insert_data(a, connection_instance, caches):
+            count += 1
+            saved += 1
+        if count == batch_size:
+            connection_instance.commit()
+            dimension_cache.commit_caches(caches)
+            count = 0
+    connection_instance.commit()
+    dimension_cache.commit_caches(caches)
+    return saved
+
+
 def insert_data_to_entity_table(sql, data, cursor, log_msg):
     """
     inserts one entity to its respective table
@@ -486,7 +947,7 @@ def insert_data_to_entity_table(sql, data, cursor, log_msg):
 
 
 def insert_many_to_many_entities(create_single_sql, find_sql, create_relationship_sql, entity_pk_name, partner_pk, data,
-                                 cursor, log_msg, log_single_entity, debug_msg):
+                                 cursor, log_msg, log_single_entity, debug_msg, cache=None):
     """
     saves the entities of a many to many relationship to their respective tables and their relationship table
     :param create_single_sql: the sql insert single entity command
@@ -499,31 +960,50 @@ def insert_many_to_many_entities(create_single_sql, find_sql, create_relationshi
     :param log_msg: the log message when a relationship is created
     :param log_single_entity: the log message when a entity is created
     :param debug_msg: the debug message when the entity already exists
-    :return:
+    :param cache: DimensionCache in front of find_sql, or None
+    :return: set of the ids of the linked entities
     """
+    linked = set()
     for data_point in data:
-        cursor.execute(find_sql, [data_point])
-        result = cursor.fetchone()
-        if result is None:
-            cursor.execute(create_single_sql, [data_point])
-            coin_logger.info(log_single_entity)
-            data_point_id = cursor.lastrowid
-        else:
-            data_point_id = result[entity_pk_name]
+        data_point_id = None if cache is None else cache.get(data_point)
+        if data_point_id is not None:
             coin_logger.debug(debug_msg)
+        else:
+            cursor.execute(find_sql, [data_point])
+            result = cursor.fetchone()
+            if result is None:
+                try:
+                    cursor.execute(create_single_sql, [data_point])
+                    coin_logger.info(log_single_entity)
+                    data_point_id = cursor.lastrowid
+                except storage.IntegrityError:
+                    # another scraper inserted the same entity after our lookup
+                    data_point_id = bulk_writer.find_existing_id(cursor, find_sql, data_point)
+                    coin_logger.debug(debug_msg)
+            else:
+                data_point_id = result[entity_pk_name]
+                coin_logger.debug(debug_msg)
+            if cache is not None:
+                cache.put(data_point, data_point_id)
+        if data_point_id in linked:  # same entity listed twice (names differ only in case)
+            continue
+        linked.add(data_point_id)
         cursor.execute(create_relationship_sql, [partner_pk, data_point_id])
         coin_logger.info(log_msg)
+    return linked
 
 
-def insert_data(article, conn):
+def insert_data(article, conn, caches=None):
     """
     save article to database
     :param article: article to save
     :param conn: connection object
+    :param caches: dictionary of table name to DimensionCache, or None
     :return: boolean if inserted new data
     """
+    caches = caches or {}
     try:
-        with conn.cursor() as cursor:
+        with metrics.TimedCursor(conn.cursor()) as cursor:
             summary_id = insert_data_to_entity_table(INSERT_INTO_SUMMARIES,
                                                      article.get_summary(), cursor, 'Saved summary to database.')
             article_id = insert_data_to_entity_table(INSERT_INTO_ARTICLES,
@@ -535,51 +1015,109 @@ def insert_data(article, conn):
                                          AUTHOR_ID, article_id, article.get_authors(), cursor,
                                          'Saved author-article relationship to database.',
                                          'Saved author to database.',
-                                         'Author exists already in database.')
+                                         'Author exists already in database.', caches.get(AUTHORS_TABLE))
 
-            insert_many_to_many_entities(INSERT_INTO_TAGS, FIND_TAG, INSERT_INTO_RELATIONSHIP_ARTICLE_TAG,
+            tag_ids = insert_many_to_many_entities(INSERT_INTO_TAGS, FIND_TAG, INSERT_INTO_RELATIONSHIP_ARTICLE_TAG,
                                          TAG_ID, article_id, article.get_tags(), cursor,
                                          'Saved tag-article relationship to database.',
                                          'Saved tag to database.',
-                                         'Tag exists already in database.')
+                                         'Tag exists already in database.', caches.get(TAGS_TABLE))
+            bulk_writer.add_tag_counts(cursor, [(tag_id, article.get_source(), article.get_date_published())
+                                                for tag_id in tag_ids])
 
             insert_many_to_many_entities(INSERT_INTO_CATEGORY, FIND_CATEGORY, INSERT_INTO_RELATIONSHIP_ARTICLE_CATEGORY,
                                          CATEGORY_ID, article_id, article.get_categories(), cursor,
                                          'Saved category-article relationship to database.',
                                          'Saved category to database.',
-                                         'Category exists already in database.')
+                                         'Category exists already in database.', caches.get(CATEGORIES_TABLE))
         return True
-    except pymysql.err.IntegrityError:
+    except storage.IntegrityError:
         coin_logger.warning(f'Duplicate data, will skip this article: {article.get_link()}.')
         return False
 
 
-def select_top_ten_tags(user, password, host, database):
+def enrich_tags(batch_size, user, password, host, database, sink=None, top=TOP_TAGS_COUNT, days=None,
+                num_article=ENRICHMENT_PAGE_SIZE, enrich_days=None, trends=False):
     """
-    Retrieves the ten most popular tags and returns a dataframe.
+    saves articles from other sources about the most popular tags. the tags and their pages are retrieved
+    concurrently, stored articles are skipped as the pages arrive, and a tag stops paging once it reaches them.
+    the articles are saved as they arrive, with a bulk insert per ENRICHMENT_INSERT_BATCH new urls; an article
+    found again by another tag once it was saved only gets that tag (and its daily count) added.
+    the sink gets every article once, with the tags it had when it was saved.
+    :param batch_size: number of articles per commit if a bulk insert falls back to article by article
     :param user: username of mysql
     :param password: password of mysql
     :param host: url of database server
     :param database: database to save to
-    :return: dataframe of 10 most popular tags and their respective tag counts.
+    :param sink: OutputSink to write the articles to, or None
+    :param top: number of tags to enrich
+    :param days: pick the tags by the articles of the last days, None for all of them
+    :param num_article: number of articles per tag
+    :param enrich_days: retrieve only articles of the last days, None for any date
+    :param trends: also store the Google Trends regions of the tags that don't have them yet
+    :return: number of articles saved
     """
-    with pymysql.connect(host=host, user=user, password=password, database=database,
-                         cursorclass=pymysql.cursors.DictCursor) as connection_instance:
-        with connection_instance.cursor() as cursor:
-            cursor.execute(TOP_TEN_TAGS)
-            results = cursor.fetchall()
-            return pd.DataFrame(results)
-
+    df = sql_script.select_top_tags(user, password, host, database, top, days)
+    print('Enriching the tags:', ', '.join(df.tag))
+    from_date = None if enrich_days is None else \
+        (datetime.now() - timedelta(days=enrich_days)).strftime(PUBLISHED_DATE_FORMAT)
+    saved = 0
+    try:
+        with storage.get_storage(host, user, password, database).connection() as connection_instance:
+            known = known_urls.KnownUrls().load(connection_instance)
+            lock = gevent.lock.Semaphore()
+
+            def filter_new(links):
+                with lock:  # the tags share the connection that confirms bloom filter hits
+                    return known.filter_new(links, connection_instance)
+
+            for batch, repeats in enrichment_api.enrich_tags(list(df.tag), num_article, from_date,
+                                                             filter_new=filter_new):
+                if len(batch):
+                    if sink is not None:
+                        sink.write(batch)
+                    saved += insert_batch(batch, batch_size, host, user, password, database)
+                if repeats:
+                    insert_tags(repeats, host, user, password, database)
+        if trends:
+            data_enrichment.enrich_regions(list(df.tag), user, password, host, database)
+    except storage.DatabaseError as err:
+        print(err.args)
+        coin_logger.error(err.args)
+        exit(1)
+    return saved
 
-def enrich_tags(batch_size, user, password, host, database):
-    df = select_top_ten_tags(user, password, host, database)
-    for tag in df.tag:
-        print('Enriching', tag, 'tag:')
-        articles = enrichment_api.enrich_tag(tag)
-        for a in articles:
-            print(a, '\n')
 
-        insert_batch(articles, batch_size, host, user, password, database)
+def scrape_category(category, scrape_by, listing, incremental, pipeline, resume, user, password, host, database,
+                    sink=None):
+    """
+    scrapes a single category, checkpointing the progress so an interrupted run can be resumed
+    :param category: category URL suffix
+    :param scrape_by: dictionary that details how to scrape
+    :param listing: HTTP_LISTING or SELENIUM_LISTING
+    :param incremental: whether to skip articles that are already stored
+    :param pipeline: whether to run fetching, parsing and saving as concurrent stages
+    :param resume: whether to continue the previous run from its checkpoint
+    :param user: username of mysql
+    :param password: password of mysql
+    :param host: url of database server
+    :param database: database to save to
+    :param sink: OutputSink to write the articles to, or None
+    """
+    if resume:
+        state = resume_checkpoint(category, scrape_by)
+    else:
+        links = get_links(category, scrape_by, listing)
+        if incremental:
+            links = filter_stored_links(links, user, password, host, database)
+        state = checkpoint.Checkpoint(CHECKPOINT_FILE, category, scrape_by[SCRAPE_BY_TYPE],
+                                      scrape_by[SCRAPE_BY_PARAMETERS], links, BATCH)
+        state.start()
+    if pipeline:
+        pipelined_scraper(state.links, state.batch_size, scrape_by, user, password, host, database, state, sink=sink)
+    else:
+        scraper(state.links, state.batch_size, scrape_by, user, password, host, database, state, sink=sink)
+    state.remove()
 
 
 def main():
@@ -588,13 +1126,48 @@ def main():
     Scrapes and prints each article for the following data:
         Title, Summary, Author, Link, Tags and Date-Time"""
     before = time.time()
-    category, scrap_by, username, password, host, database, enrich = welcome()
-    html = get_html(URL + category, scrap_by)
-    scraper(html, BATCH, scrap_by, username, password, host, database)
+    categories, scrap_by, username, password, host, database, enrich, pipeline, listing, incremental, resume, \
+        output, output_file, top_tags, top_days, \
+        enrich_articles, enrich_days, trends, metrics_file, prometheus_file, metrics_port = welcome()
+    sink = output_sinks.get_sink(output, output_file)
+    flusher = None if prometheus_file is None else metrics.flush_prometheus(prometheus_file)
+    server = None if metrics_port is None else metrics.serve_prometheus(metrics_port)
+    warm_id_caches(username, password, host, database)
+    if len(categories) > 1:
+        scrape_categories(categories, scrap_by, listing, incremental, pipeline, username, password, host, database,
+                          sink)
+    else:
+        scrape_category(CATEGORY_URLS[categories[0]], scrap_by, listing, incremental, pipeline, resume,
+                        username, password, host, database, sink)
     after = time.time()
+    metrics.observe('run_stage_seconds', after - before, stage='scrape')
     if enrich:
-        enrich_tags(BATCH_SIZE_ENRICH, username, password, host, database)
+        enrich_tags(BATCH_SIZE_ENRICH, username, password, host, database, sink, top_tags, top_days,
+                    enrich_articles, enrich_days, trends)
+        enrichment_api.wait_for_refreshes()
+        metrics.observe('run_stage_seconds', time.time() - after, stage='enrichment')
+    after_enrich = time.time()
+    sink.close()
+    for stats in storage.storage_stats():
+        coin_logger.info(f'Storage connection stats: {stats}')
+    for stats in dimension_cache.cache_stats():
+        coin_logger.info(f'Dimension id cache stats: {stats}')
+    for host, stats in http_client.get_client().host_stats().items():
+        coin_logger.info(f'HTTP stats for {host}: {stats}')
+    storage.close_storages()
+    if flusher is not None:
+        flusher.kill()
+        metrics.write_prometheus(prometheus_file)
+    if server is not None:
+        server.stop()
+    if metrics_file is not None:
+        metrics.write_report(metrics_file)
     print(f"\nScraping took {round(after - before, 3)} seconds.")
+    if enrich:
+        print(f"Enrichment took {round(after_enrich - after, 3)} seconds.")
+        print(f"The whole run took {round(after_enrich - before, 3)} seconds.")
+    if metrics_file is not None:
+        print(f"The time of every stage is in {metrics_file}.")
 
 
 if __name__ == '__main__':
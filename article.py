@@ -0,0 +1,253 @@
+import sys
+import textwrap as tw
+from tabulate import tabulate
+
+
+def intern_value(value):
+    """
+    interns a string that repeats across many articles (like the source), so every article points at one
+    shared copy instead of keeping its own
+    :param value: string, or None when the field is missing
+    :return: the interned string, or the value as it is if it isn't a string
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def intern_all(values):
+    """
+    interns strings that repeat across many articles (authors, tags, categories)
+    :param values: iterable of strings
+    :return: tuple of interned strings
+    """
+    return tuple(intern_value(value) for value in values)
+
+
+class Article:
+    """
+        A class to represent an article.
+
+        Attributes
+        ----------
+        article_num : int
+            Number of article instances created (class counter).
+        number: int
+            Number of this article.
+        title: str
+            Article title.
+        summary: str
+            Article summary.
+        author: str or list of strings
+            Article author(s).
+        link: str
+            Link to article webpage (url).
+        tags: list of str
+            Article hashtags.
+        date_published: datetime
+            Date and time article was published.
+        categories: (str)
+            Categories article falls under.
+        source: str
+            Source the article came from.
+
+
+        Methods
+        -------
+        get_article_num():
+            Returns article number of instance created.
+
+        get_title(self):
+            Returns article title
+
+        get_summary(self):
+            Returns article summary
+
+        get_link(self):
+            Returns URL to article page
+
+        get_tags(self):
+            Returns article tags
+
+        get_date_published(self):
+            Returns date and time article was published
+
+        get_categories(self):
+            Returns article category
+
+        get_authors(self):
+            Returns article author(s)
+        """
+    __slots__ = ('number', 'title', 'summary', 'author', 'link', 'tags', 'date_published', 'categories', 'source')
+    article_num = 0
+
+    def __init__(self, title, summary, author, link, tags, date_published, categories, source, number=None):
+        """
+        Constructs all necessary attributes of the article object.
+        :param number: number of an article that was already counted, None to count a new one
+        """
+        if number is None:
+            Article.article_num += 1
+            number = Article.article_num
+        self.number = number
+        self.title = title
+        self.summary = summary
+        self.author = author
+        self.link = link
+        self.tags = tags
+        self.date_published = date_published
+        self.categories = categories
+        self.source = source
+
+    def __str__(self):
+        """
+        Constructs a table when print is called on the article.
+        :return: table
+        """
+        return tabulate(tabular_data=[
+            ['Title', self.title],
+            ['Summary', '\n'.join(tw.wrap(self.summary, width=90))],
+            ['Author', ', '.join(self.author)],
+            ['Source', self.source],
+            ['Categories', ', '.join(self.categories)],
+            ['Link', self.link],
+            ['Tags', ', '.join(self.tags)],
+            ['Date/Time Published', self.date_published]
+        ],
+            headers=['#', self.number],
+            tablefmt='plain')
+
+    def get_article_num(self):
+        """:return: article number (int)"""
+        return self.number
+
+    def get_title(self):
+        """:return: article title (str)"""
+        return self.title
+
+    def get_summary(self):
+        """:return: article summary"""
+        return self.summary
+
+    def get_link(self):
+        """:return: url (str) to article webpage"""
+        return self.link
+
+    def get_tags(self):
+        """:return: article tags (list)"""
+        return self.tags
+
+    def get_date_published(self):
+        """:return: date and time article was published."""
+        return self.date_published
+
+    def get_categories(self):
+        """:return: the categories the article belongs to"""
+        return self.categories
+
+    def get_authors(self):
+        """:return: the authors that wrote the article"""
+        return self.author
+
+    def get_source(self):
+        """:return: the source that the article came from"""
+        return self.source
+
+
+class ArticleBatch:
+    """
+        A batch of articles stored column by column: one list per field instead of one object per article,
+        with the author, tag and category names interned so repeated names are stored once.
+        Iterating over it yields Article records, for code that works one article at a time.
+
+        Attributes
+        ----------
+        numbers: list of int
+            Article numbers.
+        titles: list of str
+        summaries: list of str
+        authors: list of tuples of str
+        links: list of str
+        tags: list of tuples of str
+        dates_published: list of datetime
+        categories: list of tuples of str
+        sources: list of str
+
+        Methods
+        -------
+        add(title, summary, author, link, tags, date_published, categories, source, number):
+            Adds an article from its fields, without creating an Article.
+
+        append(article):
+            Adds an Article.
+
+        select(indexes):
+            Returns a new batch of the articles at the indexes.
+        """
+    __slots__ = ('numbers', 'titles', 'summaries', 'authors', 'links', 'tags', 'dates_published', 'categories',
+                 'sources')
+
+    def __init__(self):
+        self.numbers = []
+        self.titles = []
+        self.summaries = []
+        self.authors = []
+        self.links = []
+        self.tags = []
+        self.dates_published = []
+        self.categories = []
+        self.sources = []
+
+    @classmethod
+    def from_articles(cls, articles):
+        """
+        :param articles: iterable of Articles, or an ArticleBatch (returned as it is)
+        :return: ArticleBatch
+        """
+        if isinstance(articles, cls):
+            return articles
+        batch = cls()
+        for article in articles:
+            batch.append(article)
+        return batch
+
+    def add(self, title, summary, author, link, tags, date_published, categories, source, number=None):
+        """
+        adds an article from its fields, counting it like a new Article unless number is given
+        """
+        if number is None:
+            Article.article_num += 1
+            number = Article.article_num
+        self.numbers.append(number)
+        self.titles.append(title)
+        self.summaries.append(summary)
+        self.authors.append(intern_all(author))
+        self.links.append(link)
+        self.tags.append(intern_all(tags))
+        self.dates_published.append(date_published)
+        self.categories.append(intern_all(categories))
+        self.sources.append(intern_value(source))
+
+    def append(self, article):
+        """:param article: Article to add"""
+        self.add(article.title, article.summary, article.author, article.link, article.tags, article.date_published,
+                 article.categories, article.source, article.number)
+
+    def select(self, indexes):
+        """
+        :param indexes: positions of the articles to keep, in order
+        :return: new ArticleBatch sharing the field values of this one
+        """
+        batch = ArticleBatch()
+        for column in ArticleBatch.__slots__:
+            values = getattr(self, column)
+            setattr(batch, column, [values[i] for i in indexes])
+        return batch
+
+    def __len__(self):
+        return len(self.links)
+
+    def __getitem__(self, i):
+        return Article(self.titles[i], self.summaries[i], self.authors[i], self.links[i], self.tags[i],
+                       self.dates_published[i], self.categories[i], self.sources[i], self.numbers[i])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
@@ -0,0 +1,92 @@
+"""
+Compares the memory held per article by the old dict backed article objects, the __slots__ Article
+and the columnar ArticleBatch.
+
+    python -m benchmarks.bench_article_memory [-n 100000]
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+from datetime import datetime, timedelta
+from tabulate import tabulate
+from article import Article, ArticleBatch
+
+NUM_TAGS = 300
+NUM_AUTHORS = 100
+CATEGORIES = ['Markets', 'Tech', 'Business', 'Policy', 'People', 'Features', 'Opinion', 'News']
+
+
+class DictArticle:
+    """The article record as it was before __slots__: every instance carries its own attribute dict."""
+
+    def __init__(self, title, summary, author, link, tags, date_published, categories, source):
+        self.article_num = 0
+        self.title = title
+        self.summary = summary
+        self.author = author
+        self.link = link
+        self.tags = tags
+        self.date_published = date_published
+        self.categories = categories
+        self.source = source
+
+
+def article_fields(num_articles):
+    """
+    yields the fields of synthetic articles. every name is built as a new string, the way json decoding
+    gives every article its own copy of a tag name.
+    :param num_articles: number of articles
+    :return: generator of field tuples
+    """
+    rng = random.Random(0)
+    now = datetime.now().replace(microsecond=0)
+    for i in range(num_articles):
+        yield (f'title {i}', f'summary of article {i} ' * 4,
+               [f'author {n}' for n in rng.sample(range(NUM_AUTHORS), rng.randint(1, 2))],
+               f'https://www.coindesk.com/markets/article-{i}/',
+               [f'tag {n}' for n in rng.sample(range(NUM_TAGS), rng.randint(3, 8))],
+               now - timedelta(minutes=i), [rng.choice(CATEGORIES)], 'Coindesk')
+
+
+def measure(build, num_articles):
+    """
+    builds the articles from freshly decoded fields while tracing allocations, so the strings count too:
+    strings that the container interns are freed, the rest stay alive with it
+    :param build: function from an iterable of field tuples to the container holding the articles
+    :param num_articles: number of articles
+    :return: bytes held per article
+    """
+    gc.collect()
+    tracemalloc.start()
+    container = build(article_fields(num_articles))
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del container
+    return held / num_articles
+
+
+def build_batch(fields):
+    batch = ArticleBatch()
+    for title, summary, author, link, tags, date_published, categories, source in fields:
+        batch.add(title, summary, author, link, tags, date_published, categories, source)
+    return batch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--num-articles', help='number of articles', type=int, default=100000)
+    args = parser.parse_args()
+
+    results = []
+    for name, build in (('dict article objects', lambda fields: [DictArticle(*f) for f in fields]),
+                        ('__slots__ Article', lambda fields: [Article(*f) for f in fields]),
+                        ('ArticleBatch', build_batch)):
+        results.append([name, round(measure(build, args.num_articles))])
+    print(tabulate(results, headers=['container', 'bytes/article']))
+    print(f'{args.num_articles} articles')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Compares the per-article insert path (insert_data) with the set based bulk writer.
+Needs a MySQL server, the benchmark database is dropped and recreated for every run.
+
+    python -m benchmarks.bench_bulk_insert -p PASSWORD [-n 1000] [-b 10]
+"""
+import argparse
+import random
+import time
+import pymysql
+import bulk_writer
+import db_pool
+import sql_script
+from datetime import datetime, timedelta
+from tabulate import tabulate
+from article import Article
+from Coindesk_Scraper import insert_batch_by_article
+from config import *
+
+BENCH_DATABASE = 'coindesk_bench'
+NUM_TAGS = 300
+NUM_AUTHORS = 100
+
+
+def make_articles(num_articles):
+    """
+    creates synthetic articles that share a few hundred tags and authors, like a real scrape
+    :param num_articles: number of articles
+    :return: list of articles
+    """
+    rng = random.Random(0)
+    tags = [f'tag {i}' for i in range(NUM_TAGS)]
+    authors = [f'author {i}' for i in range(NUM_AUTHORS)]
+    categories = ['Markets', 'Tech', 'Business', 'Policy', 'People', 'Features', 'Opinion', 'News']
+    now = datetime.now().replace(microsecond=0)
+    return [Article(f'title {i}', f'summary {i}', rng.sample(authors, rng.randint(1, 2)), f'{URL}/bench/{i}',
+                    rng.sample(tags, rng.randint(3, 8)), now - timedelta(minutes=i), [rng.choice(categories)],
+                    'Coindesk')
+            for i in range(num_articles)]
+
+
+class StatementCounter:
+    """Counts the statements sent to the server by patching pymysql's cursor."""
+
+    def __init__(self):
+        self.count = 0
+        self._execute = pymysql.cursors.Cursor.execute
+
+    def __enter__(self):
+        counter = self
+
+        def execute(cursor, query, args=None):
+            counter.count += 1
+            return counter._execute(cursor, query, args)
+        pymysql.cursors.Cursor.execute = execute
+        return self
+
+    def __exit__(self, *exc):
+        pymysql.cursors.Cursor.execute = self._execute
+
+
+def per_article_path(articles, batch_size, connection_instance):
+    """the previous write path: one article at a time"""
+    for i in range(0, len(articles), batch_size):
+        insert_batch_by_article(articles[i:i + batch_size], batch_size, connection_instance)
+
+
+def bulk_path(articles, batch_size, connection_instance):
+    """the bulk write path: one set of multi-row statements per batch"""
+    for i in range(0, len(articles), batch_size):
+        bulk_writer.insert_articles(articles[i:i + batch_size], connection_instance)
+        connection_instance.commit()
+
+
+def run(path, articles, batch_size, user, password, host):
+    """
+    runs a write path on a fresh database
+    :return: (statements per article, articles per second)
+    """
+    sql_script.reset_database(user, password, host, BENCH_DATABASE)
+    with db_pool.get_pool(host, user, password, BENCH_DATABASE).connection() as connection_instance:
+        with StatementCounter() as counter:
+            before = time.perf_counter()
+            path(articles, batch_size, connection_instance)
+            elapsed = time.perf_counter() - before
+    # the next run drops the database these connections are using
+    db_pool.close_pools()
+    return counter.count / len(articles), len(articles) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-u', '--username', help='username of mysql', default=USER)
+    parser.add_argument('-p', '--password', help='password of mysql', required=True)
+    parser.add_argument('-host', help='url of database server', default=HOST)
+    parser.add_argument('-n', '--num', help='number of articles', type=int, default=1000)
+    parser.add_argument('-b', '--batch', help='batch size', type=int, default=BATCH)
+    args = parser.parse_args()
+
+    articles = make_articles(args.num)
+    results = []
+    for name, path in (('insert_data (per article)', per_article_path), ('bulk_writer', bulk_path)):
+        statements, rate = run(path, articles, args.batch, args.username, args.password, args.host)
+        results.append([name, round(statements, 2), round(rate, 1)])
+    sql_script.drop_database(args.username, args.password, args.host, BENCH_DATABASE)
+    print(tabulate(results, headers=['path', 'statements/article', 'articles/sec']))
+
+
+if __name__ == '__main__':
+    main()
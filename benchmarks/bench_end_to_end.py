@@ -0,0 +1,247 @@
+"""
+End to end benchmarks of the scraper against the local stand-in server, so they need neither coindesk.com,
+NewsAPI nor a MySQL server: scrape_main, scrape_articles, insert_batch (into an SQLite file) and enrich_tags.
+Every benchmark runs in its own process and reports articles/sec, the p50 and p99 latency of its operations
+(a page, a batch or an enrichment run) and the peak RSS of its process.
+
+The results are compared with a baseline recorded on the same machine (benchmarks/baseline-<host>.json, made
+with --save-baseline), and the run fails if the throughput, p50 or peak RSS got worse by more than the
+tolerance. The p99 is reported but doesn't fail the run, it's too noisy for a gate. A baseline of another
+machine is compared without failing; benchmarks/baseline.json is such an example, not a gate.
+
+    python -m benchmarks.bench_end_to_end [-n 600] [--latency 20] [--jitter 5] [--error-rate 0]
+                                          [--baseline benchmarks/baseline-<host>.json] [--save-baseline]
+
+insert_batch saves the articles that enrich_tags then picks its top tags from, so they run in this order.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from tabulate import tabulate
+import Coindesk_Scraper
+import enrichment_api
+import http_client
+import sql_script
+import storage
+from benchmarks import stand_in_server
+from config import *
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), f'baseline-{platform.node()}.json')
+BENCH_DATABASE = 'bench.db'
+# lower is worse for these metrics, higher is worse for the others
+HIGHER_IS_BETTER = {'articles_per_sec'}
+# the metrics that fail the run when they regress, the others are only reported
+GATED_METRICS = {'articles_per_sec', 'p50_ms', 'peak_rss_mb'}
+# latency changes smaller than this are scheduler noise, not regressions
+LATENCY_NOISE_MS = 5
+
+
+def article_links(base_url, num_articles):
+    """:return: urls of the first articles of the stand-in listing"""
+    return [f'{base_url}markets/article-{i}/' for i in range(num_articles)]
+
+
+def scraped_batches(base_url, num_articles):
+    """:return: list of ArticleBatches scraped from the stand-in, BATCH articles each"""
+    return [Coindesk_Scraper.take_articles(Coindesk_Scraper.scrape_articles(links), {SCRAPE_BY_TYPE: None})[0]
+            for links in Coindesk_Scraper.split_list(article_links(base_url, num_articles), BATCH)]
+
+
+def bench_scrape_main(base_url, work_dir, args):
+    """downloads the main page and collects its article urls"""
+    Coindesk_Scraper.URL = base_url.rstrip('/')
+    links = 0
+    latencies = []
+    for _ in range(args.repeat):
+        before = time.perf_counter()
+        response = http_client.get_client().get(base_url)
+        links += len(Coindesk_Scraper.scrape_main(response.text))
+        latencies.append(time.perf_counter() - before)
+    return links, latencies
+
+
+def bench_scrape_articles(base_url, work_dir, args):
+    """downloads and parses the article pages, a batch at a time"""
+    articles = 0
+    latencies = []
+    for links in Coindesk_Scraper.split_list(article_links(base_url, args.num), BATCH):
+        before = time.perf_counter()
+        articles += sum(1 for _ in Coindesk_Scraper.scrape_articles(links))
+        latencies.append(time.perf_counter() - before)
+    return articles, latencies
+
+
+def bench_insert_batch(base_url, work_dir, args):
+    """saves the scraped articles a batch at a time (the scraping isn't timed)"""
+    storage.select_backend(SQLITE_STORAGE)
+    database = os.path.join(work_dir, BENCH_DATABASE)
+    sql_script.initialize_database(USER, None, HOST, database)
+    articles = 0
+    latencies = []
+    for batch in scraped_batches(base_url, args.num):
+        before = time.perf_counter()
+        articles += Coindesk_Scraper.insert_batch(batch, BATCH, HOST, USER, None, database)
+        latencies.append(time.perf_counter() - before)
+    storage.close_storages()
+    return articles, latencies
+
+
+def bench_enrich_tags(base_url, work_dir, args):
+    """enriches the top tags of the saved articles, every run on a fresh copy of the database and cache"""
+    storage.select_backend(SQLITE_STORAGE)
+    enrichment_api.NEWSAPI_URL = base_url + stand_in_server.NEWSAPI_PATH.lstrip('/')
+    enrichment_api.get_limiter().rate = args.newsapi_rate
+    articles = 0
+    latencies = []
+    for run in range(args.enrich_repeat):
+        database = os.path.join(work_dir, f'enrich_{run}.db')
+        shutil.copy(os.path.join(work_dir, BENCH_DATABASE), database)
+        enrichment_api.ENRICHMENT_CACHE_DIR = os.path.join(work_dir, f'newsapi_cache_{run}')
+        enrichment_api._caches.clear()
+        before = time.perf_counter()
+        articles += Coindesk_Scraper.enrich_tags(BATCH_SIZE_ENRICH, USER, None, HOST, database,
+                                                 num_article=args.enrich_articles)
+        latencies.append(time.perf_counter() - before)
+    storage.close_storages()
+    return articles, latencies
+
+
+BENCHMARKS = [('scrape_main', bench_scrape_main), ('scrape_articles', bench_scrape_articles),
+              ('insert_batch', bench_insert_batch), ('enrich_tags', bench_enrich_tags)]
+
+
+def percentile(values, fraction):
+    """:return: the value below which the fraction of the values are (nearest rank)"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def run_benchmark(benchmark, base_url, work_dir, args, connection):
+    """
+    runs a benchmark in this (forked) process and sends its results through the pipe. the throughput is over
+    the timed operations only, so the preparation of a benchmark (like scraping the articles to save) isn't in it
+    """
+    articles, latencies = benchmark(base_url, work_dir, args)
+    connection.send({'articles': articles, 'articles_per_sec': round(articles / sum(latencies), 1),
+                     'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+                     'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+                     'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)})
+
+
+def run_benchmarks(args):
+    """
+    starts the stand-in server and runs every benchmark in a process of its own, so each peak RSS is its own
+    :return: dictionary of benchmark name to its results
+    """
+    server, base_url = stand_in_server.start(args.latency / 1000, args.jitter / 1000, args.error_rate)
+    work_dir = tempfile.mkdtemp(prefix='coindesk-bench-')
+    context = multiprocessing.get_context('fork')
+    results = {}
+    try:
+        for name, benchmark in BENCHMARKS:
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=run_benchmark, args=(benchmark, base_url, work_dir, args, sender))
+            process.start()
+            results[name] = receiver.recv()
+            process.join()
+    finally:
+        server.kill()
+        shutil.rmtree(work_dir)
+    return results
+
+
+def settings(args):
+    """:return: the arguments that change the results, saved with the baseline"""
+    return {'num': args.num, 'repeat': args.repeat, 'enrich_repeat': args.enrich_repeat,
+            'enrich_articles': args.enrich_articles, 'latency': args.latency, 'jitter': args.jitter,
+            'error_rate': args.error_rate}
+
+
+def machine():
+    """:return: what the results depend on besides the settings, saved with the baseline"""
+    return {'node': platform.node(), 'machine': platform.machine(), 'processor': platform.processor(),
+            'cpus': os.cpu_count(), 'python': platform.python_version()}
+
+
+def compare(results, baseline, tolerance):
+    """
+    :param results: dictionary of benchmark name to its results
+    :param baseline: dictionary of benchmark name to its baseline results
+    :param tolerance: fraction a metric may get worse before it's a regression
+    :return: table rows, list of regressions of the GATED_METRICS
+    """
+    rows = []
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            if metric == 'articles' or name not in baseline or metric not in baseline[name]:
+                continue
+            base = baseline[name][metric]
+            change = (value - base) / base if base else 0.0
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            regressed = worse > tolerance and not (metric.endswith('_ms') and value - base < LATENCY_NOISE_MS)
+            gated = metric in GATED_METRICS
+            rows.append([name, metric, base, value, f'{change:+.1%}',
+                         ('REGRESSION' if gated else 'worse, not gated') if regressed else ''])
+            if regressed and gated:
+                regressions.append(f'{name} {metric}: {base} -> {value}')
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--num', help='number of articles to scrape and save', type=int, default=600)
+    parser.add_argument('-r', '--repeat', help='times to read the main page', type=int, default=20)
+    parser.add_argument('--enrich-repeat', help='number of enrichment runs', type=int, default=3)
+    parser.add_argument('--enrich-articles', help='articles per tag in the enrichment', type=int, default=200)
+    parser.add_argument('--newsapi-rate', help='NewsAPI requests per second of the rate limiter', type=float,
+                        default=1000)
+    parser.add_argument('--latency', help='milliseconds the stand-in delays every response', type=float, default=20)
+    parser.add_argument('--jitter', help='milliseconds of random variation of the delay', type=float, default=5)
+    parser.add_argument('--error-rate', help='fraction of the requests answered with 503', type=float, default=0)
+    parser.add_argument('--baseline', help='baseline results of this machine to compare with', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', help='save the results as the new baseline', action='store_true')
+    parser.add_argument('--tolerance', help='fraction a metric may get worse before the run fails', type=float,
+                        default=0.2)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    print(tabulate([[name] + [metrics[column] for column in ('articles', 'articles_per_sec', 'p50_ms', 'p99_ms',
+                                                                  'peak_rss_mb')]
+                    for name, metrics in results.items()],
+                   headers=['benchmark', 'articles', 'articles/sec', 'p50 ms', 'p99 ms', 'peak RSS MiB']))
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump({'settings': settings(args), 'machine': machine(), 'results': results}, baseline_file,
+                      indent=2)
+        print(f'\nSaved the baseline to {args.baseline}.')
+        return
+    if not os.path.exists(args.baseline):
+        print(f'\nNo baseline of this machine at {args.baseline}, record one with --save-baseline.')
+        return
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline['settings'] != settings(args):
+        print(f'\nThe baseline was measured with other settings: {baseline["settings"]}')
+    same_machine = baseline.get('machine') == machine()
+    if not same_machine:
+        print(f'\nThe baseline was measured on another machine ({baseline.get("machine")}), '
+              f'so regressions are only reported.')
+    rows, regressions = compare(results, baseline['results'], args.tolerance)
+    print()
+    print(tabulate(rows, headers=['benchmark', 'metric', 'baseline', 'now', 'change', '']))
+    if regressions and same_machine:
+        print(f'\n{len(regressions)} regressions beyond {args.tolerance:.0%}:', *regressions, sep='\n')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
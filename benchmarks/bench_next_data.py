@@ -0,0 +1,64 @@
+"""
+Compares the byte scanning __NEXT_DATA__ extractor with the full BeautifulSoup parse over saved pages.
+
+    python -m benchmarks.bench_next_data PAGES_DIR [-r 5]
+"""
+import argparse
+import os
+import time
+import tracemalloc
+from tabulate import tabulate
+from next_data import scan_next_data, soup_next_data
+
+
+def load_pages(pages_dir):
+    """
+    :param pages_dir: directory of saved html pages
+    :return: list of page contents (bytes)
+    """
+    pages = []
+    for name in sorted(os.listdir(pages_dir)):
+        if name.endswith('.html'):
+            with open(os.path.join(pages_dir, name), 'rb') as page:
+                pages.append(page.read())
+    return pages
+
+
+def measure(extractor, pages, repeat):
+    """
+    :return: (pages per second, peak memory in KiB while extracting one page)
+    """
+    before = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            extractor(page)
+    rate = len(pages) * repeat / (time.perf_counter() - before)
+    peak = 0
+    for page in pages:
+        tracemalloc.start()
+        extractor(page)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return rate, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('pages_dir', help='directory of saved article or listing pages (*.html)')
+    parser.add_argument('-r', '--repeat', help='times to go over the pages', type=int, default=5)
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages_dir)
+    if not pages:
+        parser.error(f'no .html pages in {args.pages_dir}')
+    mismatches = sum(scan_next_data(page) != soup_next_data(page) for page in pages)
+    results = []
+    for name, extractor in (('BeautifulSoup', soup_next_data), ('byte scan', scan_next_data)):
+        rate, peak = measure(extractor, pages, args.repeat)
+        results.append([name, round(rate, 1), round(peak, 1)])
+    print(tabulate(results, headers=['extractor', 'pages/sec', 'peak KiB/page']))
+    print(f'{len(pages)} pages, {mismatches} where the extractors disagree')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+A local stand-in for coindesk.com and NewsAPI that serves the saved corpus, for benchmarks that shouldn't
+hit the real sites. Every request can be delayed and can fail with a 503, to see how the scraper behaves
+on a slow or flaky network.
+
+    python -m benchmarks.stand_in_server [--port 0] [--latency 50] [--jitter 10] [--error-rate 0.01]
+
+The corpus pages are templates: @ID@, @DATE@ and @TITLE@ (and @IDn@, @DATEn@ for the n-th article of a
+listing page) are filled in per request, so every url is a different article. It prints the port it
+listens on as its first line.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+ARTICLES_PER_PAGE = 12
+NEWEST_DATE = datetime(2021, 7, 28, 12)
+HOURS_BETWEEN_ARTICLES = 2
+NEWSAPI_PATH = '/v2/everything'
+
+
+def load_corpus(corpus_dir=CORPUS_DIR):
+    """
+    :param corpus_dir: directory of the saved pages
+    :return: dictionary of kind (article, listing, main_page, newsapi) to the list of its templates
+    """
+    corpus = {}
+    for name in sorted(os.listdir(corpus_dir)):
+        kind = os.path.splitext(name)[0].rstrip('0123456789').rstrip('_')
+        with open(os.path.join(corpus_dir, name), encoding='utf-8') as page:
+            corpus.setdefault(kind, []).append(page.read())
+    return corpus
+
+
+def article_date(article_id):
+    """:return: publication date of the article, older for higher ids"""
+    return (NEWEST_DATE - timedelta(hours=article_id * HOURS_BETWEEN_ARTICLES)).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def fill_listing(template, category, first_id):
+    """fills a listing page template with the articles from first_id on"""
+    for i in reversed(range(ARTICLES_PER_PAGE)):
+        template = template.replace(f'@ID{i}@', f'article-{first_id + i}').replace(f'@DATE{i}@',
+                                                                                article_date(first_id + i))
+    return template.replace('@CATEGORY@', category)
+
+
+def fill_newsapi(template, query, page, total_results):
+    """fills a NewsAPI response template for a query and page, so every query returns its own urls"""
+    response = json.loads(template.replace('@Q@', query).replace('@PAGE@', str(page)))
+    response['totalResults'] = total_results
+    for article in response['articles']:
+        article['description'] = f'{query} {page} {article["url"]} {article["description"]}'
+    return json.dumps(response)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+        Serves the corpus: listing pages of any category path (like /markets/?page=N or /category/tech/?page=N),
+        article pages, the main page and NewsAPI responses.
+        """
+    corpus = {}
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    newsapi_results = 300
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        delay = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        if delay:
+            time.sleep(delay)
+        if random.random() < self.error_rate:
+            self.send_error(503)
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        if url.path == NEWSAPI_PATH:
+            page = int(query.get('page', ['1'])[0])
+            templates = self.corpus['newsapi']
+            self.reply(fill_newsapi(templates[page % len(templates)], query.get('q', [''])[0], page,
+                                    self.newsapi_results), 'application/json')
+        elif not parts:
+            page = self.corpus['main_page'][0]
+            for i in reversed(range(page.count('href="/@ID'))):
+                page = page.replace(f'@ID{i}@', f'article-{i}')
+            self.reply(page)
+        elif 'page' in query and not parts[-1].startswith('article-'):
+            page = int(query['page'][0])
+            templates = self.corpus['listing']
+            self.reply(fill_listing(templates[page % len(templates)], '/'.join(parts),
+                                    (page - 1) * ARTICLES_PER_PAGE))
+        elif parts[-1].startswith('article-'):
+            article_id = int(parts[-1][len('article-'):])
+            templates = self.corpus['article']
+            self.reply(templates[article_id % len(templates)].replace('@ID@', str(article_id))
+                       .replace('@TITLE@', f'Article {article_id}').replace('@DATE@', article_date(article_id)))
+        else:
+            self.send_error(404)
+
+    def reply(self, body, content_type='text/html'):
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """A threaded server with a listen backlog for all the scraper's concurrent connections."""
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def start(latency=0.0, jitter=0.0, error_rate=0.0):
+    """
+    starts the stand-in server in its own process, so it doesn't compete with the scraper for the interpreter
+    :param latency: seconds to delay every response
+    :param jitter: seconds of random variation of the delay
+    :param error_rate: fraction of the requests answered with 503
+    :return: the server process and its base url (ending with /)
+    """
+    process = subprocess.Popen([sys.executable, '-m', 'benchmarks.stand_in_server', '--latency', str(latency * 1000),
+                                '--jitter', str(jitter * 1000), '--error-rate', str(error_rate)],
+                               stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               text=True)
+    port = int(process.stdout.readline())
+    return process, f'http://127.0.0.1:{port}/'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', help='port to listen on (0 picks a free one)', type=int, default=0)
+    parser.add_argument('--latency', help='milliseconds to delay every response', type=float, default=0)
+    parser.add_argument('--jitter', help='milliseconds of random variation of the delay', type=float, default=0)
+    parser.add_argument('--error-rate', help='fraction of the requests answered with 503', type=float, default=0)
+    parser.add_argument('--newsapi-results', help='totalResults of every NewsAPI query', type=int, default=300)
+    args = parser.parse_args()
+    StandInHandler.corpus = load_corpus()
+    StandInHandler.latency = args.latency / 1000
+    StandInHandler.jitter = args.jitter / 1000
+    StandInHandler.error_rate = args.error_rate
+    StandInHandler.newsapi_results = args.newsapi_results
+    server = StandInServer(('127.0.0.1', args.port), StandInHandler)
+    print(server.server_address[1], flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
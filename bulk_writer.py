@@ -0,0 +1,271 @@
+import metrics
+import storage
+from collections import Counter
+from article import ArticleBatch
+from config import *
+from dimension_cache import name_key
+
+
+def unique_values(values):
+    """
+    removes duplicates (as MySQL sees them) while keeping the order
+    :param values: iterable of strings
+    :return: list of strings
+    """
+    seen = set()
+    result = []
+    for value in values:
+        if name_key(value) not in seen:
+            seen.add(name_key(value))
+            result.append(value)
+    return result
+
+
+def fetch_ids(cursor, find_sql, values):
+    """
+    looks up the ids of many values with one query per BULK_LOOKUP_CHUNK values
+    :param cursor: the cursor object
+    :param find_sql: select command returning id and name columns, with {} in place of the IN list
+    :param values: list of strings
+    :return: dictionary of normalized value to id
+    """
+    ids = {}
+    for i in range(0, len(values), BULK_LOOKUP_CHUNK):
+        chunk = values[i:i + BULK_LOOKUP_CHUNK]
+        cursor.execute(find_sql.format(', '.join(['%s'] * len(chunk))), chunk)
+        for row in cursor.fetchall():
+            ids[name_key(row['name'])] = row['id']
+    return ids
+
+
+def resolve_ids(cursor, find_sql, insert_sql, single_find_sql, values, log_msg, cache=None):
+    """
+    returns the ids of all the values, inserting the ones that don't exist yet with one multi-row insert.
+    names found in the cache skip the lookup, and the ones resolved here are added to it.
+    :param cursor: the cursor object
+    :param find_sql: select command returning id and name columns, with {} in place of the IN list
+    :param insert_sql: the sql insert single entity command
+    :param single_find_sql: select command for a single entity
+    :param values: list of strings
+    :param log_msg: the log message when entities are created
+    :param cache: DimensionCache of the table, or None
+    :return: dictionary of normalized value to id
+    """
+    ids = {}
+    uncached = []
+    for value in unique_values(values):
+        entity_id = None if cache is None else cache.get(value)
+        if entity_id is None:
+            uncached.append(value)
+        else:
+            ids[name_key(value)] = entity_id
+    if not uncached:
+        return ids
+    ids.update(fetch_ids(cursor, find_sql, uncached))
+    missing = [value for value in uncached if name_key(value) not in ids]
+    if missing:
+        try:
+            cursor.executemany(insert_sql, [[value] for value in missing])
+        except storage.IntegrityError:
+            # another scraper inserted some of these names after our lookup
+            coin_logger.info('Entity was inserted concurrently, resolving the batch one by one.')
+            for value in missing:
+                ids[name_key(value)] = insert_or_find(cursor, insert_sql, single_find_sql, value)
+        else:
+            ids.update(fetch_ids(cursor, find_sql, missing))
+        coin_logger.info(log_msg.format(len(missing)))
+    if cache is not None:
+        for value in uncached:
+            if name_key(value) in ids:
+                cache.put(value, ids[name_key(value)])
+    return ids
+
+
+def insert_or_find(cursor, insert_sql, single_find_sql, value):
+    """
+    inserts a single entity, or finds its id if it already exists (because of a unique key conflict)
+    :param cursor: the cursor object
+    :param insert_sql: the sql insert single entity command
+    :param single_find_sql: select command for a single entity
+    :param value: string
+    :return: id
+    """
+    try:
+        cursor.execute(insert_sql, [value])
+        return cursor.lastrowid
+    except storage.IntegrityError:
+        return find_existing_id(cursor, single_find_sql, value)
+
+
+def find_existing_id(cursor, single_find_sql, value):
+    """
+    reads the id of a row that the database reported as existing. it's a locking read on MySQL, so it sees
+    a row another scraper committed after the snapshot of our transaction was taken
+    :param cursor: the cursor object
+    :param single_find_sql: select command for a single entity
+    :param value: string
+    :return: id
+    """
+    cursor.execute(single_find_sql + LOCKING_READ[storage.dialect_of(cursor.connection)], [value])
+    result = cursor.fetchone()
+    if result is None:
+        raise storage.RowNotFoundError(f'{value!r} conflicted with a stored row, but the row could not be read.')
+    return result['id']
+
+
+def lookup_id(cursor, ids, single_find_sql, value):
+    """
+    gets the id of a value from the resolved ids, falling back to a single row lookup when the
+    database collation matched the value differently than name_key does
+    :param cursor: the cursor object
+    :param ids: dictionary of normalized value to id
+    :param single_find_sql: select command for a single entity
+    :param value: string
+    :return: id
+    """
+    if name_key(value) not in ids:
+        ids[name_key(value)] = find_existing_id(cursor, single_find_sql, value)
+    return ids[name_key(value)]
+
+
+def filter_new_articles(batch, cursor):
+    """
+    drops the articles that are already stored, or that repeat a url or summary inside the batch,
+    before anything is written, so duplicates don't leave orphan summaries behind
+    :param batch: ArticleBatch
+    :param cursor: the cursor object
+    :return: ArticleBatch of the articles to insert
+    """
+    links = unique_values(batch.links)
+    summaries = unique_values([summary for summary in batch.summaries if summary is not None])
+    stored_links = fetch_ids(cursor, FIND_ARTICLES_BY_URL, links) if links else {}
+    stored_summaries = fetch_ids(cursor, FIND_SUMMARIES, summaries) if summaries else {}
+    seen_links = set()
+    seen_summaries = set()
+    new_indexes = []
+    for i, (link, summary) in enumerate(zip(batch.links, batch.summaries)):
+        link_key = name_key(link)
+        summary_key = None if summary is None else name_key(summary)
+        if link_key in stored_links or link_key in seen_links or \
+                summary_key in stored_summaries or summary_key in seen_summaries:
+            coin_logger.warning(f'Duplicate data, will skip this article: {link}.')
+            continue
+        seen_links.add(link_key)
+        if summary_key is not None:
+            seen_summaries.add(summary_key)
+        new_indexes.append(i)
+    return batch if len(new_indexes) == len(batch) else batch.select(new_indexes)
+
+
+def insert_relationships(cursor, insert_sql, pairs, log_msg):
+    """
+    saves relationship rows with one multi-row insert
+    :param cursor: the cursor object
+    :param insert_sql: the sql insert relationship command
+    :param pairs: list of (article id, entity id)
+    :param log_msg: the log message when relationships are created
+    """
+    pairs = list(dict.fromkeys(pairs))
+    if pairs:
+        cursor.executemany(insert_sql, pairs)
+        coin_logger.info(log_msg.format(len(pairs)))
+
+
+def add_tag_counts(cursor, rows):
+    """
+    adds the tagged articles to the daily tag counts, in the transaction of the articles themselves
+    :param cursor: the cursor object
+    :param rows: iterable of (tag id, source, publication date) - one per tag of a newly saved article
+    """
+    counts = Counter((tag_id, source or '', date_published.date())
+                     for tag_id, source, date_published in rows if date_published is not None)
+    if counts:
+        cursor.executemany(ADD_TAG_COUNTS[storage.dialect_of(cursor.connection)],
+                           [[tag_id, source, day, count] for (tag_id, source, day), count in counts.items()])
+
+
+def insert_article_tags(articles, conn, caches=None):
+    """
+    adds tags to articles that are already stored, and to their daily tag counts, in one transaction.
+    articles that aren't stored (like ones skipped as duplicates) and tags an article already has are left out.
+    the caller is responsible for committing, and for committing or rolling back the caches with it.
+    :param articles: list of Articles, with only the tags to add
+    :param conn: connection object
+    :param caches: dictionary of table name to DimensionCache, or None
+    :return: number of relationships added
+    """
+    with metrics.TimedCursor(conn.cursor()) as cursor:
+        article_ids = fetch_ids(cursor, FIND_ARTICLES_BY_URL, unique_values(article.get_link() for article in articles))
+        articles = [article for article in articles if name_key(article.get_link()) in article_ids]
+        ids = resolve_ids(cursor, FIND_TAGS, INSERT_INTO_TAGS, FIND_TAG,
+                          [tag for article in articles for tag in article.get_tags()], 'Saved {} tag rows to database.',
+                          None if caches is None else caches[TAGS_TABLE])
+        rows = {(article_ids[name_key(article.get_link())], lookup_id(cursor, ids, FIND_TAG, tag)):
+                (article.get_source(), article.get_date_published())
+                for article in articles for tag in article.get_tags()}
+        stored = list(dict.fromkeys(article_id for article_id, tag_id in rows))
+        for i in range(0, len(stored), BULK_LOOKUP_CHUNK):
+            chunk = stored[i:i + BULK_LOOKUP_CHUNK]
+            cursor.execute(FIND_ARTICLE_TAGS.format(', '.join(['%s'] * len(chunk))), chunk)
+            for row in cursor.fetchall():
+                rows.pop((row['article_id'], row['tag_id']), None)
+        rows = list(rows.items())
+        insert_relationships(cursor, INSERT_INTO_RELATIONSHIP_ARTICLE_TAG, [pair for pair, published in rows],
+                             'Saved {} tag-article relationships to database.')
+        add_tag_counts(cursor, [(tag_id, *published) for (article_id, tag_id), published in rows])
+    return len(rows)
+
+
+def insert_articles(articles, conn, caches=None):
+    """
+    saves a whole batch of articles with a handful of multi-row statements: the batch is checked for
+    stored urls and summaries, then summaries, articles, authors, tags, categories and the three
+    relationship tables are each written with one executemany, and ids are resolved with one query per table.
+    the daily tag counts are updated in the same transaction.
+    the caller is responsible for committing, and for committing or rolling back the caches with it.
+    :param articles: ArticleBatch (a list of articles is converted to one)
+    :param conn: connection object
+    :param caches: dictionary of table name to DimensionCache, or None
+    :return: number of articles inserted
+    """
+    batch = ArticleBatch.from_articles(articles)
+    with metrics.TimedCursor(conn.cursor()) as cursor:
+        batch = filter_new_articles(batch, cursor)
+        if not len(batch):
+            return 0
+
+        summaries = [summary for summary in batch.summaries if summary is not None]
+        cursor.executemany(INSERT_INTO_SUMMARIES, [[summary] for summary in summaries])
+        summary_ids = fetch_ids(cursor, FIND_SUMMARIES, summaries)
+        article_rows = []
+        for title, summary, date_published, link, source in zip(batch.titles, batch.summaries, batch.dates_published,
+                                                                batch.links, batch.sources):
+            if summary is None:
+                cursor.execute(INSERT_INTO_SUMMARIES, [None])
+                summary_id = cursor.lastrowid
+            else:
+                summary_id = lookup_id(cursor, summary_ids, FIND_SUMMARIES.format('%s'), summary)
+            article_rows.append([title, summary_id, date_published, link, source])
+        coin_logger.info(f'Saved {len(article_rows)} summaries to database.')
+        cursor.executemany(INSERT_INTO_ARTICLES, article_rows)
+        coin_logger.info(f'Saved {len(article_rows)} articles to database.')
+        article_ids = fetch_ids(cursor, FIND_ARTICLES_BY_URL, batch.links)
+        article_ids = [lookup_id(cursor, article_ids, FIND_ARTICLES_BY_URL.format('%s'), link) for link in batch.links]
+
+        for table, find_sql, single_find_sql, insert_sql, relationship_sql, column, name in (
+                (AUTHORS_TABLE, FIND_AUTHORS, FIND_AUTHOR, INSERT_INTO_AUTHORS, INSERT_INTO_RELATIONSHIP_ARTICLE_AUTHOR,
+                 batch.authors, 'author'),
+                (TAGS_TABLE, FIND_TAGS, FIND_TAG, INSERT_INTO_TAGS, INSERT_INTO_RELATIONSHIP_ARTICLE_TAG,
+                 batch.tags, 'tag'),
+                (CATEGORIES_TABLE, FIND_CATEGORIES, FIND_CATEGORY, INSERT_INTO_CATEGORY,
+                 INSERT_INTO_RELATIONSHIP_ARTICLE_CATEGORY, batch.categories, 'category')):
+            ids = resolve_ids(cursor, find_sql, insert_sql, single_find_sql,
+                              [value for values in column for value in values],
+                              f'Saved {{}} {name} rows to database.', None if caches is None else caches[table])
+            pairs = list(dict.fromkeys((article_id, lookup_id(cursor, ids, single_find_sql, value))
+                                       for article_id, values in zip(article_ids, column) for value in values))
+            insert_relationships(cursor, relationship_sql, pairs, f'Saved {{}} {name}-article relationships to database.')
+            if table == TAGS_TABLE:
+                published = dict(zip(article_ids, zip(batch.sources, batch.dates_published)))
+                add_tag_counts(cursor, [(tag_id, *published[article_id]) for article_id, tag_id in pairs])
+    return len(batch)
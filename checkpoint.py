@@ -0,0 +1,130 @@
+import json
+import os
+import tempfile
+from datetime import datetime
+from config import *
+
+
+class Checkpoint:
+    """
+        The crawl frontier of a scrape, saved to disk after every step so a run that dies can be resumed
+        from the last committed batch without going through the listing or fetching those batches again.
+        The links are written once, to a file of their own, so saving the progress after a batch stays small.
+
+        Attributes
+        ----------
+        path: str
+            File the checkpoint is saved to.
+        category: str
+            Category URL suffix being scraped.
+        scrape_type: str
+            NUM_SCRAPE_TYPE or DATE_SCRAPE_TYPE.
+        scrape_parameter: int or datetime
+            Number of articles or date to scrape to.
+        links: list of str
+            Article urls found in the listing.
+        batch_size: int
+            Number of links per batch.
+        committed_batches: int
+            Number of batches saved to the database so far.
+        article_num: int
+            Article counter after the last committed batch.
+
+        Methods
+        -------
+        start():
+            Writes the links and then the progress to disk.
+
+        save():
+            Atomically writes the progress to disk.
+
+        mark_committed(batch_number, article_num):
+            Records that a batch was saved to the database.
+
+        remove():
+            Deletes the checkpoint once the scrape finished.
+        """
+
+    def __init__(self, path, category, scrape_type, scrape_parameter, links, batch_size, committed_batches=0,
+                 article_num=0):
+        self.path = path
+        self.category = category
+        self.scrape_type = scrape_type
+        self.scrape_parameter = scrape_parameter
+        self.links = list(links)
+        self.batch_size = batch_size
+        self.committed_batches = committed_batches
+        self.article_num = article_num
+
+    def to_dict(self):
+        """:return: json serializable dictionary of the progress of the checkpoint (without the links)"""
+        parameter = self.scrape_parameter
+        if isinstance(parameter, datetime):
+            parameter = parameter.strftime(PUBLISHED_DATE_FORMAT)
+        return {'category': self.category, 'scrape_type': self.scrape_type, 'scrape_parameter': parameter,
+                'batch_size': self.batch_size, 'committed_batches': self.committed_batches,
+                'article_num': self.article_num}
+
+    def start(self):
+        """writes the links of a new checkpoint, then its progress, so a saved progress always has its links"""
+        write_atomic(self.path + CHECKPOINT_LINKS_SUFFIX, ''.join(link + '\n' for link in self.links))
+        self.save()
+
+    def save(self):
+        """writes the progress of the checkpoint, a few numbers no matter how many links there are"""
+        write_atomic(self.path, json.dumps(self.to_dict()))
+
+    def mark_committed(self, batch_number, article_num):
+        """
+        :param batch_number: index of the batch that was saved to the database
+        :param article_num: article counter after the batch
+        """
+        self.committed_batches = max(self.committed_batches, batch_number + 1)
+        self.article_num = article_num
+        self.save()
+
+    def remove(self):
+        """deletes the checkpoint file and its links"""
+        for path in (self.path, self.path + CHECKPOINT_LINKS_SUFFIX):
+            if os.path.exists(path):
+                os.remove(path)
+        coin_logger.info('Scrape finished, removed its checkpoint.')
+
+
+def write_atomic(path, text):
+    """
+    writes a file through a temporary file in the same directory that is renamed over the old one,
+    so a crash while saving never leaves a half written checkpoint behind
+    :param path: file to write
+    :param text: its content
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.checkpoint-')
+    try:
+        with os.fdopen(descriptor, 'w') as temp_file:
+            temp_file.write(text)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def load_checkpoint(path):
+    """
+    :param path: checkpoint file
+    :return: Checkpoint, or None if there is no checkpoint to resume from
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as checkpoint_file:
+        state = json.load(checkpoint_file)
+    if 'links' not in state:  # checkpoints saved by older versions keep the links in the same file
+        with open(path + CHECKPOINT_LINKS_SUFFIX) as links_file:
+            state['links'] = links_file.read().splitlines()
+    parameter = state['scrape_parameter']
+    if state['scrape_type'] == DATE_SCRAPE_TYPE:
+        parameter = datetime.strptime(parameter, PUBLISHED_DATE_FORMAT)
+    return Checkpoint(path, state['category'], state['scrape_type'], parameter, state['links'], state['batch_size'],
+                      state['committed_batches'], state['article_num'])
@@ -38,6 +38,12 @@ enrichment_logger.addHandler(file_handler)
 HOST = 'localhost'
 USER = 'root'
 DATABASE = 'coindesk'
+# Connection pool defaults
+POOL_MAX_SIZE = 5
+POOL_IDLE_TIMEOUT = 300
+POOL_PING_AFTER = 5
+POOL_ACQUIRE_TIMEOUT = 30
+POOL_WAIT_INTERVAL = 0.05
 # Table names
 ARTICLES_TABLE = 'articles'
 AUTHORS_TABLE = 'authors'
@@ -98,6 +104,101 @@ CATEGORIES_ARTICLES_RELATIONSHIP_CREATION = f"""CREATE TABLE IF NOT EXISTS {CATE
             )
             """
 
+# Storage backends
+MYSQL_STORAGE = 'mysql'
+SQLITE_STORAGE = 'sqlite'
+SQLITE_SUFFIX = '.db'
+SQLITE_BUSY_TIMEOUT = 30
+# compares names case insensitively like MySQL's default collation does. it's built in, so any SQLite tool can read
+# the file; MySQL also ignores trailing spaces, so they are stripped from the values bound on SQLite
+SQLITE_COLLATION = 'NOCASE'
+SQLITE_PRAGMAS = ['PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL', 'PRAGMA foreign_keys=ON']
+SQLITE_LIST_TABLES = "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+DESCRIBE_TABLE = {MYSQL_STORAGE: 'DESCRIBE {}', SQLITE_STORAGE: 'PRAGMA table_info({})'}
+
+# SQLite Creation Scripts (the schema MySQL databases reach after migration 3)
+SQLITE_AUTHORS_CREATION = f"""CREATE TABLE IF NOT EXISTS {AUTHORS_TABLE} (id INTEGER PRIMARY KEY,
+            name VARCHAR(400) COLLATE {SQLITE_COLLATION} UNIQUE
+            )
+            """
+SQLITE_SUMMARIES_CREATION = f"""CREATE TABLE IF NOT EXISTS {SUMMARIES_TABLE} (id INTEGER PRIMARY KEY,
+            summary VARCHAR(400) COLLATE {SQLITE_COLLATION} UNIQUE
+            )
+            """
+SQLITE_CATEGORIES_CREATION = f"""CREATE TABLE IF NOT EXISTS {CATEGORIES_TABLE} (id INTEGER PRIMARY KEY,
+            category VARCHAR(100) COLLATE {SQLITE_COLLATION} UNIQUE
+            )
+            """
+SQLITE_TAGS_CREATION = f"""CREATE TABLE IF NOT EXISTS {TAGS_TABLE} (id INTEGER PRIMARY KEY,
+            name VARCHAR(100) COLLATE {SQLITE_COLLATION} UNIQUE
+            )
+            """
+SQLITE_ARTICLES_CREATION = f"""CREATE TABLE IF NOT EXISTS {ARTICLES_TABLE} (id INTEGER PRIMARY KEY,
+            title varchar(400),
+            publication_date TIMESTAMP,
+            url VARCHAR(300) COLLATE {SQLITE_COLLATION} UNIQUE,
+            summary_id INT UNIQUE NOT NULL,
+            source VARCHAR(100),
+            FOREIGN KEY(summary_id) REFERENCES {SUMMARIES_TABLE}(id)
+            )
+            """
+SQLITE_ARTICLES_SOURCE_DATE_INDEX = f"""CREATE INDEX IF NOT EXISTS articles_source_date
+            ON {ARTICLES_TABLE} (source, publication_date)"""
+SQLITE_TAGS_ARTICLES_RELATIONSHIP_CREATION = f"""CREATE TABLE IF NOT EXISTS {TAGS_ARTICLES_TABLE} (
+            article_id INT,
+            tag_id INT,
+            PRIMARY KEY(tag_id, article_id),
+            FOREIGN KEY(article_id) REFERENCES {ARTICLES_TABLE}(id),
+            FOREIGN KEY(tag_id) REFERENCES {TAGS_TABLE}(id)
+            )
+            """
+SQLITE_AUTHORS_ARTICLES_RELATIONSHIP_CREATION = f"""CREATE TABLE IF NOT EXISTS {AUTHORS_ARTICLES_TABLE} (
+            article_id INT,
+            author_id INT,
+            PRIMARY KEY(author_id, article_id),
+            FOREIGN KEY(article_id) REFERENCES {ARTICLES_TABLE}(id),
+            FOREIGN KEY(author_id) REFERENCES {AUTHORS_TABLE}(id)
+            )
+            """
+SQLITE_CATEGORIES_ARTICLES_RELATIONSHIP_CREATION = f"""CREATE TABLE IF NOT EXISTS {CATEGORIES_ARTICLES_TABLE} (
+            article_id INT,
+            category_id INT,
+            PRIMARY KEY(category_id, article_id),
+            FOREIGN KEY(article_id) REFERENCES {ARTICLES_TABLE}(id),
+            FOREIGN KEY(category_id) REFERENCES {CATEGORIES_TABLE}(id)
+            )
+            """
+
+# SQL schema migration scripts
+SCHEMA_VERSION_TABLE = 'schema_version'
+SCHEMA_VERSION_CREATION = f"""CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (version INT PRIMARY KEY,
+            description VARCHAR(200),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+SELECT_SCHEMA_VERSION = f'SELECT MAX(version) AS version FROM {SCHEMA_VERSION_TABLE}'
+INSERT_SCHEMA_VERSION = f'INSERT INTO {SCHEMA_VERSION_TABLE} (version, description) VALUES (%s, %s)'
+# points the relationship rows of duplicate entities to the entity with the lowest id
+REPOINT_DUPLICATE_ENTITIES = """UPDATE {relationship_table} r
+            INNER JOIN {table} e ON e.id = r.{entity_column}
+            INNER JOIN (SELECT {name_column}, MIN(id) AS keep_id FROM {table} GROUP BY {name_column}) k
+            ON k.{name_column} = e.{name_column}
+            SET r.{entity_column} = k.keep_id
+            WHERE r.{entity_column} <> k.keep_id"""
+DELETE_DUPLICATE_ENTITIES = """DELETE e FROM {table} e
+            INNER JOIN {table} k ON k.{name_column} = e.{name_column} AND k.id < e.id"""
+ADD_UNIQUE_INDEX = 'ALTER TABLE {table} ADD UNIQUE INDEX {index_name} ({columns})'
+ADD_INDEX = 'ALTER TABLE {table} ADD INDEX {index_name} ({columns})'
+# relationship tables are deduplicated through a temporary copy since their rows have no id
+COPY_DISTINCT_RELATIONSHIPS = """CREATE TEMPORARY TABLE {table}_distinct AS
+            SELECT DISTINCT article_id, {entity_column} FROM {table}
+            WHERE article_id IS NOT NULL AND {entity_column} IS NOT NULL"""
+DELETE_RELATIONSHIPS = 'DELETE FROM {table}'
+RESTORE_DISTINCT_RELATIONSHIPS = """INSERT INTO {table} (article_id, {entity_column})
+            SELECT article_id, {entity_column} FROM {table}_distinct"""
+DROP_DISTINCT_RELATIONSHIPS = 'DROP TEMPORARY TABLE {table}_distinct'
+ADD_PRIMARY_KEY = 'ALTER TABLE {table} ADD PRIMARY KEY ({columns})'
+
 # SQL INSERT scripts
 INSERT_INTO_SUMMARIES = f'''INSERT INTO {SUMMARIES_TABLE} (summary) VALUES (%s)'''
 INSERT_INTO_ARTICLES = f'''INSERT INTO {ARTICLES_TABLE} (title,summary_id,publication_date,url,source)
@@ -107,20 +208,132 @@ INSERT_INTO_AUTHORS = f'INSERT INTO {AUTHORS_TABLE} (name) VALUES (%s)'
 INSERT_INTO_RELATIONSHIP_ARTICLE_AUTHOR = f'INSERT INTO {AUTHORS_ARTICLES_TABLE} VALUES (%s, %s)'
 FIND_TAG = f'SELECT id FROM {TAGS_TABLE} WHERE name = %s'
 INSERT_INTO_TAGS = f'INSERT INTO {TAGS_TABLE} (name) VALUES (%s)'
-INSERT_INTO_RELATIONSHIP_ARTICLE_TAG = f'INSERT INTO {TAGS_ARTICLES_TABLE} VALUES (%s, %s)'
+# a tag an article already has is skipped, like one the enrichment finds the article with again
+INSERT_INTO_RELATIONSHIP_ARTICLE_TAG = f'INSERT IGNORE INTO {TAGS_ARTICLES_TABLE} VALUES (%s, %s)'
 FIND_CATEGORY = f'SELECT id FROM {CATEGORIES_TABLE} WHERE category = %s'
 INSERT_INTO_CATEGORY = f'INSERT INTO {CATEGORIES_TABLE} (category) VALUES (%s)'
 INSERT_INTO_RELATIONSHIP_ARTICLE_CATEGORY = f'INSERT INTO {CATEGORIES_ARTICLES_TABLE} VALUES (%s, %s)'
 
-# SQL QUERY scripts
-TOP_TEN_TAGS = f"""
-                    SELECT {TAGS_TABLE}.name as tag, COUNT(DISTINCT article_id) as tag_count
-                    FROM {TAGS_TABLE} INNER JOIN {TAGS_ARTICLES_TABLE} ON {TAGS_ARTICLES_TABLE}.tag_id = {TAGS_TABLE}.id
-                    INNER JOIN {ARTICLES_TABLE} ON {ARTICLES_TABLE}.id = {TAGS_ARTICLES_TABLE}.article_id
-                    WHERE {ARTICLES_TABLE}.source = 'Coindesk'
+# appended to the lookup of a row a unique key conflict reported: a MySQL locking read sees the newest committed
+# rows instead of the snapshot of the transaction (SQLite transactions always see them)
+LOCKING_READ = {MYSQL_STORAGE: ' LOCK IN SHARE MODE', SQLITE_STORAGE: ''}
+
+# SQL bulk scripts (the IN lists are filled with placeholders when used)
+FIND_ARTICLES_BY_URL = f'SELECT id, url AS name FROM {ARTICLES_TABLE} WHERE url IN ({{}})'
+FIND_SUMMARIES = f'SELECT id, summary AS name FROM {SUMMARIES_TABLE} WHERE summary IN ({{}})'
+FIND_AUTHORS = f'SELECT id, name FROM {AUTHORS_TABLE} WHERE name IN ({{}})'
+FIND_TAGS = f'SELECT id, name FROM {TAGS_TABLE} WHERE name IN ({{}})'
+FIND_ARTICLE_TAGS = f'SELECT article_id, tag_id FROM {TAGS_ARTICLES_TABLE} WHERE article_id IN ({{}})'
+FIND_CATEGORIES = f'SELECT id, category AS name FROM {CATEGORIES_TABLE} WHERE category IN ({{}})'
+BULK_LOOKUP_CHUNK = 500
+
+# Incremental scrape
+COUNT_ARTICLES = f'SELECT COUNT(*) AS count FROM {ARTICLES_TABLE}'
+SELECT_ARTICLE_URLS = f'SELECT url FROM {ARTICLES_TABLE}'
+KNOWN_URLS_SET_LIMIT = 1000000
+BLOOM_ERROR_RATE = 0.001
+
+# Dimension id cache
+DIMENSION_CACHE_SIZE = 5000
+WARM_AUTHORS = f'SELECT id, name FROM {AUTHORS_TABLE} ORDER BY id DESC LIMIT %s'
+WARM_TAGS = f'SELECT id, name FROM {TAGS_TABLE} ORDER BY id DESC LIMIT %s'
+WARM_CATEGORIES = f'SELECT id, category AS name FROM {CATEGORIES_TABLE} ORDER BY id DESC LIMIT %s'
+
+# Parquet export
+EXPORT_DIR = 'coindesk_parquet'
+# files starting with _ are skipped by parquet readers listing the dataset
+EXPORT_STATE_FILE = '_export_state.json'
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_PARTITION = 'month'
+EXPORT_MONTH_FORMAT = '%Y-%m'
+EXPORT_UNKNOWN_MONTH = 'unknown'
+EXPORT_ARTICLES = f"""SELECT {ARTICLES_TABLE}.id, title, summary, publication_date, url, source
+            FROM {ARTICLES_TABLE} LEFT JOIN {SUMMARIES_TABLE} ON {SUMMARIES_TABLE}.id = {ARTICLES_TABLE}.summary_id
+            WHERE {ARTICLES_TABLE}.id > %s
+            ORDER BY {ARTICLES_TABLE}.id"""
+EXPORT_AUTHORS = f"""SELECT article_id, name FROM {AUTHORS_ARTICLES_TABLE}
+            INNER JOIN {AUTHORS_TABLE} ON {AUTHORS_TABLE}.id = {AUTHORS_ARTICLES_TABLE}.author_id
+            WHERE article_id IN ({{}})"""
+EXPORT_TAGS = f"""SELECT article_id, name FROM {TAGS_ARTICLES_TABLE}
+            INNER JOIN {TAGS_TABLE} ON {TAGS_TABLE}.id = {TAGS_ARTICLES_TABLE}.tag_id
+            WHERE article_id IN ({{}})"""
+EXPORT_CATEGORIES = f"""SELECT article_id, category AS name FROM {CATEGORIES_ARTICLES_TABLE}
+            INNER JOIN {CATEGORIES_TABLE} ON {CATEGORIES_TABLE}.id = {CATEGORIES_ARTICLES_TABLE}.category_id
+            WHERE article_id IN ({{}})"""
+
+# Tag count summary table, one counter per tag, source and publication day
+TAG_COUNTS_TABLE = 'tag_daily_counts'
+TAG_COUNTS_CREATION = f"""CREATE TABLE IF NOT EXISTS {TAG_COUNTS_TABLE} (tag_id INT NOT NULL,
+            source VARCHAR(100) NOT NULL,
+            day DATE NOT NULL,
+            article_count INT NOT NULL,
+            PRIMARY KEY(tag_id, source, day),
+            FOREIGN KEY(tag_id) REFERENCES {TAGS_TABLE}(id)
+            )
+            """
+SQLITE_TAG_COUNTS_CREATION = f"""CREATE TABLE IF NOT EXISTS {TAG_COUNTS_TABLE} (tag_id INT NOT NULL,
+            source VARCHAR(100) COLLATE {SQLITE_COLLATION} NOT NULL,
+            day DATE NOT NULL,
+            article_count INT NOT NULL,
+            PRIMARY KEY(tag_id, source, day),
+            FOREIGN KEY(tag_id) REFERENCES {TAGS_TABLE}(id)
+            )
+            """
+TAG_COUNTS_SOURCE_DAY_INDEX = f'CREATE INDEX tag_counts_source_day ON {TAG_COUNTS_TABLE} (source, day)'
+CLEAR_TAG_COUNTS = f'DELETE FROM {TAG_COUNTS_TABLE}'
+REBUILD_TAG_COUNTS = f"""INSERT INTO {TAG_COUNTS_TABLE} (tag_id, source, day, article_count)
+            SELECT tag_id, COALESCE(source, ''), DATE(publication_date), COUNT(DISTINCT article_id)
+            FROM {TAGS_ARTICLES_TABLE} INNER JOIN {ARTICLES_TABLE} ON {ARTICLES_TABLE}.id = {TAGS_ARTICLES_TABLE}.article_id
+            WHERE publication_date IS NOT NULL
+            GROUP BY tag_id, COALESCE(source, ''), DATE(publication_date)"""
+ADD_TAG_COUNTS = {
+    MYSQL_STORAGE: f"""INSERT INTO {TAG_COUNTS_TABLE} (tag_id, source, day, article_count) VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE article_count = article_count + VALUES(article_count)""",
+    SQLITE_STORAGE: f"""INSERT INTO {TAG_COUNTS_TABLE} (tag_id, source, day, article_count) VALUES (%s, %s, %s, %s)
+            ON CONFLICT (tag_id, source, day) DO UPDATE SET article_count = article_count + excluded.article_count""",
+}
+# Google Trends regions of the tags, ranked by interest
+TAG_REGIONS_TABLE = 'tag_regions'
+TAG_REGIONS_CREATION = f"""CREATE TABLE IF NOT EXISTS {TAG_REGIONS_TABLE} (tag_id INT NOT NULL,
+            region_rank INT NOT NULL,
+            region VARCHAR(100) NOT NULL,
+            interest INT NOT NULL,
+            updated_at TIMESTAMP NOT NULL,
+            PRIMARY KEY(tag_id, region_rank),
+            FOREIGN KEY(tag_id) REFERENCES {TAGS_TABLE}(id)
+            )
+            """
+FIND_TAGS_WITH_REGIONS = f"""SELECT DISTINCT {TAGS_TABLE}.id AS id, {TAGS_TABLE}.name AS name FROM {TAG_REGIONS_TABLE}
+            INNER JOIN {TAGS_TABLE} ON {TAGS_TABLE}.id = {TAG_REGIONS_TABLE}.tag_id
+            WHERE {TAGS_TABLE}.name IN ({{}})"""
+DELETE_TAG_REGIONS = f'DELETE FROM {TAG_REGIONS_TABLE} WHERE tag_id IN ({{}})'
+INSERT_TAG_REGIONS = f"""INSERT INTO {TAG_REGIONS_TABLE} (tag_id, region_rank, region, interest, updated_at)
+            VALUES (%s, %s, %s, %s, %s)"""
+# the collation registered by the scraper that SQLite files made before schema version 6 were created with,
+# and the columns that used it
+SQLITE_OLD_COLLATION = 'name_key'
+SQLITE_COLLATED_COLUMNS = [(AUTHORS_TABLE, 'name'), (SUMMARIES_TABLE, 'summary'), (CATEGORIES_TABLE, 'category'),
+                           (TAGS_TABLE, 'name'), (ARTICLES_TABLE, 'url'), (TAG_COUNTS_TABLE, 'source')]
+SQLITE_SCHEMA_VERSION = 'PRAGMA schema_version'
+REPLACE_SQLITE_COLLATION = f"""UPDATE sqlite_master SET sql = REPLACE(sql, 'COLLATE {SQLITE_OLD_COLLATION}',
+            'COLLATE {SQLITE_COLLATION}') WHERE sql LIKE '%COLLATE {SQLITE_OLD_COLLATION}%'"""
+STRIP_TRAILING_SPACES = "UPDATE {table} SET {column} = RTRIM({column}, ' ') WHERE {column} LIKE '% '"
+TRENDS_DELAY = 2  # seconds between payloads, to stay under the Google rate limit
+TRENDS_TIMEFRAME = 'today 5-y'
+TRENDS_TOP_REGIONS = 10
+TRENDS_CACHE_DIR = 'trends_cache'
+TRENDS_CACHE_TTL = 7 * 24 * 60 * 60
+TRENDS_CACHE_MAX_BYTES = 10 * 1024 * 1024
+
+TOP_TAGS_COUNT = 10
+TOP_TAGS_SOURCE = 'Coindesk'
+TOP_TAGS = f"""
+                    SELECT {TAGS_TABLE}.name as tag, CAST(SUM(article_count) AS SIGNED) as tag_count
+                    FROM {TAG_COUNTS_TABLE} INNER JOIN {TAGS_TABLE} ON {TAGS_TABLE}.id = {TAG_COUNTS_TABLE}.tag_id
+                    WHERE {TAG_COUNTS_TABLE}.source = %s AND {TAG_COUNTS_TABLE}.day >= %s
                     GROUP BY {TAGS_TABLE}.name
                     ORDER BY tag_count DESC
-                    LIMIT 10
+                    LIMIT %s
                     """
 
 # Table field names
@@ -137,12 +350,73 @@ TAGS = 0
 DATETIME = 1
 REQUIRED_NUM_OF_ARGS = 3
 ARG_OPTION = 1
-MAX_ARTICLES = 1000
+MAX_ARTICLES = 100000
 ARTICLES_PER_HOME = 9
 ARTICLES_PER_PAGE = 12
 DEFAULT_PREFIX = '/category/'
+# the latest news listing mixes all categories, so being listed there isn't recorded as a category, and its articles
+# are left to the listings of their own categories when those are scraped too
+LATEST_CATEGORY = 'latest'
+CATEGORY_URLS = {
+    'tech': DEFAULT_PREFIX + 'tech',
+    'business': DEFAULT_PREFIX + 'business',
+    'people': DEFAULT_PREFIX + 'people',
+    'regulation': DEFAULT_PREFIX + 'policy-regulation',
+    'features': '/features',
+    'markets': '/markets',
+    'opinion': '/opinion',
+    LATEST_CATEGORY: '/news',
+}
+ALL_CATEGORIES = 'all'
+# the category an article listed in a category listing is saved with, as the article pages name it
+CATEGORY_NAMES = {
+    'tech': 'Tech',
+    'business': 'Business',
+    'people': 'People',
+    'regulation': 'Policy',
+    'features': 'Features',
+    'markets': 'Markets',
+    'opinion': 'Opinion',
+}
+# categories scraped at the same time by scrape_categories, each in a worker process of its own
+CATEGORY_WORKERS = 4
+# messages of a category worker to the parent: a batch of articles to write to the output, and its result
+ARTICLES_MESSAGE = 'articles'
+DONE_MESSAGE = 'done'
 SLEEPTIME = 3
 BATCH = 10
+PIPELINE_QUEUE_SIZE = 2
+CHECKPOINT_FILE = 'coindesk_checkpoint.json'
+CHECKPOINT_LINKS_SUFFIX = '.links'  # the links of the checkpoint, written once next to it
+
+# output sinks
+NO_OUTPUT = 'none'
+TABLE_OUTPUT = 'table'
+JSON_LINES_OUTPUT = 'jsonl'
+CSV_OUTPUT = 'csv'
+OUTPUT_STDOUT = '-'
+OUTPUT_FIELDS = ['number', 'title', 'summary', 'authors', 'link', 'tags', 'date_published', 'categories', 'source']
+OUTPUT_LIST_SEPARATOR = '; '
+SINK_QUEUE_SIZE = 4
+SINK_BUFFER_SIZE = 1 << 16
+SINK_WRITER_CHECK = 1  # seconds between checks that the writer is alive while a full queue blocks
+
+# HTTP client defaults
+HTTP_MAX_IN_FLIGHT = 10
+HTTP_TIMEOUT = 15
+HTTP_RETRIES = 2
+HTTP_BACKOFF = 0.5
+HTTP_POOL_HOSTS = 4
+HTTP_RETRY_STATUSES = [429, 500, 502, 503, 504]
+HTTP_MAX_RETRY_AFTER = 60  # longest Retry-After (seconds) a retry waits for
+
+# run metrics: upper bounds in seconds of the latency histogram buckets, the json report written at the end of a run
+# with --metrics-file, and how often the Prometheus text file is rewritten while a run goes on
+METRICS_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+METRICS_FILE = 'coindesk_metrics.json'
+METRICS_FLUSH_INTERVAL = 15
+METRICS_PREFIX = 'coindesk_'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
 
 # Scraping metadata tags
 SCRIPT_TAG = 'script'
@@ -163,6 +437,18 @@ PUBLISHED_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
 CATEGORY_TAG = 'category'
 TAXONOMY_TAG = 'taxonomy'
 
+# HTTP listing constants
+HTTP_LISTING = 'http'
+SELENIUM_LISTING = 'selenium'
+LISTING_PAGE_FORMAT = '{url}?page={page}'
+LISTING_URL_TAG = 'url'
+LISTING_DATE_TAG = PUBLISHED_DATE_TAG
+LISTING_DATE_LENGTH = 19
+LISTING_CONCURRENCY = 5
+MAX_LISTING_PAGES = 1000
+# listing page -> oldest publication date per category, learned by every run, to seek date bounded scrapes
+LISTING_INDEX_FILE = 'coindesk_listing_index.json'
+
 # Main date format constants
 TODAY = 'Today'
 YESTERDAY = 'Yesterday'
@@ -176,10 +462,27 @@ NUM_SCRAPE_TYPE = 'num'
 DATE_SCRAPE_TYPE = 'date'
 
 # Enrichment api constants
+NEWSAPI_URL = 'https://newsapi.org/v2/everything'
 BATCH_SIZE_ENRICH = 10
+# NewsAPI quota: requests per second refilled into the token bucket, and the burst it can hold
+ENRICHMENT_RATE = 1
+ENRICHMENT_BURST = 5
+ENRICHMENT_CONCURRENCY = 5
+ENRICHMENT_PAGE_SIZE = 100
+ENRICHMENT_MAX_ARTICLES = 1000
+ENRICHMENT_INSERT_BATCH = 100
+# on disk cache of the NewsAPI responses: fresh for ENRICHMENT_CACHE_TTL seconds, then served stale (and refreshed
+# in the background) for ENRICHMENT_CACHE_STALE_TTL more seconds
+ENRICHMENT_CACHE_DIR = 'newsapi_cache'
+ENRICHMENT_CACHE_TTL = 6 * 60 * 60
+ENRICHMENT_CACHE_STALE_TTL = 24 * 60 * 60
+ENRICHMENT_CACHE_MAX_BYTES = 50 * 1024 * 1024
+FRESH_ENTRY = 'fresh'
+STALE_ENTRY = 'stale'
 SORT_BY_OPTIONS = ['publishedAt', 'popularity', 'relevancy']
 API_DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 ENRICHMENT_ARTICLES = 'articles'
+ENRICHMENT_TOTAL_RESULTS = 'totalResults'
 ENRICHMENT_AUTHOR = 'author'
 ENRICHMENT_DESCRIPTION = 'description'
 ENRICHMENT_TITLE = 'title'
@@ -6,8 +6,124 @@ Date: 26/07/2021
 """
 ######################################################################################################################
 
+import argparse
+import os
+import time
+from datetime import datetime
 import pandas as pd
-from pytrends.request import TrendReq
+import storage
+from bulk_writer import fetch_ids
+from config import *
+from dimension_cache import name_key
+from response_cache import ResponseCache
+
+try:
+    from pytrends.exceptions import ResponseError
+    from pytrends.request import TrendReq
+    TRENDS_ERRORS = (OSError, ResponseError)
+except ImportError:  # only the trends lookups need pytrends, the scraper runs without it
+    TrendReq = None
+    TRENDS_ERRORS = (OSError,)
+
+_sessions = {}
+_caches = {}
+_last_payload = [0.0]
+
+
+def get_session():
+    """
+    Returns the Google Trends session of this process, creating it on first use, so all the
+    payloads reuse its cookies and connections.
+
+    Returns: TrendReq
+    -------
+    """
+    if os.getpid() not in _sessions:
+        _sessions[os.getpid()] = TrendReq()
+    return _sessions[os.getpid()]
+
+
+def get_cache():
+    """
+    Returns the on disk cache of the region rankings of this process, creating it on first use.
+
+    Returns: ResponseCache
+    -------
+    """
+    if os.getpid() not in _caches:
+        _caches[os.getpid()] = ResponseCache(TRENDS_CACHE_DIR, TRENDS_CACHE_TTL, 0, TRENDS_CACHE_MAX_BYTES)
+    return _caches[os.getpid()]
+
+
+def cache_params(tag):
+    """
+    Parameters
+    ----------
+    tag: string tag
+
+    Returns: the normalized query of the tag, the key of its cache entry
+    -------
+    """
+    return {'kw': name_key(tag), 'timeframe': TRENDS_TIMEFRAME, 'top': TRENDS_TOP_REGIONS, 'alone': True}
+
+
+def throttle():
+    """Waits until TRENDS_DELAY seconds passed since the previous payload."""
+    wait = _last_payload[0] + TRENDS_DELAY - time.time()
+    if wait > 0:
+        time.sleep(wait)
+    _last_payload[0] = time.time()
+
+
+def query_regions(keyword):
+    """
+    Gets the regions in which a keyword is searched on Google, with a payload of its own: with several
+    keywords in a payload, the interest of a region is its share among them, so the ranking of a keyword
+    would depend on the others.
+    Parameters
+    ----------
+    keyword: string tag
+
+    Returns: list of its top [region, interest]
+    -------
+    """
+    throttle()
+    session = get_session()
+    session.build_payload(kw_list=[keyword], timeframe=TRENDS_TIMEFRAME)
+    interest_by_region_df = session.interest_by_region()
+    return [[region, int(interest)] for region, interest in
+            interest_by_region_df[keyword].sort_values(ascending=False).head(TRENDS_TOP_REGIONS).items()]
+
+
+def get_top_regions(tags):
+    """
+    Gets the top regions of many tags: cached tags are read from disk, the rest are queried one by one over
+    one session, TRENDS_DELAY seconds apart. A tag whose query fails is logged and left out.
+    Parameters
+    ----------
+    tags: list of string tags
+
+    Returns: dictionary of tag to a list of its top [region, interest]
+    -------
+    """
+    regions = {}
+    missing = []
+    for tag in dict.fromkeys(tags):
+        cached, state = get_cache().get(cache_params(tag))
+        if state is None:
+            missing.append(tag)
+        else:
+            regions[tag] = cached
+    for tag in missing:
+        try:
+            regions[tag] = query_regions(tag)
+        except TRENDS_ERRORS as error:
+            enrichment_logger.error(f'Google Trends lookup of {tag} failed: {error}')
+            continue
+        get_cache().put(cache_params(tag), regions[tag])
+    enrichment_logger.info(f'Google Trends regions of {len(regions)} tags, {len(tags) - len(missing)} from cache, '
+                           f'cache stats: {get_cache().stats()}')
+    return regions
 
 
 def get_top_ten_regions(tag):
@@ -20,21 +136,71 @@ def get_top_ten_regions(tag):
     Returns: DataFrame of top 10 regions in which it was searched
     -------
     """
-    try:
-        pytrend = TrendReq()
-    except OSError as error:
-        print(error)
+    ranking = get_top_regions([tag]).get(tag)
+    if ranking is None:
         print('Unstable internet connection')
         return
+    return pd.DataFrame([interest for region, interest in ranking], columns=[tag],
+                        index=pd.Index([region for region, interest in ranking], name='geoName'))
+
 
-    pytrend.build_payload(kw_list=[tag])
-    interest_by_region_df = pytrend.interest_by_region()
-    return interest_by_region_df.sort_values(by=tag, ascending=False).head(10)
+def save_regions(cursor, tag_ids, regions):
+    """
+    Replaces the stored region rankings of tags.
+    Parameters
+    ----------
+    cursor: the cursor object
+    tag_ids: dictionary of normalized tag to its id
+    regions: dictionary of tag to a list of its top [region, interest]
+    """
+    ids = [tag_ids[name_key(tag)] for tag in regions if name_key(tag) in tag_ids]
+    if not ids:
+        return
+    cursor.execute(DELETE_TAG_REGIONS.format(', '.join(['%s'] * len(ids))), ids)
+    now = datetime.now().replace(microsecond=0)
+    cursor.executemany(INSERT_TAG_REGIONS, [[tag_ids[name_key(tag)], rank, region, interest, now]
+                                            for tag, ranking in regions.items() if name_key(tag) in tag_ids
+                                            for rank, (region, interest) in enumerate(ranking, 1)])
+
+
+def enrich_regions(tags, user, password, host, database, refresh=False):
+    """
+    Stores the top regions of the tags that don't have them in the database yet, so trends are
+    queried once per tag.
+    Parameters
+    ----------
+    tags: list of string tags (already stored in the tags table)
+    user: username of mysql
+    password: password of mysql
+    host: url of database server
+    database: database to save to
+    refresh: query the tags that have regions again too
+
+    Returns: number of tags whose regions were stored
+    -------
+    """
+    with storage.get_storage(host, user, password, database).connection() as connection_instance:
+        with connection_instance.cursor() as cursor:
+            stored = {} if refresh or not tags else fetch_ids(cursor, FIND_TAGS_WITH_REGIONS, list(tags))
+            missing = [tag for tag in tags if name_key(tag) not in stored]
+            if not missing:
+                return 0
+            regions = get_top_regions(missing)
+            save_regions(cursor, fetch_ids(cursor, FIND_TAGS, list(regions)), regions)
+        connection_instance.commit()
+    enrichment_logger.info(f'Stored Google Trends regions of {len(regions)} tags.')
+    return len(regions)
 
 
 def main():
-    print(get_top_ten_regions('NFT'))
-    pass
+    parser = argparse.ArgumentParser(description='Prints the top regions in which tags are searched on Google.')
+    parser.add_argument('tags', nargs='*', default=['NFT'])
+    args = parser.parse_args()
+    if TrendReq is None:
+        parser.error('the trends lookups need pytrends, install it with "pip install pytrends"')
+    for tag, ranking in get_top_regions(args.tags).items():
+        print(tag, ':')
+        print(pd.DataFrame(ranking, columns=['region', 'interest']), '\n')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,224 @@
+import os
+import time
+import threading
+import pymysql
+from contextlib import contextmanager
+from config import *
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+        A pool of reusable MySQL connections.
+
+        Connections are handed out with the connection() context manager and returned to the pool
+        afterwards instead of being closed, so a run pays the TCP and authentication handshake once
+        per connection rather than once per call.
+
+        Attributes
+        ----------
+        host: str
+            url of database server.
+        user: str
+            username of mysql.
+        password: str
+            password of mysql.
+        database: str or None
+            database the connections use (None for server level work like creating the database).
+        max_size: int or None
+            maximum number of open connections, None for no limit.
+        idle_timeout: int or None
+            seconds a connection may sit unused in the pool before it is closed, None to keep it forever.
+
+        Methods
+        -------
+        connection():
+            Context manager that lends a connection from the pool.
+
+        stats():
+            Returns a dictionary of the pool statistics.
+
+        close():
+            Closes all idle connections.
+        """
+
+    def __init__(self, host, user, password, database=None, max_size=POOL_MAX_SIZE, idle_timeout=POOL_IDLE_TIMEOUT):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.database = database
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._stats = {'created': 0, 'reused': 0, 'closed_idle': 0, 'failed_pings': 0, 'discarded': 0, 'waits': 0}
+
+    def _connect(self):
+        """:return: a brand new connection to the database"""
+        connection_instance = pymysql.connect(host=self.host, user=self.user, password=self.password,
+                                              database=self.database, cursorclass=pymysql.cursors.DictCursor)
+        with self._lock:
+            self._stats['created'] += 1
+        sql_logger.info(f'Opened new pooled connection to {self.host}/{self.database}.')
+        return connection_instance
+
+    def _close_expired(self, now):
+        """
+        closes the idle connections that passed the idle timeout
+        :param now: current time
+        """
+        if self.idle_timeout is None:
+            return
+        with self._lock:
+            expired = [item for item in self._idle if now - item[1] > self.idle_timeout]
+            self._idle = [item for item in self._idle if now - item[1] <= self.idle_timeout]
+            self._stats['closed_idle'] += len(expired)
+        for connection_instance, _ in expired:
+            connection_instance.close()
+
+    def _take(self):
+        """
+        reserves a slot in the pool
+        :return: (idle connection, time it was returned) or (None, None) if a new connection should be opened,
+        or False if the pool is full
+        """
+        with self._lock:
+            if self._idle:
+                self._in_use += 1
+                return self._idle.pop()
+            if self.max_size is None or self._in_use < self.max_size:
+                self._in_use += 1
+                return None, None
+            return False
+
+    def acquire(self):
+        """
+        takes a connection from the pool, opening a new one if there is no idle connection.
+        idle connections that weren't used for a while are checked with ping before they are handed out.
+        :return: connection object
+        """
+        now = time.time()
+        self._close_expired(now)
+        slot = self._take()
+        if slot is False:
+            with self._lock:
+                self._stats['waits'] += 1
+            while slot is False:
+                if time.time() - now > POOL_ACQUIRE_TIMEOUT:
+                    raise pymysql.err.OperationalError('Timed out waiting for a free connection from the pool.')
+                time.sleep(POOL_WAIT_INTERVAL)
+                slot = self._take()
+        connection_instance, returned_at = slot
+        try:
+            if connection_instance is None:
+                return self._connect()
+            if time.time() - returned_at > POOL_PING_AFTER:
+                try:
+                    connection_instance.ping(reconnect=False)
+                except pymysql.err.Error:
+                    with self._lock:
+                        self._stats['failed_pings'] += 1
+                    sql_logger.warning('Pooled connection failed the health check, opening a new one.')
+                    connection_instance.close()
+                    return self._connect()
+            with self._lock:
+                self._stats['reused'] += 1
+            return connection_instance
+        except BaseException:
+            with self._lock:
+                self._in_use -= 1
+            raise
+
+    def release(self, connection_instance, discard=False):
+        """
+        returns a connection to the pool. any transaction left open is rolled back, so the next
+        user doesn't read from a stale snapshot.
+        :param connection_instance: connection taken with acquire
+        :param discard: close the connection instead of keeping it (after errors)
+        """
+        if not discard:
+            try:
+                connection_instance.rollback()
+            except pymysql.err.Error:
+                discard = True
+        with self._lock:
+            self._in_use -= 1
+            if discard:
+                self._stats['discarded'] += 1
+            else:
+                self._idle.append((connection_instance, time.time()))
+        if discard:
+            try:
+                connection_instance.close()
+            except pymysql.err.Error:
+                pass
+
+    @contextmanager
+    def connection(self):
+        """
+        lends a connection from the pool for the duration of a with block
+        :return: connection object
+        """
+        connection_instance = self.acquire()
+        try:
+            yield connection_instance
+        except pymysql.err.OperationalError:
+            self.release(connection_instance, discard=True)
+            raise
+        except BaseException:
+            self.release(connection_instance)
+            raise
+        else:
+            self.release(connection_instance)
+
+    def stats(self):
+        """:return: dictionary of the pool statistics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_use'] = self._in_use
+            stats['idle'] = len(self._idle)
+        stats['database'] = self.database
+        stats['max_size'] = self.max_size
+        return stats
+
+    def close(self):
+        """closes all the idle connections of the pool"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection_instance, _ in idle:
+            connection_instance.close()
+
+
+def get_pool(host, user, password, database=None):
+    """
+    returns the connection pool of this process for the given server and database, creating it on first use.
+    pools are kept per process, so worker processes never share a connection with their parent.
+    :param host: url of database server
+    :param user: username of mysql
+    :param password: password of mysql
+    :param database: database to connect to (None for server level commands)
+    :return: ConnectionPool
+    """
+    key = (os.getpid(), host, user, password, database)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(host, user, password, database)
+        return _pools[key]
+
+
+def pool_stats():
+    """:return: list of the statistics of every pool in this process"""
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items() if key[0] == os.getpid()]
+    return [pool.stats() for pool in pools]
+
+
+def close_pools():
+    """closes the idle connections of every pool in this process"""
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items() if key[0] == os.getpid()]
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,166 @@
+import os
+from collections import OrderedDict
+from config import *
+
+
+def name_key(value):
+    """
+    normalizes a value the way MySQL compares it (case insensitive, trailing spaces ignored),
+    so ids fetched from the database can be matched back to the values we have in memory
+    :param value: string
+    :return: normalized string
+    """
+    return value.lower().rstrip(' ')
+
+
+class DimensionCache:
+    """
+        A bounded name to id cache for one dimension table (authors, tags or categories), evicting the
+        least recently used names once it's full.
+
+        Ids learned inside a transaction are kept aside until the transaction commits, so a rollback
+        never leaves the cache pointing at rows that don't exist.
+
+        Attributes
+        ----------
+        table: str
+            Name of the cached table.
+        max_size: int
+            Maximum number of names kept.
+        warmed: bool
+            Whether the cache was already loaded from the table.
+
+        Methods
+        -------
+        get(name):
+            Returns the id of the name, or None if it isn't cached.
+
+        put(name, id):
+            Remembers the id of a name until the transaction ends.
+
+        commit():
+            Keeps the ids learned in the transaction.
+
+        rollback():
+            Forgets the ids learned in the transaction.
+
+        warm(cursor):
+            Loads the most recent rows of the table.
+        """
+
+    def __init__(self, table, warm_sql, max_size=DIMENSION_CACHE_SIZE):
+        self.table = table
+        self.warm_sql = warm_sql
+        self.max_size = max_size
+        self.warmed = False
+        self.hits = 0
+        self.misses = 0
+        self._ids = OrderedDict()
+        self._pending = {}
+
+    def get(self, name):
+        """
+        :param name: entity name
+        :return: id of the name or None
+        """
+        key = name_key(name)
+        if key in self._pending:
+            self.hits += 1
+            return self._pending[key]
+        if key in self._ids:
+            self.hits += 1
+            self._ids.move_to_end(key)
+            return self._ids[key]
+        self.misses += 1
+        return None
+
+    def put(self, name, entity_id):
+        """
+        remembers the id of a name, it becomes visible to other transactions after commit()
+        :param name: entity name
+        :param entity_id: id of the entity row
+        """
+        self._pending[name_key(name)] = entity_id
+
+    def _store(self, key, entity_id):
+        self._ids[key] = entity_id
+        self._ids.move_to_end(key)
+        while len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+    def commit(self):
+        """keeps the ids learned in the transaction that was just committed"""
+        for key, entity_id in self._pending.items():
+            self._store(key, entity_id)
+        self._pending.clear()
+
+    def rollback(self):
+        """forgets the ids learned in the transaction that was just rolled back"""
+        self._pending.clear()
+
+    def warm(self, cursor):
+        """
+        loads the newest max_size rows of the table into the cache
+        :param cursor: the cursor object
+        """
+        cursor.execute(self.warm_sql, [self.max_size])
+        for row in reversed(cursor.fetchall()):
+            self._store(name_key(row['name']), row['id'])
+        self.warmed = True
+        coin_logger.info(f'Warmed {self.table} id cache with {len(self._ids)} rows.')
+
+    def stats(self):
+        """:return: dictionary of the cache statistics"""
+        return {'table': self.table, 'size': len(self._ids), 'hits': self.hits, 'misses': self.misses}
+
+
+_caches = {}
+
+
+def get_caches(host, database):
+    """
+    returns the id caches of this process for a database, creating them on first use
+    :param host: url of database server
+    :param database: database the ids belong to
+    :return: dictionary of table name to DimensionCache
+    """
+    key = (os.getpid(), host, database)
+    if key not in _caches:
+        _caches[key] = {AUTHORS_TABLE: DimensionCache(AUTHORS_TABLE, WARM_AUTHORS),
+                        TAGS_TABLE: DimensionCache(TAGS_TABLE, WARM_TAGS),
+                        CATEGORIES_TABLE: DimensionCache(CATEGORIES_TABLE, WARM_CATEGORIES)}
+    return _caches[key]
+
+
+def warm_caches(caches, cursor):
+    """
+    loads the caches that weren't loaded yet
+    :param caches: dictionary of table name to DimensionCache
+    :param cursor: the cursor object
+    """
+    for cache in caches.values():
+        if not cache.warmed:
+            cache.warm(cursor)
+
+
+def commit_caches(caches):
+    """
+    keeps the ids learned in the committed transaction
+    :param caches: dictionary of table name to DimensionCache, or None
+    """
+    for cache in (caches or {}).values():
+        cache.commit()
+
+
+def rollback_caches(caches):
+    """
+    forgets the ids learned in the rolled back transaction
+    :param caches: dictionary of table name to DimensionCache, or None
+    """
+    for cache in (caches or {}).values():
+        cache.rollback()
+
+
+def cache_stats():
+    """:return: list of the statistics of every cache in this process"""
+    return [cache.stats() for key, caches in _caches.items() if key[0] == os.getpid() for cache in caches.values()]
@@ -1,14 +1,77 @@
-import grequests
+import http_client
+import itertools
+import os
+import time
+import gevent
+import gevent.lock
+import gevent.pool
+import gevent.queue
+import math
+import metrics
 import requests
 from datetime import datetime
 from config import *
-from Coindesk_Scraper import Article
+from article import Article, ArticleBatch
+from dimension_cache import name_key
+from response_cache import ResponseCache
+
+_limiters = {}
+_caches = {}
+_refreshes = []
+
+
+class TokenBucket:
+    """
+        Rate limiter shared by the greenlets of a process: every request takes a token, tokens are refilled
+        at a fixed rate up to the burst size, and a request waits when the bucket is empty.
+
+        Attributes
+        ----------
+        rate: float
+            Tokens added per second.
+        burst: int
+            Maximum number of tokens in the bucket.
+
+        Methods
+        -------
+        acquire():
+            Waits until a token is available and takes it.
+        """
+
+    def __init__(self, rate=ENRICHMENT_RATE, burst=ENRICHMENT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = gevent.lock.Semaphore()
+
+    def acquire(self):
+        """waits until a token is available and takes it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                time.sleep((1 - self._tokens) / self.rate)
+                self._updated = time.monotonic()
+                self._tokens = 1
+            self._tokens -= 1
+
+
+def get_limiter():
+    """
+    returns the NewsAPI rate limiter of this process, creating it on first use
+    :return: TokenBucket
+    """
+    if os.getpid() not in _limiters:
+        _limiters[os.getpid()] = TokenBucket()
+    return _limiters[os.getpid()]
 
 
 def validate_params(num_article, from_date=None, to_date=None, domains=None, sort_by='publishedAt'):
     """
     validates the parameters for the enrichment api
-    :param num_article: number of articles [max: 100 blocked by api]
+    :param num_article: number of articles [max: ENRICHMENT_MAX_ARTICLES, over several pages]
     :param from_date: earliest date to search in iso format
     :param to_date: latest date to search in iso format
     :param domains: list of domains to search in
@@ -22,8 +85,8 @@ def validate_params(num_article, from_date=None, to_date=None, domains=None, sor
     if sort_by not in SORT_BY_OPTIONS:
         raise ValueError(f'sortBy must be one of these values: {SORT_BY_OPTIONS}')
     sort_by_str = f'&sortBy={sort_by}'
-    if num_article > 100 or num_article <= 0:
-        raise ValueError('Free usage of news api needs a number between 1 - 100')
+    if num_article > ENRICHMENT_MAX_ARTICLES or num_article <= 0:
+        raise ValueError(f'The number of articles must be between 1 - {ENRICHMENT_MAX_ARTICLES}')
     try:
         if from_date is not None:
             datetime.strptime(from_date, PUBLISHED_DATE_FORMAT)
@@ -43,44 +106,304 @@ def validate_params(num_article, from_date=None, to_date=None, domains=None, sor
         exit(1)
 
 
-def enrich_tag(tag, num_article=100, from_date=None, to_date=None, domains=None, sort_by='publishedAt'):
+def get_cache():
     """
-    uses news api to retrieve articles of a certain tag
+    returns the NewsAPI response cache of this process, creating it on first use
+    :return: ResponseCache
+    """
+    if os.getpid() not in _caches:
+        _caches[os.getpid()] = ResponseCache(ENRICHMENT_CACHE_DIR, ENRICHMENT_CACHE_TTL, ENRICHMENT_CACHE_STALE_TTL,
+                                             ENRICHMENT_CACHE_MAX_BYTES)
+    return _caches[os.getpid()]
+
+
+def cache_params(tag, page, page_size, from_date_str, to_date_str, domains_str, sort_by_str):
+    """
+    :return: the validated query parameters normalized into the cache key, so the same query
+    spelled differently (tag case, domain order) hits the same entry
+    """
+    domains = sorted(domains_str[len('&domains='):].split(',')) if domains_str else []
+    return {'q': name_key(tag), 'page': page, 'pageSize': page_size, 'from': from_date_str[len('&from='):],
+            'to': to_date_str[len('&to='):], 'domains': domains, 'sortBy': sort_by_str[len('&sortBy='):]}
+
+
+def fetch_articles_json(url):
+    """
+    :param url: url of the NewsAPI query
+    :return: json of the response, or None if it couldn't be retrieved
+    """
+    get_limiter().acquire()
+    with metrics.timer('newsapi_request_seconds'):
+        response = http_client.get_client().get(url)
+    if response is None:
+        return None
+    if response.status_code != requests.codes.ok:
+        response.raise_for_status()
+    enrichment_logger.info('Used enrichment api to retrieve more articles')
+    return response.json()
+
+
+def refresh(url, params):
+    """
+    fetches a query again in the background and updates its cache entry, keeping the stale one if it fails
+    :param url: url of the NewsAPI query
+    :param params: normalized query parameters
+    """
+    try:
+        json = fetch_articles_json(url)
+    except requests.exceptions.RequestException as re:
+        enrichment_logger.warning(f'Could not refresh the cached query {params}: {re.args}')
+        return
+    if json is not None:
+        get_cache().put(params, json)
+        enrichment_logger.info(f'Refreshed the cached query {params}.')
+
+
+def wait_for_refreshes():
+    """waits for the background refreshes of stale cache entries and logs the cache counters"""
+    gevent.joinall(_refreshes)
+    del _refreshes[:]
+    if os.getpid() in _caches:
+        enrichment_logger.info(f'NewsAPI cache stats: {get_cache().stats()}')
+
+
+def fetch_page(tag, page, page_size, from_date_str, to_date_str, domains_str, sort_by_str):
+    """
+    retrieves one page of the articles of a tag. responses are served from the on disk cache while fresh;
+    stale ones are served too, and fetched again in the background. an HTTP error (like the 426 NewsAPI
+    answers past the results its plan allows) is logged, and the page counts as not retrieved.
     :param tag: tag to search
-    :param num_article: number of articles [max: 100 blocked by api]
+    :param page: page number, from 1
+    :param page_size: number of articles per page
+    :return: json of the page, or None if it couldn't be retrieved
+    """
+    url = f'{NEWSAPI_URL}?q={tag}&pageSize={page_size}&page={page}&language=en' \
+          f'&excludeDomains=coindesk.com&apiKey={API_KEY}{sort_by_str}{from_date_str}{to_date_str}{domains_str}'
+    params = cache_params(tag, page, page_size, from_date_str, to_date_str, domains_str, sort_by_str)
+    json, state = get_cache().get(params)
+    metrics.inc('newsapi_pages_total', cache=state or 'miss')
+    if state == FRESH_ENTRY:
+        enrichment_logger.info(f'Cache hit for page {page} of the {tag} tag.')
+    elif state == STALE_ENTRY:
+        enrichment_logger.info(f'Stale cache hit for page {page} of the {tag} tag, refreshing it in the background.')
+        _refreshes.append(gevent.spawn(refresh, url, params))
+    else:
+        enrichment_logger.info(f'Cache miss for page {page} of the {tag} tag.')
+        try:
+            json = fetch_articles_json(url)
+        except requests.exceptions.RequestException as re:
+            enrichment_logger.error(f'Request for page {page} of the {tag} tag failed: {re.args}')
+            return None
+        if json is not None:
+            get_cache().put(params, json)
+    return json
+
+
+def parse_page(json, tag):
+    """
+    :param json: json of a page of NewsAPI results
+    :param tag: the tag that was searched
+    :return: list of Articles
+    """
+    articles = []
+    for article in json[ENRICHMENT_ARTICLES]:
+        if article[ENRICHMENT_AUTHOR] is None:
+            article[ENRICHMENT_AUTHOR] = 'Unknown'
+        if article[ENRICHMENT_DESCRIPTION] is None:
+            article[ENRICHMENT_DESCRIPTION] = ''
+        articles.append(Article(article[ENRICHMENT_TITLE], article[ENRICHMENT_DESCRIPTION],
+                                article[ENRICHMENT_AUTHOR].split('\n'), article[ENRICHMENT_URL], [tag],
+                                datetime.strptime(article[ENRICHMENT_PUBLISH_DATE], API_DATE_FORMAT),
+                                [ENRICHMENT_CATEGORY], article[ENRICHMENT_SOURCE][ENRICHMENT_SOURCE_NAME]))
+    return articles
+
+
+def stream_tag(tag, num_article=100, from_date=None, to_date=None, domains=None, sort_by='publishedAt',
+               filter_new=None):
+    """
+    uses news api to retrieve articles of a certain tag, page by page. the first page tells how many results
+    there are, the rest of the pages are fetched concurrently and their articles are yielded in page order
+    as soon as each page arrives. the time until the tag is done is observed as enrich_tag_seconds.
+    with filter_new, stored articles are skipped, and no more pages are fetched once a page has stored
+    articles when sorting by publishedAt (the following pages are older), or only stored articles otherwise.
+    :param tag: tag to search
+    :param num_article: number of articles [max: ENRICHMENT_MAX_ARTICLES]
     :param from_date: earliest date to search in iso format
     :param to_date: latest date to search in iso format
     :param domains: list of domains to search in
     :param sort_by: sort articles by [publishedAt = latest, popularity = from popular sources,
     relevancy = most relevant to tag]
-    :return: list of articles
+    :param filter_new: function from a list of urls to the ones that aren't stored yet, or None
+    :return: generator of Articles
     """
+    before = time.perf_counter()
     try:
-        num_article, from_date_str, to_date_str, domains_str, sort_by_str = validate_params(num_article, from_date, to_date,
-                                                                                            domains, sort_by)
-        url = f'https://newsapi.org/v2/everything?q={tag}&pageSize={num_article}&language=en&excludeDomains=coindesk.com&apiKey={API_KEY}' \
-              f'{sort_by_str}{from_date_str}{to_date_str}{domains_str}'
-        response = requests.get(url)
-        if response.status_code != requests.codes.ok:
-            response.raise_for_status()
-        enrichment_logger.info('Used enrichment api to retrieve more articles')
-        json = response.json()
-        articles = []
-        for article in json[ENRICHMENT_ARTICLES]:
-            if article[ENRICHMENT_AUTHOR] is None:
-                article[ENRICHMENT_AUTHOR] = 'Unknown'
-            if article[ENRICHMENT_DESCRIPTION] is None:
-                article[ENRICHMENT_DESCRIPTION] = ''
-            articles.append(Article(article[ENRICHMENT_TITLE], article[ENRICHMENT_DESCRIPTION],
-                                    list(article[ENRICHMENT_AUTHOR].split('\n')), article[ENRICHMENT_URL], [tag],
-                                    datetime.strptime(article[ENRICHMENT_PUBLISH_DATE], API_DATE_FORMAT),
-                                    [ENRICHMENT_CATEGORY], article[ENRICHMENT_SOURCE][ENRICHMENT_SOURCE_NAME]))
-        return articles
+        num_article, from_date_str, to_date_str, domains_str, sort_by_str = validate_params(num_article, from_date,
+                                                                                            to_date, domains, sort_by)
+        page_size = min(num_article, ENRICHMENT_PAGE_SIZE)
+        query = (tag, page_size, from_date_str, to_date_str, domains_str, sort_by_str)
+        first = fetch_page(tag, 1, *query[1:])
+        if first is None:
+            enrichment_logger.error(f'Could not retrieve articles of the {tag} tag, skipping it.')
+            return
+        num_pages = math.ceil(min(num_article, first.get(ENRICHMENT_TOTAL_RESULTS, 0)) / page_size)
+        pool = gevent.pool.Pool(ENRICHMENT_CONCURRENCY)
+        pages = pool.imap(lambda page: fetch_page(tag, page, *query[1:]), range(2, num_pages + 1))
+        remaining = num_article
+        try:
+            for page, json in enumerate(itertools.chain([first], pages), 1):
+                if json is None:
+                    enrichment_logger.error(f'Could not retrieve page {page} of the {tag} tag, stopping there.')
+                    break
+                articles = parse_page(json, tag)[:remaining]
+                remaining -= len(articles)
+                new = articles if filter_new is None else \
+                    [articles[i] for i in new_indexes([article.get_link() for article in articles], filter_new)]
+                metrics.inc('enrichment_articles_total', len(new))
+                yield from new
+                stored = len(articles) - len(new)
+                if remaining <= 0 or not articles or stored and (sort_by == 'publishedAt' or not new):
+                    if stored:
+                        enrichment_logger.info(f'Reached stored articles on page {page} of the {tag} tag, stopping.')
+                    break
+        finally:
+            pool.kill()
     except ValueError as ve:
         print(ve.args)
         enrichment_logger.error(ve.args)
         exit(1)
-    except requests.exceptions.RequestException as re:
-        print(re.args)
-        enrichment_logger.error(re.args)
-        exit(1)
+    finally:
+        metrics.observe('enrich_tag_seconds', time.perf_counter() - before)
+
+
+def new_indexes(links, filter_new):
+    """
+    :param links: list of urls
+    :param filter_new: function from a list of urls to the ones that aren't stored yet
+    :return: indexes of the links that aren't stored
+    """
+    new_links = set(name_key(link) for link in filter_new(links))
+    return [i for i, link in enumerate(links) if name_key(link) in new_links]
+
+
+def enrich_tag(tag, num_article=100, from_date=None, to_date=None, domains=None, sort_by='publishedAt'):
+    """
+    uses news api to retrieve articles of a certain tag
+    :param tag: tag to search
+    :param num_article: number of articles [max: ENRICHMENT_MAX_ARTICLES]
+    :param from_date: earliest date to search in iso format
+    :param to_date: latest date to search in iso format
+    :param domains: list of domains to search in
+    :param sort_by: sort articles by [publishedAt = latest, popularity = from popular sources,
+    relevancy = most relevant to tag]
+    :return: ArticleBatch of the articles
+    """
+    return ArticleBatch.from_articles(stream_tag(tag, num_article, from_date, to_date, domains, sort_by))
+
+
+def stream_tags(tags, num_article=100, from_date=None, to_date=None, domains=None, sort_by='publishedAt',
+                filter_new=None):
+    """
+    retrieves the articles of several tags concurrently, at most ENRICHMENT_CONCURRENCY requests per tag at a
+    time and at the pace of the NewsAPI rate limiter, yielding the articles as soon as their page arrives.
+    an article found by several tags is yielded once per tag, with that tag.
+    :param tags: tags to search
+    :param num_article: number of articles per tag [max: ENRICHMENT_MAX_ARTICLES]
+    :param from_date: earliest date to search in iso format
+    :param to_date: latest date to search in iso format
+    :param domains: list of domains to search in
+    :param sort_by: sort articles by [publishedAt = latest, popularity = from popular sources,
+    relevancy = most relevant to tag]
+    :param filter_new: function from a list of urls to the ones that aren't stored yet, or None
+    :return: generator of Articles
+    """
+    results = gevent.queue.Queue(ENRICHMENT_PAGE_SIZE)
+
+    def stream(tag):
+        try:
+            for article in stream_tag(tag, num_article, from_date, to_date, domains, sort_by, filter_new):
+                results.put(article)
+        finally:
+            results.put(None)
+
+    greenlets = [gevent.spawn(stream, tag) for tag in tags]
+    finished = 0
+    try:
+        while finished < len(tags):
+            article = results.get()
+            if article is None:
+                finished += 1
+            else:
+                yield article
+    finally:
+        gevent.killall(greenlets)
+
+
+def merge_articles(articles, batch_size=ENRICHMENT_INSERT_BATCH):
+    """
+    groups a stream of articles into batches of new urls as they arrive. a url that comes again with another
+    tag is merged into its article while that one is still in the batch being filled; once its batch was
+    handed out, the article comes again as a repeat, carrying only the tags that are new for it.
+    only the keys of the urls seen so far are kept, not their articles.
+    :param articles: iterable of Articles
+    :param batch_size: number of new articles per batch
+    :return: generator of (ArticleBatch of new urls, list of repeated Articles of urls of earlier batches)
+    """
+    seen = {}
+    batch = ArticleBatch()
+    positions = {}
+    repeats = []
+    for article in articles:
+        key = name_key(article.get_link())
+        if key not in seen:
+            seen[key] = {name_key(tag) for tag in article.get_tags()}
+            positions[key] = len(batch)
+            batch.append(article)
+            if len(batch) >= batch_size:
+                yield batch, repeats
+                batch, positions, repeats = ArticleBatch(), {}, []
+            continue
+        new_tags = [tag for tag in article.get_tags() if name_key(tag) not in seen[key]]
+        if not new_tags:
+            continue
+        seen[key].update(name_key(tag) for tag in new_tags)
+        if key in positions:
+            batch.tags[positions[key]] = batch.tags[positions[key]] + tuple(new_tags)
+        else:
+            article.tags = new_tags
+            repeats.append(article)
+    if len(batch) or repeats:
+        yield batch, repeats
+    enrichment_logger.info(f'Retrieved {len(seen)} distinct articles.')
+
+
+def enrich_tags(tags, num_article=100, from_date=None, to_date=None, domains=None, sort_by='publishedAt',
+                filter_new=None, batch_size=ENRICHMENT_INSERT_BATCH):
+    """
+    retrieves the articles of several tags concurrently and hands them out in batches as they arrive,
+    merged by url, so an article found by several tags is saved once and gets all of them
+    (see merge_articles). the articles handed out in this run are let through filter_new, so another tag
+    finding one after it was saved adds its tag instead of stopping at it.
+    :param tags: tags to search
+    :param num_article: number of articles per tag [max: ENRICHMENT_MAX_ARTICLES]
+    :param from_date: earliest date to search in iso format
+    :param to_date: latest date to search in iso format
+    :param domains: list of domains to search in
+    :param sort_by: sort articles by [publishedAt = latest, popularity = from popular sources,
+    relevancy = most relevant to tag]
+    :param filter_new: function from a list of urls to the ones that aren't stored yet, or None
+    :param batch_size: number of new articles per batch
+    :return: generator of (ArticleBatch of new urls, list of repeated Articles with their new tags)
+    """
+    handed_out = set()
+
+    def filter_unseen(links):
+        new = set(name_key(link) for link in filter_new([link for link in links
+                                                          if name_key(link) not in handed_out]))
+        return [link for link in links if name_key(link) in handed_out or name_key(link) in new]
+
+    articles = stream_tags(tags, num_article, from_date, to_date, domains, sort_by,
+                           None if filter_new is None else filter_unseen)
+    for batch, repeats in merge_articles(articles, batch_size):
+        handed_out.update(name_key(link) for link in batch.links)
+        yield batch, repeats
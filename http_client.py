@@ -0,0 +1,159 @@
+from gevent import monkey
+
+# the same patching grequests does, so the session's sockets run concurrently in greenlets
+monkey.patch_all(thread=False, select=False)
+
+import os
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import gevent.lock
+import gevent.pool
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from config import *
+
+_clients = {}
+
+
+class HttpClient:
+    """
+        A shared HTTP client: one keep-alive session whose connections are reused across requests,
+        at most max_in_flight requests at a time (whether they come from map or straight from get),
+        a timeout on every request and retries with jittered exponential backoff, or after the
+        Retry-After the server asked for.
+
+        Attributes
+        ----------
+        max_in_flight: int
+            Maximum number of concurrent requests.
+        timeout: float
+            Seconds to wait for the server (connect and read).
+        retries: int
+            Number of retries after a failed attempt.
+        backoff: float
+            Base delay in seconds between attempts, doubled on every retry.
+
+        Methods
+        -------
+        get(url, params):
+            Returns the response, or None if all the attempts failed.
+
+        map(urls):
+            Downloads the urls concurrently, returning the responses in order.
+
+        host_stats():
+            Returns latency and throughput counters per host.
+        """
+
+    def __init__(self, max_in_flight=HTTP_MAX_IN_FLIGHT, timeout=HTTP_TIMEOUT, retries=HTTP_RETRIES,
+                 backoff=HTTP_BACKOFF):
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=max_in_flight)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.pool = gevent.pool.Pool(max_in_flight)
+        self._in_flight = gevent.lock.BoundedSemaphore(max_in_flight)
+        self._stats = {}
+
+    def _record(self, host, **counts):
+        stats = self._stats.setdefault(host, {'requests': 0, 'failures': 0, 'retries': 0, 'bytes': 0,
+                                              'seconds': 0.0})
+        for name, value in counts.items():
+            stats[name] += value
+
+    def _wait(self, attempt, response=None):
+        """
+        sleeps before the next attempt: as long as the Retry-After header of the failed response says (up to
+        HTTP_MAX_RETRY_AFTER seconds), otherwise with jittered exponential backoff so retries of concurrent
+        requests don't line up
+        :param attempt: number of the retry, from 0
+        :param response: the response of the failed attempt, or None if it raised
+        """
+        delay = None if response is None else retry_after(response)
+        if delay is None:
+            delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+        time.sleep(min(delay, HTTP_MAX_RETRY_AFTER))
+
+    def get(self, url, params=None):
+        """
+        downloads a url, retrying connection errors, timeouts, 429 and 5xx responses.
+        other error statuses (like 404) are returned to the caller as they are.
+        waits for a free slot when max_in_flight requests are running; the slot isn't held between attempts.
+        :param url: url to download
+        :param params: query string parameters
+        :return: response, or None if all the attempts failed
+        """
+        host = urlparse(url).netloc
+        response = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self._record(host, retries=1)
+                self._wait(attempt - 1, response)
+            try:
+                with self._in_flight:
+                    before = time.time()
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.exceptions.RequestException as err:
+                response = None
+                self._record(host, requests=1, failures=1, seconds=time.time() - before)
+                coin_logger.warning(f'Request to {url} failed (attempt {attempt + 1}): {err}')
+                continue
+            self._record(host, requests=1, bytes=len(response.content), seconds=time.time() - before)
+            if response.status_code in HTTP_RETRY_STATUSES:
+                self._record(host, failures=1)
+                coin_logger.warning(f'Request to {url} returned {response.status_code} (attempt {attempt + 1}).')
+                continue
+            return response
+        coin_logger.error(f'Giving up on {url} after {self.retries + 1} attempts.')
+        return None
+
+    def map(self, urls):
+        """
+        downloads urls concurrently, at most max_in_flight at a time
+        :param urls: list of urls
+        :return: list of responses in the order of the urls, None for the ones that failed
+        """
+        return self.pool.map(self.get, urls)
+
+    def host_stats(self):
+        """:return: dictionary of host to its counters, average latency and throughput"""
+        stats = {}
+        for host, counts in self._stats.items():
+            stats[host] = dict(counts)
+            stats[host]['avg_latency'] = round(counts['seconds'] / counts['requests'], 3) if counts['requests'] else 0
+            stats[host]['bytes_per_sec'] = round(counts['bytes'] / counts['seconds']) if counts['seconds'] else 0
+        return stats
+
+
+def retry_after(response):
+    """
+    :param response: response asking to retry (like a 429 or 503)
+    :return: seconds its Retry-After header asks to wait, in seconds or as an HTTP date, or None without a
+             valid one
+    """
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    if value.strip().isdigit():
+        return int(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def get_client():
+    """
+    returns the HTTP client of this process, creating it on first use
+    :return: HttpClient
+    """
+    if os.getpid() not in _clients:
+        _clients[os.getpid()] = HttpClient()
+    return _clients[os.getpid()]
@@ -0,0 +1,260 @@
+import json
+import math
+import os
+import tempfile
+import http_client
+import metrics
+import next_data
+import requests
+from datetime import datetime
+from config import *
+
+
+def listing_page_url(base_url, category, page):
+    """
+    :param base_url: coindesk.com url (or a local stand-in)
+    :param category: category URL suffix
+    :param page: page number, starting at 1
+    :return: url of the listing page
+    """
+    return LISTING_PAGE_FORMAT.format(url=base_url + category, page=page)
+
+
+def listing_items(props):
+    """
+    walks the __NEXT_DATA__ properties of a listing page and collects the article entries in page order.
+    an article entry is any object that has both a link and a publication date.
+    :param props: decoded __NEXT_DATA__ json
+    :return: list of (link, publication date string)
+    """
+    items = []
+    stack = [props]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if isinstance(node.get(LISTING_URL_TAG), str) and isinstance(node.get(LISTING_DATE_TAG), str):
+                items.append((node[LISTING_URL_TAG], node[LISTING_DATE_TAG]))
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+    return items
+
+
+def parse_listing_page(content, base_url):
+    """
+    extracts the article links and publication dates of a listing page
+    :param content: html of the listing page
+    :param base_url: url that relative links are joined to
+    :return: list of (url, publication datetime), empty if the page has no articles
+    """
+    page_data = next_data.extract_next_data(content)
+    if page_data is None:
+        return []
+    articles = []
+    for link, published in listing_items(page_data):
+        try:
+            published = datetime.strptime(published[:LISTING_DATE_LENGTH], PUBLISHED_DATE_FORMAT)
+        except ValueError:
+            continue
+        articles.append((base_url + link if link.startswith('/') else link, published))
+    return articles
+
+
+def fetch_listing_pages(base_url, category, pages):
+    """
+    downloads listing pages concurrently
+    :param base_url: coindesk.com url (or a local stand-in)
+    :param category: category URL suffix
+    :param pages: page numbers
+    :return: list of pages, each a list of (url, publication datetime). a page past the end of the listing
+    (404) is empty, a page that failed to load after the retries of the client is None.
+    """
+    with metrics.timer('listing_pages_seconds'):
+        responses = http_client.get_client().map([listing_page_url(base_url, category, page) for page in pages])
+    metrics.inc('listing_pages_total', len(pages))
+    results = []
+    for page, response in zip(pages, responses):
+        if response is not None and response.status_code == requests.codes.not_found:
+            coin_logger.info(f'Listing page {page} of {category} is past the end of the listing.')
+            results.append([])
+        elif response is None or response.status_code != requests.codes.ok:
+            coin_logger.warning(f'Could not load listing page {page} of {category}.')
+            results.append(None)
+        else:
+            results.append(parse_listing_page(response.content, base_url))
+    return results
+
+
+class ListingIndex:
+    """
+        The oldest publication date of every listing page read so far, per category, saved between runs.
+        New articles push the old ones to later pages, so a recorded page is only where a date was, and
+        is used as the starting point of a search rather than as an answer.
+
+        Attributes
+        ----------
+        path: str
+            File the index is saved to.
+        pages: dict
+            Category to a dictionary of page number to its oldest publication date.
+
+        Methods
+        -------
+        record(category, page, articles):
+            Records the oldest date of a page that was read.
+
+        guess(category, date):
+            Returns the page the date was on the last time it was seen.
+
+        save():
+            Atomically writes the index to disk.
+        """
+
+    def __init__(self, path=LISTING_INDEX_FILE):
+        self.path = path
+        self.pages = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as index_file:
+                    saved = json.load(index_file)
+                self.pages = {category: {int(page): datetime.strptime(oldest, PUBLISHED_DATE_FORMAT)
+                                         for page, oldest in pages.items()} for category, pages in saved.items()}
+            except (ValueError, AttributeError):
+                coin_logger.warning(f'Ignoring the unreadable listing index {path}.')
+
+    def record(self, category, page, articles):
+        """
+        :param category: category URL suffix
+        :param page: page number
+        :param articles: list of (url, publication datetime) of the page
+        """
+        if articles:
+            self.pages.setdefault(category, {})[page] = articles[-1][1]
+
+    def guess(self, category, date):
+        """
+        :param category: category URL suffix
+        :param date: publication date to look for
+        :return: the first recorded page whose oldest article is as old as the date, the page after the last
+        recorded one if none is, or 1 if nothing was recorded
+        """
+        pages = self.pages.get(category, {})
+        reached = [page for page, oldest in pages.items() if oldest <= date]
+        if reached:
+            return min(reached)
+        return max(pages) + 1 if pages else 1
+
+    def save(self):
+        """writes the index to a temporary file and renames it over the old one"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.listing-index-')
+        with os.fdopen(descriptor, 'w') as temp_file:
+            json.dump({category: {str(page): oldest.strftime(PUBLISHED_DATE_FORMAT) for page, oldest in pages.items()}
+                       for category, pages in self.pages.items()}, temp_file)
+        os.replace(temp_path, self.path)
+
+
+def seek_date_page(category, date, index, base_url=URL):
+    """
+    finds the first listing page whose oldest article is as old as the date (or the first page past the end
+    of the listing). starts from the page the index remembers, steps forward or back 1, 2, 4... pages until
+    the date is bracketed, then binary searches in between, so only a logarithmic number of pages is read.
+    :param category: category URL suffix
+    :param date: publication date to look for
+    :param index: ListingIndex, updated with every page read
+    :param base_url: coindesk.com url (or a local stand-in)
+    :return: page number and a dictionary of the pages read to their articles, or None, {} if a page failed
+    """
+    read = {}
+
+    def reached(page):
+        if page not in read:
+            read[page] = fetch_listing_pages(base_url, category, [page])[0]
+            if read[page] is None:
+                raise LookupError(page)
+            index.record(category, page, read[page])
+        return not read[page] or read[page][-1][1] <= date
+
+    start = min(index.guess(category, date), MAX_LISTING_PAGES)
+    try:
+        if reached(start):
+            found, step = start, 1
+            while start - step >= 1 and reached(start - step):
+                found = start - step
+                step *= 2
+            not_reached = max(start - step, 0)
+        else:
+            not_reached, found, step = start, MAX_LISTING_PAGES, 1
+            while start + step < MAX_LISTING_PAGES:
+                if reached(start + step):
+                    found = start + step
+                    break
+                not_reached = start + step
+                step *= 2
+        while found - not_reached > 1:
+            middle = (found + not_reached) // 2
+            if reached(middle):
+                found = middle
+            else:
+                not_reached = middle
+    except LookupError as err:
+        coin_logger.warning(f'Could not load listing page {err.args[0]} of {category} while seeking {date}.')
+        return None, {}
+    coin_logger.info(f'Found {date} on listing page {found} of {category} after reading {len(read)} pages '
+                     f'(starting from page {start}).')
+    return found, read
+
+
+def date_listing_pages(category, date, index, base_url=URL):
+    """
+    reads the listing pages from the newest one to the one that reaches the date: the last page is found with
+    seek_date_page, and the pages before it that the search didn't read are downloaded concurrently
+    :param category: category URL suffix
+    :param date: publication date to read back to
+    :param index: ListingIndex, updated with every page read
+    :param base_url: coindesk.com url (or a local stand-in)
+    :return: list of pages in order, each a list of (url, publication datetime) or None if it failed to load
+    """
+    last_page, read = seek_date_page(category, date, index, base_url)
+    if last_page is None:
+        return [None]
+    missing = [page for page in range(1, last_page + 1) if page not in read]
+    read.update(zip(missing, fetch_listing_pages(base_url, category, missing)))
+    return [read[page] for page in range(1, last_page + 1)]
+
+
+def http_listing_links(category, scrape_by, base_url=URL):
+    """
+    pages through a category listing over plain HTTP until it has enough articles for the scrape (by number),
+    LISTING_CONCURRENCY pages at a time, or reached articles older than the requested date. a scrape by date
+    seeks the page of the date with the help of the listing index, and reads only the pages up to it.
+    :param category: category URL suffix
+    :param scrape_by: dictionary defining how to scrape
+    :param base_url: coindesk.com url (or a local stand-in)
+    :return: list of article urls, newest first (empty if the listing couldn't be read)
+    """
+    links = []
+    seen = set()
+    index = ListingIndex()
+    if scrape_by[SCRAPE_BY_TYPE] == NUM_SCRAPE_TYPE:
+        last_page = math.ceil(scrape_by[SCRAPE_BY_PARAMETERS] / ARTICLES_PER_PAGE) + 1
+        rounds = (list(range(page, min(page + LISTING_CONCURRENCY, last_page + 1)))
+                  for page in range(1, last_page + 1, LISTING_CONCURRENCY))
+        pages = (articles for pages in rounds for articles in fetch_listing_pages(base_url, category, pages))
+    else:
+        pages = date_listing_pages(category, scrape_by[SCRAPE_BY_PARAMETERS], index, base_url)
+    pages_read = 0
+    for page, articles in enumerate(pages, 1):
+        pages_read += 1
+        index.record(category, page, articles)
+        if not articles:  # failed or past the last page of the listing
+            break
+        for link, _ in articles:
+            if link not in seen:
+                seen.add(link)
+                links.append(link)
+        if scrape_by[SCRAPE_BY_TYPE] == DATE_SCRAPE_TYPE and articles[-1][1] <= scrape_by[SCRAPE_BY_PARAMETERS]:
+            break
+    index.save()
+    coin_logger.info(f'Read {len(links)} article urls from {pages_read} listing pages of {category} over HTTP.')
+    return links
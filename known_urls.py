@@ -0,0 +1,105 @@
+import hashlib
+import math
+import pymysql
+from config import *
+from dimension_cache import name_key
+
+
+class BloomFilter:
+    """
+        A compact set membership filter: may answer that a url is stored when it isn't (at the
+        configured false positive rate), but never misses a url that was added.
+
+        Attributes
+        ----------
+        num_bits: int
+            Size of the bit array.
+        num_hashes: int
+            Number of bit positions set per item.
+        """
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+        return ((first + i * second) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item):
+        """:param item: string to add"""
+        for position in self._positions(item):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, item):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(item))
+
+
+class KnownUrls:
+    """
+        The urls of the stored articles, loaded once with a streaming query. Up to KNOWN_URLS_SET_LIMIT urls
+        are kept in a set, larger tables go into a Bloom filter whose positive answers are confirmed
+        against the database.
+
+        Methods
+        -------
+        load(connection):
+            Loads the stored urls.
+
+        filter_new(links, connection):
+            Returns the links that aren't stored yet.
+
+        add(url):
+            Marks a url as stored.
+        """
+
+    def __init__(self):
+        self.urls = None
+        self.bloom = None
+
+    def load(self, connection_instance):
+        """
+        streams the urls of the articles table into memory
+        :param connection_instance: connection object
+        :return: self
+        """
+        with connection_instance.cursor() as cursor:
+            cursor.execute(COUNT_ARTICLES)
+            count = cursor.fetchone()['count']
+        if count <= KNOWN_URLS_SET_LIMIT:
+            self.urls = set()
+        else:
+            self.bloom = BloomFilter(count * 2)
+        with connection_instance.cursor(pymysql.cursors.SSCursor) as cursor:
+            cursor.execute(SELECT_ARTICLE_URLS)
+            for (url,) in cursor:
+                self.add(url)
+        coin_logger.info(f'Loaded {count} stored urls into a {"set" if self.bloom is None else "bloom filter"}.')
+        return self
+
+    def add(self, url):
+        """:param url: url of a stored article"""
+        if self.bloom is None:
+            self.urls.add(name_key(url))
+        else:
+            self.bloom.add(name_key(url))
+
+    def filter_new(self, links, connection_instance):
+        """
+        :param links: list of article urls
+        :param connection_instance: connection object, used to confirm Bloom filter hits
+        :return: the links that aren't stored yet, in their original order
+        """
+        if self.bloom is None:
+            return [link for link in links if name_key(link) not in self.urls]
+        maybe_stored = [link for link in links if name_key(link) in self.bloom]
+        stored = set()
+        with connection_instance.cursor() as cursor:
+            for i in range(0, len(maybe_stored), BULK_LOOKUP_CHUNK):
+                chunk = maybe_stored[i:i + BULK_LOOKUP_CHUNK]
+                cursor.execute(FIND_ARTICLES_BY_URL.format(', '.join(['%s'] * len(chunk))), chunk)
+                stored.update(name_key(row['name']) for row in cursor.fetchall())
+        return [link for link in links if name_key(link) not in stored]
@@ -0,0 +1,338 @@
+import bisect
+import json
+import os
+import re
+import tempfile
+import time
+from datetime import datetime
+import gevent
+from config import *
+
+_metrics = {}
+_statements = {}
+_exporters = []
+TABLE_PATTERN = re.compile(r'\b(?:into|from|update|table)\s+`?(\w+)', re.IGNORECASE)
+
+
+class Metrics:
+    """
+        Counters and latency histograms of a run. A series is a metric name and its labels; the histograms
+        count the observations per bucket of METRICS_BUCKETS seconds, like Prometheus histograms do.
+
+        Attributes
+        ----------
+        buckets: list
+            Upper bounds in seconds of the histogram buckets.
+        started: float
+            Time the metrics started being collected.
+
+        Methods
+        -------
+        inc(name, value, **labels):
+            Adds to a counter.
+
+        observe(name, seconds, **labels):
+            Adds a latency to a histogram.
+
+        inc_series(key, value), observe_series(key, seconds):
+            The same for a series_key computed once, for the hottest paths.
+
+        timer(name, **labels):
+            Context manager observing how long its block took.
+
+        snapshot():
+            Returns a copy of the series that can be sent to another process.
+
+        merge(snapshot):
+            Adds the series of a snapshot (of a worker process) to these.
+
+        report():
+            Returns the counters and the histogram summaries as a json serializable dictionary.
+
+        prometheus():
+            Returns the series in the Prometheus text format.
+        """
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = list(buckets)
+        self.started = time.time()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        """
+        :param name: counter name
+        :param value: amount to add
+        :param labels: labels of the series
+        """
+        self.inc_series(series_key(name, labels), value)
+
+    def inc_series(self, key, value=1):
+        """adds to the counter of a series_key"""
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """
+        :param name: histogram name
+        :param seconds: the observed latency
+        :param labels: labels of the series
+        """
+        self.observe_series(series_key(name, labels), seconds)
+
+    def observe_series(self, key, seconds):
+        """adds a latency to the histogram of a series_key"""
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'max': 0.0}
+        histogram['counts'][bisect.bisect_left(self.buckets, seconds)] += 1
+        histogram['sum'] += seconds
+        if seconds > histogram['max']:
+            histogram['max'] = seconds
+
+    def timer(self, name, **labels):
+        """:return: context manager observing how long its block took, also when it raised"""
+        return Timer(self, series_key(name, labels))
+
+    def snapshot(self):
+        """:return: picklable copy of the counters and histograms"""
+        return {'counters': dict(self._counters),
+                'histograms': {key: dict(histogram, counts=list(histogram['counts']))
+                               for key, histogram in self._histograms.items()}}
+
+    def merge(self, snapshot):
+        """
+        adds the series of another process to these (both use the same buckets)
+        :param snapshot: the result of snapshot()
+        """
+        for key, value in snapshot['counters'].items():
+            self._counters[key] = self._counters.get(key, 0) + value
+        for key, other in snapshot['histograms'].items():
+            if key not in self._histograms:
+                self._histograms[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'max': 0.0}
+            histogram = self._histograms[key]
+            histogram['counts'] = [count + other_count for count, other_count in zip(histogram['counts'],
+                                                                                     other['counts'])]
+            histogram['sum'] += other['sum']
+            histogram['max'] = max(histogram['max'], other['max'])
+
+    def quantile(self, histogram, fraction):
+        """:return: upper bound of the bucket the quantile falls in (the maximum for the last bucket)"""
+        rank = fraction * sum(histogram['counts'])
+        seen = 0
+        for bound, count in zip(self.buckets, histogram['counts']):
+            seen += count
+            if seen >= rank:
+                return min(bound, histogram['max'])
+        return histogram['max']
+
+    def report(self):
+        """:return: dictionary of the run time, counters and histogram summaries (seconds)"""
+        histograms = []
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            count = sum(histogram['counts'])
+            histograms.append({'name': name, 'labels': dict(labels), 'count': count,
+                               'sum': round(histogram['sum'], 6), 'avg': round(histogram['sum'] / count, 6),
+                               'p50': round(self.quantile(histogram, 0.5), 6),
+                               'p99': round(self.quantile(histogram, 0.99), 6), 'max': round(histogram['max'], 6)})
+        return {'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'seconds': round(time.time() - self.started, 3),
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self._counters.items())],
+                'histograms': histograms}
+
+    def prometheus(self, prefix=METRICS_PREFIX):
+        """:return: the series in the Prometheus text exposition format"""
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(self._counters.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {prefix}{name} counter')
+            lines.append(f'{prefix}{name}{format_labels(labels)} {value}')
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {prefix}{name} histogram')
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], histogram['counts']):
+                cumulative += count
+                lines.append(f'{prefix}{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{prefix}{name}_sum{format_labels(labels)} {histogram["sum"]}')
+            lines.append(f'{prefix}{name}_count{format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+class Timer:
+    """Context manager adding the time its block took to the histogram of a series."""
+    __slots__ = ('metrics', 'key', 'before')
+
+    def __init__(self, metrics, key):
+        self.metrics = metrics
+        self.key = key
+        self.before = None
+
+    def __enter__(self):
+        self.before = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe_series(self.key, time.perf_counter() - self.before)
+
+
+class TimedCursor:
+    """
+        Wraps a database cursor, observing every statement in the sql_statement_seconds histogram by its
+        type (insert, select...) and table, and counting the rows of executemany. Everything else is passed
+        through to the cursor.
+        """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, sql, args=None):
+        with Timer(get_metrics(), statement_series(sql)[0]):
+            return self._cursor.execute(sql, args)
+
+    def executemany(self, sql, args):
+        args = list(args)
+        seconds_key, rows_key = statement_series(sql)
+        get_metrics().inc_series(rows_key, len(args))
+        with Timer(get_metrics(), seconds_key):
+            return self._cursor.executemany(sql, args)
+
+
+def series_key(name, labels):
+    """
+    :param name: metric name
+    :param labels: dictionary of the labels of the series
+    :return: hashable key of the series
+    """
+    return name, tuple(sorted(labels.items()))
+
+
+def statement_series(sql):
+    """
+    :param sql: sql statement
+    :return: keys of the sql_statement_seconds and sql_rows_total series of the statement type (insert, select...)
+             and the table it works on, parsed once per statement
+    """
+    if sql not in _statements:
+        table = TABLE_PATTERN.search(sql)
+        labels = {'statement': sql.split(None, 1)[0].lower(), 'table': table.group(1) if table else ''}
+        _statements[sql] = series_key('sql_statement_seconds', labels), series_key('sql_rows_total', labels)
+    return _statements[sql]
+
+
+def format_labels(labels):
+    """:return: the labels in the Prometheus format, {name="value",...}, or empty without labels"""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+def escape_label(value):
+    """:return: the label value with backslashes, quotes and new lines escaped"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def get_metrics():
+    """
+    returns the metrics of this process, creating them on first use
+    :return: Metrics
+    """
+    if os.getpid() not in _metrics:
+        _metrics[os.getpid()] = Metrics()
+    return _metrics[os.getpid()]
+
+
+def inc(name, value=1, **labels):
+    """adds to a counter of this process"""
+    get_metrics().inc(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    """adds a latency to a histogram of this process"""
+    get_metrics().observe(name, seconds, **labels)
+
+
+def timer(name, **labels):
+    """:return: context manager observing how long its block took in a histogram of this process"""
+    return get_metrics().timer(name, **labels)
+
+
+def write_atomic(path, text):
+    """writes a file through a temporary one, so a reader (like a textfile collector) never sees half of it"""
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.metrics-')
+    with os.fdopen(descriptor, 'w') as temp_file:
+        temp_file.write(text)
+    os.replace(temp_path, path)
+
+
+def write_report(path):
+    """writes the end of run json report of this process"""
+    write_atomic(path, json.dumps(get_metrics().report(), indent=2))
+
+
+def write_prometheus(path):
+    """writes the Prometheus text format of the metrics of this process"""
+    write_atomic(path, get_metrics().prometheus())
+
+
+def flush_prometheus(path, interval=METRICS_FLUSH_INTERVAL):
+    """
+    rewrites the Prometheus file every interval seconds while the run goes on
+    :param path: Prometheus text file
+    :param interval: seconds between writes
+    :return: the greenlet writing it, kill it at the end of the run
+    """
+    def flush():
+        while True:
+            gevent.sleep(interval)
+            write_prometheus(path)
+    flusher = gevent.spawn(flush)
+    _exporters.append((os.getpid(), flusher.kill))
+    return flusher
+
+
+def serve_prometheus(port):
+    """
+    serves the metrics of this process at /metrics over HTTP while the run goes on
+    :param port: port to listen on
+    :return: the started WSGIServer, stop it at the end of the run
+    """
+    from gevent.pywsgi import WSGIServer  # only serving the metrics needs the WSGI server
+
+    def application(environ, start_response):
+        if environ['PATH_INFO'] != '/metrics':
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not Found\n']
+        body = get_metrics().prometheus().encode('utf-8')
+        start_response('200 OK', [('Content-Type', PROMETHEUS_CONTENT_TYPE), ('Content-Length', str(len(body)))])
+        return [body]
+
+    server = WSGIServer(('', port), application, log=None)
+    server.start()
+    _exporters.append((os.getpid(), server.close))
+    return server
+
+
+def stop_inherited_exporters():
+    """
+    stops the Prometheus file writer and server a forked worker inherited from its parent, so only the
+    parent exports (the metrics of the worker are sent to it with snapshot())
+    """
+    for pid, stop in [exporter for exporter in _exporters if exporter[0] != os.getpid()]:
+        stop()
+    _exporters[:] = [exporter for exporter in _exporters if exporter[0] == os.getpid()]
@@ -0,0 +1,58 @@
+import json
+import re
+from bs4 import BeautifulSoup
+from config import *
+
+# opening tag of the script holding the page data, with its attributes in any order and quoting
+NEXT_DATA_OPENING = re.compile(rb'<script\b[^>]*\bid\s*=\s*["\']?' + SCRIPT_ID.encode() + rb'\b[^>]*>', re.IGNORECASE)
+SCRIPT_CLOSING = b'</script'
+
+
+def scan_next_data(content):
+    """
+    finds the __NEXT_DATA__ script by scanning the page bytes and decodes only its payload,
+    without building a DOM for the rest of the page
+    :param content: page html (bytes or str)
+    :return: decoded json, or None if the script wasn't found or didn't decode
+    """
+    if isinstance(content, str):
+        content = content.encode()
+    match = NEXT_DATA_OPENING.search(content)
+    if match is None:
+        return None
+    end = content.find(SCRIPT_CLOSING, match.end())
+    if end == -1:
+        return None
+    try:
+        return json.loads(content[match.end():end])
+    except ValueError:
+        return None
+
+
+def soup_next_data(content):
+    """
+    finds the __NEXT_DATA__ script with a full BeautifulSoup parse of the page
+    :param content: page html (bytes or str)
+    :return: decoded json, or None if the script wasn't found or didn't decode
+    """
+    script = BeautifulSoup(content, 'html.parser').find(SCRIPT_TAG, id=SCRIPT_ID, type=SCRIPT_TYPE)
+    if script is None or script.string is None:
+        return None
+    try:
+        return json.loads(script.string)
+    except ValueError:
+        return None
+
+
+def extract_next_data(content):
+    """
+    decodes the __NEXT_DATA__ json of a page with the byte scanner, falling back to BeautifulSoup
+    for pages the scanner can't handle
+    :param content: page html (bytes or str)
+    :return: decoded json, or None if the page has no __NEXT_DATA__ or it didn't decode
+    """
+    data = scan_next_data(content)
+    if data is None:
+        coin_logger.debug('Could not scan __NEXT_DATA__, parsing the whole page.')
+        data = soup_next_data(content)
+    return data
@@ -0,0 +1,168 @@
+import abc
+import csv
+import io
+import json
+import sys
+import gevent
+import gevent.queue
+from config import *
+
+
+class OutputSink(abc.ABC):
+    """
+        Writes the scraped articles somewhere, a batch at a time. Batches are formatted and written by a
+        background greenlet, so the fetch and insert loop only hands them over and moves on. If the writer
+        fails (like on a full disk), the next write or close raises its error.
+
+        Attributes
+        ----------
+        path: str
+            File to write to, or OUTPUT_STDOUT for the terminal.
+        written: int
+            Number of articles written so far.
+
+        Methods
+        -------
+        format_batch(batch):
+            Returns the text of a batch, each kind of sink formats it its own way.
+
+        write(batch):
+            Queues a batch of articles to be written.
+
+        close():
+            Waits for the queued batches to be written and closes the file.
+        """
+
+    def __init__(self, path=OUTPUT_STDOUT):
+        self.path = path
+        self.written = 0
+        self._file = self._open()
+        self._queue = gevent.queue.Queue(maxsize=SINK_QUEUE_SIZE)
+        self._writer = gevent.spawn(self._write_batches)
+
+    def _open(self):
+        if self.path == OUTPUT_STDOUT:
+            return sys.stdout
+        return open(self.path, 'w', buffering=SINK_BUFFER_SIZE, newline='', encoding='utf-8')
+
+    def _write_batches(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                break
+            self._file.write(self.format_batch(batch))
+            self.written += len(batch)
+        self._file.flush()
+        if self._file is not sys.stdout:
+            self._file.close()
+
+    @abc.abstractmethod
+    def format_batch(self, batch):
+        """
+        :param batch: ArticleBatch
+        :return: the text of the batch
+        """
+
+    def _put(self, item):
+        """
+        queues an item for the writer, checking every SINK_WRITER_CHECK seconds that it's still there to take it
+        :param item: ArticleBatch, or None to stop the writer
+        """
+        while True:
+            if self._writer.dead:
+                self._writer.get()  # raises the error the writer stopped with
+                raise ValueError(f'The output to {self.path} is already closed.')
+            try:
+                self._queue.put(item, timeout=SINK_WRITER_CHECK)
+                return
+            except gevent.queue.Full:
+                continue
+
+    def write(self, batch):
+        """
+        queues a batch of articles, blocking only when SINK_QUEUE_SIZE batches are still waiting
+        :param batch: ArticleBatch
+        """
+        if len(batch):
+            self._put(batch)
+
+    def close(self):
+        """writes everything that is still queued and closes the file"""
+        self._put(None)
+        self._writer.get()
+        coin_logger.info(f'Wrote {self.written} articles to {self.path}.')
+
+
+class NoSink(OutputSink):
+    """Drops the articles, for runs where only the database matters (like under cron)."""
+
+    def __init__(self, path=OUTPUT_STDOUT):
+        self.path = path
+        self.written = 0
+
+    def format_batch(self, batch):
+        return ''
+
+    def write(self, batch):
+        pass
+
+    def close(self):
+        pass
+
+
+class TableSink(OutputSink):
+    """The human readable table of every article."""
+
+    def format_batch(self, batch):
+        return ''.join(f'{article} \n\n' for article in batch)
+
+
+def article_record(batch, i):
+    """
+    :param batch: ArticleBatch
+    :param i: index of the article in the batch
+    :return: dictionary of the article fields
+    """
+    return {'number': batch.numbers[i], 'title': batch.titles[i], 'summary': batch.summaries[i],
+            'authors': list(batch.authors[i]), 'link': batch.links[i], 'tags': list(batch.tags[i]),
+            'date_published': batch.dates_published[i].isoformat(), 'categories': list(batch.categories[i]),
+            'source': batch.sources[i]}
+
+
+class JsonLinesSink(OutputSink):
+    """One json object per article per line."""
+
+    def format_batch(self, batch):
+        return ''.join(json.dumps(article_record(batch, i), ensure_ascii=False) + '\n' for i in range(len(batch)))
+
+
+class CsvSink(OutputSink):
+    """A csv table with a header row, list fields are joined with OUTPUT_LIST_SEPARATOR."""
+
+    def __init__(self, path=OUTPUT_STDOUT):
+        self._header_written = False
+        super().__init__(path)
+
+    def format_batch(self, batch):
+        text = io.StringIO()
+        writer = csv.writer(text)
+        if not self._header_written:
+            writer.writerow(OUTPUT_FIELDS)
+            self._header_written = True
+        for i in range(len(batch)):
+            record = article_record(batch, i)
+            writer.writerow([OUTPUT_LIST_SEPARATOR.join(record[field]) if isinstance(record[field], list)
+                             else record[field] for field in OUTPUT_FIELDS])
+        return text.getvalue()
+
+
+SINKS = {NO_OUTPUT: NoSink, TABLE_OUTPUT: TableSink, JSON_LINES_OUTPUT: JsonLinesSink, CSV_OUTPUT: CsvSink}
+
+
+def get_sink(kind, path=OUTPUT_STDOUT):
+    """
+    :param kind: NO_OUTPUT, TABLE_OUTPUT, JSON_LINES_OUTPUT or CSV_OUTPUT
+    :param path: file to write to, or OUTPUT_STDOUT for the terminal
+    :return: OutputSink
+    """
+    return SINKS[kind](path)
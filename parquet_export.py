@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import pymysql
+import storage
+from collections import defaultdict
+from config import *
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only the export needs pyarrow (requirements-export.txt), the scraper runs without it
+    pa = None
+    pq = None
+
+
+def export_schema():
+    """:return: pyarrow schema of the exported articles"""
+    return pa.schema([('id', pa.int64()), ('title', pa.string()), ('summary', pa.string()),
+                      ('publication_date', pa.timestamp('s')), ('url', pa.string()), ('source', pa.string()),
+                      ('authors', pa.list_(pa.string())), ('tags', pa.list_(pa.string())),
+                      ('categories', pa.list_(pa.string()))])
+
+
+def load_export_state(output_dir):
+    """
+    :param output_dir: directory of the dataset
+    :return: id of the last exported article (0 if nothing was exported yet)
+    """
+    path = os.path.join(output_dir, EXPORT_STATE_FILE)
+    if not os.path.exists(path):
+        return 0
+    with open(path) as state_file:
+        return json.load(state_file)['last_article_id']
+
+
+def save_export_state(output_dir, last_article_id):
+    """
+    records the last exported article, replacing the state file atomically so a crash can't corrupt it
+    :param output_dir: directory of the dataset
+    :param last_article_id: id of the last article that was written
+    """
+    descriptor, temp_path = tempfile.mkstemp(dir=output_dir, prefix='.export-state-')
+    with os.fdopen(descriptor, 'w') as temp_file:
+        json.dump({'last_article_id': last_article_id}, temp_file)
+    os.replace(temp_path, os.path.join(output_dir, EXPORT_STATE_FILE))
+
+
+def fetch_names(cursor, sql, article_ids):
+    """
+    :param cursor: the cursor object
+    :param sql: select of article_id and name with {} in place of the IN list
+    :param article_ids: ids of the articles of the chunk
+    :return: dictionary of article id to list of names
+    """
+    names = defaultdict(list)
+    cursor.execute(sql.format(', '.join(['%s'] * len(article_ids))), article_ids)
+    for row in cursor.fetchall():
+        names[row['article_id']].append(row['name'])
+    return names
+
+
+def write_chunk(rows, lookup_cursor, output_dir):
+    """
+    adds the authors, tags and categories of a chunk of articles and writes it as one parquet file per month
+    :param rows: list of (id, title, summary, publication_date, url, source)
+    :param lookup_cursor: cursor of a second connection (the first one is busy streaming the articles)
+    :param output_dir: directory of the dataset
+    :return: list of the files written
+    """
+    article_ids = [row[0] for row in rows]
+    authors = fetch_names(lookup_cursor, EXPORT_AUTHORS, article_ids)
+    tags = fetch_names(lookup_cursor, EXPORT_TAGS, article_ids)
+    categories = fetch_names(lookup_cursor, EXPORT_CATEGORIES, article_ids)
+    months = defaultdict(list)
+    for row in rows:
+        months[row[3].strftime(EXPORT_MONTH_FORMAT) if row[3] is not None else EXPORT_UNKNOWN_MONTH].append(row)
+    files = []
+    for month, month_rows in months.items():
+        columns = list(zip(*month_rows))
+        table = pa.Table.from_arrays(
+            [pa.array(columns[0], pa.int64()), pa.array(columns[1], pa.string()),
+             pa.array(columns[2], pa.string()), pa.array(columns[3], pa.timestamp('s')),
+             pa.array(columns[4], pa.string()), pa.array(columns[5], pa.string()),
+             pa.array([authors[i] for i in columns[0]], pa.list_(pa.string())),
+             pa.array([tags[i] for i in columns[0]], pa.list_(pa.string())),
+             pa.array([categories[i] for i in columns[0]], pa.list_(pa.string()))],
+            schema=export_schema())
+        partition = os.path.join(output_dir, f'{EXPORT_PARTITION}={month}')
+        os.makedirs(partition, exist_ok=True)
+        path = os.path.join(partition, f'part-{columns[0][0]:012d}.parquet')
+        pq.write_table(table, path)
+        files.append(path)
+    return files
+
+
+def export_articles(user, password, host, database, output_dir, full=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    streams the articles into a parquet dataset partitioned by publication month, one denormalized row per
+    article with its authors, tags and categories as list columns. the articles are read with a server side
+    cursor and written chunk_size at a time, so memory doesn't grow with the size of the store.
+    only articles added since the last export are written, unless full is set.
+    :param user: username of mysql
+    :param password: password of mysql
+    :param host: url of database server
+    :param database: database to export
+    :param output_dir: directory of the dataset
+    :param full: export everything again, replacing the state of the previous exports
+    :param chunk_size: number of articles per written file
+    :return: number of articles exported
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if full:
+        for name in os.listdir(output_dir):
+            if name.startswith(f'{EXPORT_PARTITION}='):
+                shutil.rmtree(os.path.join(output_dir, name))
+    last_article_id = 0 if full else load_export_state(output_dir)
+    store = storage.get_storage(host, user, password, database)
+    exported = 0
+    with store.connection() as stream_connection, store.connection() as lookup_connection:
+        with stream_connection.cursor(pymysql.cursors.SSCursor) as stream, lookup_connection.cursor() as lookup:
+            stream.execute(EXPORT_ARTICLES, [last_article_id])
+            while True:
+                rows = stream.fetchmany(chunk_size)
+                if not rows:
+                    break
+                write_chunk(rows, lookup, output_dir)
+                exported += len(rows)
+                last_article_id = rows[-1][0]
+                save_export_state(output_dir, last_article_id)
+                sql_logger.info(f'Exported {exported} articles to {output_dir}.')
+    return exported
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exports the articles to a parquet dataset partitioned by month.')
+    parser.add_argument('-u', '--username', help='username of mysql', default=USER)
+    parser.add_argument('-p', '--password', help='password of mysql (required with the mysql storage)')
+    parser.add_argument('-host', help='url of database server', default=HOST)
+    parser.add_argument('-db', '--database', help='Name of database to export (the database file with sqlite)',
+                        default=DATABASE)
+    parser.add_argument('--storage', help='Database backend: a MySQL server, or an embedded SQLite file',
+                        choices=[MYSQL_STORAGE, SQLITE_STORAGE], default=MYSQL_STORAGE)
+    parser.add_argument('-o', '--output', help='Directory of the parquet dataset', default=EXPORT_DIR)
+    parser.add_argument('--full', help='Export all the articles again instead of only the new ones',
+                        action='store_true')
+    args = parser.parse_args()
+    if args.storage == MYSQL_STORAGE and args.password is None:
+        parser.error('the following arguments are required with the mysql storage: -p/--password')
+    if pa is None:
+        parser.error('the export needs pyarrow, install it with "pip install -r requirements-export.txt"')
+    storage.select_backend(args.storage)
+    try:
+        exported = export_articles(args.username, args.password, args.host, args.database, args.output, args.full)
+    except storage.DatabaseError as err:
+        sql_logger.error(err.args)
+        print(err.args)
+        exit(1)
+    finally:
+        storage.close_storages()
+    print(f'Exported {exported} articles to {args.output}.')
+
+
+if __name__ == '__main__':
+    main()
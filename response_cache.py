@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from config import *
+
+
+class ResponseCache:
+    """
+        A persistent cache of json responses on disk, one file per key. Entries younger than ttl are fresh,
+        entries younger than ttl + stale_ttl may still be served while they are refreshed, and the oldest
+        entries are evicted when the files take more than max_bytes.
+
+        Attributes
+        ----------
+        directory: str
+            Directory of the cache files.
+        ttl: float
+            Seconds an entry is fresh.
+        stale_ttl: float
+            Seconds after ttl an entry may still be served stale.
+        max_bytes: int
+            Maximum size of all the cache files.
+
+        Methods
+        -------
+        get(params):
+            Returns the cached value and FRESH_ENTRY or STALE_ENTRY, or (None, None) on a miss.
+
+        put(params, value):
+            Stores a value, evicting the oldest entries if the cache got too big.
+
+        stats():
+            Returns a dictionary of the hit and miss counters.
+        """
+
+    def __init__(self, directory, ttl, stale_ttl, max_bytes):
+        self.directory = directory
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'evictions': 0}
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(params):
+        """
+        :param params: json serializable dictionary of the normalized query parameters
+        :return: file name of the entry
+        """
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest() + '.json'
+
+    def get(self, params):
+        """
+        :param params: json serializable dictionary of the normalized query parameters
+        :return: value, FRESH_ENTRY or STALE_ENTRY - or None, None if it isn't cached or expired
+        """
+        path = os.path.join(self.directory, self.key(params))
+        try:
+            with open(path) as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            self._stats['misses'] += 1
+            return None, None
+        age = time.time() - entry['stored']
+        if age < self.ttl:
+            self._stats['hits'] += 1
+            return entry['value'], FRESH_ENTRY
+        if age < self.ttl + self.stale_ttl:
+            self._stats['stale_hits'] += 1
+            return entry['value'], STALE_ENTRY
+        self._stats['misses'] += 1
+        return None, None
+
+    def put(self, params, value):
+        """
+        stores a value atomically (a reader never sees half an entry) and evicts the oldest entries
+        while the cache is bigger than max_bytes
+        :param params: json serializable dictionary of the normalized query parameters
+        :param value: json serializable value
+        """
+        descriptor, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.entry-')
+        with os.fdopen(descriptor, 'w') as temp_file:
+            json.dump({'stored': time.time(), 'params': params, 'value': value}, temp_file)
+        os.replace(temp_path, os.path.join(self.directory, self.key(params)))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        size = sum(entry[1] for entry in entries)
+        for mtime, entry_size, name in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            size -= entry_size
+            self._stats['evictions'] += 1
+
+    def stats(self):
+        """:return: dictionary of the hit and miss counters"""
+        return dict(self._stats)
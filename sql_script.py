@@ -1,10 +1,130 @@
-import pymysql
 import argparse
+from datetime import date, timedelta
 import pandas as pd
+import storage
 from config import *
 # pd.set_option('display.max_rows', None)
 
 
+def dedupe_entities_statements(table, name_column, relationship_table, entity_column):
+    """
+    builds the statements that merge duplicate rows of an entity table and make its name unique
+    :param table: entity table
+    :param name_column: the column that should be unique
+    :param relationship_table: the relationship table pointing at the entity
+    :param entity_column: the column of the relationship table pointing at the entity
+    :return: list of sql statements
+    """
+    names = dict(table=table, name_column=name_column, relationship_table=relationship_table,
+                 entity_column=entity_column)
+    return [REPOINT_DUPLICATE_ENTITIES.format(**names),
+            DELETE_DUPLICATE_ENTITIES.format(**names),
+            ADD_UNIQUE_INDEX.format(table=table, index_name=f'{table}_{name_column}_unique', columns=name_column)]
+
+
+def dedupe_relationships_statements(table, entity_column):
+    """
+    builds the statements that remove duplicate rows of a relationship table and give it a primary key,
+    which is also the covering index for joining from the entity to its articles
+    :param table: relationship table
+    :param entity_column: the column of the relationship table pointing at the entity
+    :return: list of sql statements
+    """
+    names = dict(table=table, entity_column=entity_column)
+    return [COPY_DISTINCT_RELATIONSHIPS.format(**names),
+            DELETE_RELATIONSHIPS.format(**names),
+            RESTORE_DISTINCT_RELATIONSHIPS.format(**names),
+            DROP_DISTINCT_RELATIONSHIPS.format(**names),
+            ADD_PRIMARY_KEY.format(table=table, columns=f'{entity_column}, article_id')]
+
+
+def use_builtin_collation(cursor):
+    """
+    moves the name columns of a SQLite file from the collation the scraper used to register to SQLITE_COLLATION,
+    so the file can be read by other tools: the table definitions are rewritten, the values lose their trailing
+    spaces (which are stripped when binding now), and the indexes are rebuilt in the new order
+    :param cursor: cursor of a SQLite connection
+    """
+    cursor.execute(SQLITE_SCHEMA_VERSION)
+    schema_version = cursor.fetchone()['schema_version']
+    cursor.execute('PRAGMA writable_schema = ON')
+    cursor.execute(REPLACE_SQLITE_COLLATION)
+    cursor.execute(f'{SQLITE_SCHEMA_VERSION} = {schema_version + 1}')  # other connections read them again
+    cursor.connection.commit()
+    cursor.execute('PRAGMA writable_schema = RESET')  # and so does this one
+    cursor.execute('PRAGMA writable_schema = OFF')
+    for table, column in SQLITE_COLLATED_COLUMNS:
+        cursor.execute(STRIP_TRAILING_SPACES.format(table=table, column=column))
+    cursor.execute('REINDEX')
+
+
+# (table, creation script per backend), in the order the tables have to be created
+TABLES = [
+    ('Authors', {MYSQL_STORAGE: AUTHORS_CREATION, SQLITE_STORAGE: SQLITE_AUTHORS_CREATION}),
+    ('Summaries', {MYSQL_STORAGE: SUMMARIES_CREATION, SQLITE_STORAGE: SQLITE_SUMMARIES_CREATION}),
+    ('Categories', {MYSQL_STORAGE: CATEGORIES_CREATION, SQLITE_STORAGE: SQLITE_CATEGORIES_CREATION}),
+    ('Tags', {MYSQL_STORAGE: TAGS_CREATION, SQLITE_STORAGE: SQLITE_TAGS_CREATION}),
+    ('Articles', {MYSQL_STORAGE: ARTICLES_CREATION, SQLITE_STORAGE: SQLITE_ARTICLES_CREATION}),
+    ('tags-articles Relationship', {MYSQL_STORAGE: TAGS_ARTICLES_RELATIONSHIP_CREATION,
+                                    SQLITE_STORAGE: SQLITE_TAGS_ARTICLES_RELATIONSHIP_CREATION}),
+    ('author-articles Relationship', {MYSQL_STORAGE: AUTHORS_ARTICLES_RELATIONSHIP_CREATION,
+                                      SQLITE_STORAGE: SQLITE_AUTHORS_ARTICLES_RELATIONSHIP_CREATION}),
+    ('categories-articles Relationship', {MYSQL_STORAGE: CATEGORIES_ARTICLES_RELATIONSHIP_CREATION,
+                                          SQLITE_STORAGE: SQLITE_CATEGORIES_ARTICLES_RELATIONSHIP_CREATION}),
+]
+
+# (version, description, statements per backend) - append new migrations at the end, never edit applied ones.
+# SQLite tables are created with the unique keys and primary keys of migrations 1 and 2 already in place,
+# so those are only recorded there.
+MIGRATIONS = [
+    (1, 'Unique tag and category names',
+     {MYSQL_STORAGE: dedupe_entities_statements(TAGS_TABLE, 'name', TAGS_ARTICLES_TABLE, 'tag_id') +
+      dedupe_entities_statements(CATEGORIES_TABLE, 'category', CATEGORIES_ARTICLES_TABLE, 'category_id')}),
+    (2, 'Primary keys on the relationship tables',
+     {MYSQL_STORAGE: dedupe_relationships_statements(TAGS_ARTICLES_TABLE, 'tag_id') +
+      dedupe_relationships_statements(AUTHORS_ARTICLES_TABLE, 'author_id') +
+      dedupe_relationships_statements(CATEGORIES_ARTICLES_TABLE, 'category_id')}),
+    (3, 'Index articles by source and publication date',
+     {MYSQL_STORAGE: [ADD_INDEX.format(table=ARTICLES_TABLE, index_name='articles_source_date',
+                                       columns='source, publication_date')],
+      SQLITE_STORAGE: [SQLITE_ARTICLES_SOURCE_DATE_INDEX]}),
+    (4, 'Daily tag counts',
+     {MYSQL_STORAGE: [TAG_COUNTS_CREATION, TAG_COUNTS_SOURCE_DAY_INDEX, CLEAR_TAG_COUNTS, REBUILD_TAG_COUNTS],
+      SQLITE_STORAGE: [SQLITE_TAG_COUNTS_CREATION, TAG_COUNTS_SOURCE_DAY_INDEX, CLEAR_TAG_COUNTS,
+                       REBUILD_TAG_COUNTS]}),
+    (5, 'Google Trends regions of tags',
+     {MYSQL_STORAGE: [TAG_REGIONS_CREATION], SQLITE_STORAGE: [TAG_REGIONS_CREATION]}),
+    (6, 'Built in collation of the SQLite name columns', {SQLITE_STORAGE: [use_builtin_collation]}),
+]
+
+
+def migrate_database(cursor, dialect=MYSQL_STORAGE):
+    """
+    upgrades the schema in place by applying the migrations newer than the recorded schema version.
+    each migration is recorded in the schema version table right after it's applied.
+    a statement can also be a function of the cursor, for migrations that depend on what's in the database.
+    :param cursor: cursor of a connection that uses the database
+    :param dialect: MYSQL_STORAGE or SQLITE_STORAGE, picks the statements of the migrations
+    :return: the schema version of the database
+    """
+    cursor.execute(SCHEMA_VERSION_CREATION)
+    cursor.execute(SELECT_SCHEMA_VERSION)
+    version = cursor.fetchone()['version'] or 0
+    for migration_version, description, statements in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        for statement in statements.get(dialect, []):
+            if callable(statement):
+                statement(cursor)
+            else:
+                cursor.execute(statement)
+        cursor.execute(INSERT_SCHEMA_VERSION, [migration_version, description])
+        cursor.connection.commit()
+        version = migration_version
+        sql_logger.info(f'Migrated database to schema version {version}: {description}.')
+    return version
+
+
 def initialize_database(user, password, host, database):
     """
     create the database with all the tables
@@ -13,28 +133,16 @@ def initialize_database(user, password, host, database):
     :param host: url of database server
     :param database: database to save to
     """
-    with pymysql.connect(host=host, user=user, password=password,
-                         cursorclass=pymysql.cursors.DictCursor) as connection_instance:
+    store = storage.get_storage(host, user, password, database)
+    store.create_database()
+    sql_logger.info("Created database if doesn't exist already.")
+    with store.connection() as connection_instance:
         with connection_instance.cursor() as cursor_instance:
-            cursor_instance.execute(CREATE_DATABASE + database)
-            sql_logger.info("Created database if doesn't exist already.")
-            cursor_instance.execute(USE_DATABASE + database)
-            cursor_instance.execute(AUTHORS_CREATION)
-            sql_logger.info("Created Authors table if doesn't exist already.")
-            cursor_instance.execute(SUMMARIES_CREATION)
-            sql_logger.info("Created Summaries table if doesn't exist already.")
-            cursor_instance.execute(CATEGORIES_CREATION)
-            sql_logger.info("Created Categories table if doesn't exist already.")
-            cursor_instance.execute(TAGS_CREATION)
-            sql_logger.info("Created Tags table if doesn't exist already.")
-            cursor_instance.execute(ARTICLES_CREATION)
-            sql_logger.info("Created Articles table if doesn't exist already.")
-            cursor_instance.execute(TAGS_ARTICLES_RELATIONSHIP_CREATION)
-            sql_logger.info("Created tags-articles Relationship table if doesn't exist already.")
-            cursor_instance.execute(AUTHORS_ARTICLES_RELATIONSHIP_CREATION)
-            sql_logger.info("Created author-articles Relationship table if doesn't exist already.")
-            cursor_instance.execute(CATEGORIES_ARTICLES_RELATIONSHIP_CREATION)
-            sql_logger.info("Created categories-articles Relationship table if doesn't exist already.")
+            for name, scripts in TABLES:
+                cursor_instance.execute(scripts[store.dialect])
+                sql_logger.info(f"Created {name} table if doesn't exist already.")
+            version = migrate_database(cursor_instance, store.dialect)
+            sql_logger.info(f'Database is at schema version {version}.')
 
 
 def show_and_describe_tables(user, password, host, database):
@@ -46,15 +154,12 @@ def show_and_describe_tables(user, password, host, database):
     :param database: database to save to
     :return:
     """
-    with pymysql.connect(host=host, user=user, password=password, database=database,
-                         cursorclass=pymysql.cursors.DictCursor) as connection_instance:
+    store = storage.get_storage(host, user, password, database)
+    with store.connection() as connection_instance:
         with connection_instance.cursor() as cursor:
-            cursor.execute('SHOW TABLES')
-            results = cursor.fetchall()
-            results = map(lambda x: x['Tables_in_' + database], results)
-            for r in results:
+            for r in store.table_names(cursor):
                 print(r, ':')
-                cursor.execute('DESCRIBE ' + r)
+                cursor.execute(DESCRIBE_TABLE[store.dialect].format(r))
                 print(pd.DataFrame(cursor.fetchall()), '\n')
                 cursor.execute(f'SELECT * FROM {r}')
                 print(pd.DataFrame(cursor.fetchall()), '\n')
@@ -69,10 +174,7 @@ def drop_database(user, password, host, database):
     :param database: database to save to
     :return:
     """
-    with pymysql.connect(host=host, user=user, password=password,
-                         cursorclass=pymysql.cursors.DictCursor) as connection_instance:
-        with connection_instance.cursor() as cursor:
-            cursor.execute(f'DROP DATABASE {database}')
+    storage.get_storage(host, user, password, database).drop_database()
     sql_logger.info(f'Deleted the database {database}.')
 
 
@@ -90,6 +192,45 @@ def reset_database(user, password, host, database):
     sql_logger.info(f'Reset the database {database}.')
 
 
+def rebuild_tag_counts(user, password, host, database):
+    """
+    recounts the daily tag counts from the tags-articles relationship table, in one transaction,
+    for when the summary table was changed by hand or articles were deleted
+    :param user: username of mysql
+    :param password: password of mysql
+    :param host: url of database server
+    :param database: database to save to
+    :return: number of counter rows
+    """
+    with storage.get_storage(host, user, password, database).connection() as connection_instance:
+        with connection_instance.cursor() as cursor:
+            cursor.execute(CLEAR_TAG_COUNTS)
+            rows = cursor.execute(REBUILD_TAG_COUNTS)
+        connection_instance.commit()
+    sql_logger.info(f'Rebuilt the tag counts: {rows} rows.')
+    return rows
+
+
+def select_top_tags(user, password, host, database, top=TOP_TAGS_COUNT, days=None, source=TOP_TAGS_SOURCE):
+    """
+    Retrieves the most popular tags from the daily tag counts and returns a dataframe.
+    :param user: username of mysql
+    :param password: password of mysql
+    :param host: url of database server
+    :param database: database to save to
+    :param top: number of tags
+    :param days: count only the articles published in the last days, None for all of them
+    :param source: count only the articles of this source
+    :return: dataframe of the most popular tags and their respective tag counts.
+    """
+    since = date.min if days is None else date.today() - timedelta(days=days)
+    with storage.get_storage(host, user, password, database).connection() as connection_instance:
+        with connection_instance.cursor() as cursor:
+            cursor.execute(TOP_TAGS, [source, since, top])
+            results = cursor.fetchall()
+            return pd.DataFrame(results, columns=['tag', 'tag_count'])
+
+
 def select_top_ten_tags(user, password, host, database):
     """
     Retrieves the ten most popular tags and returns a dataframe.
@@ -99,26 +240,29 @@ def select_top_ten_tags(user, password, host, database):
     :param database: database to save to
     :return: dataframe of 10 most popular tags and their respective tag counts.
     """
-    with pymysql.connect(host=host, user=user, password=password, database=database,
-                         cursorclass=pymysql.cursors.DictCursor) as connection_instance:
-        with connection_instance.cursor() as cursor:
-            cursor.execute(TOP_TEN_TAGS)
-            results = cursor.fetchall()
-            return pd.DataFrame(results)
+    return select_top_tags(user, password, host, database)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-u', '--username', help='username of mysql', default=USER)
-    required = parser.add_argument_group('required arguments')
-    required.add_argument('-p', '--password', help='password of mysql', required=True)
+    parser.add_argument('-p', '--password', help='password of mysql (required with the mysql storage)')
     parser.add_argument('-host', help='url of database server', default=HOST)
-    parser.add_argument('-db', '--database', help='Name of database to create', default=DATABASE)
+    parser.add_argument('-db', '--database', help='Name of database to create (the database file with sqlite)',
+                        default=DATABASE)
+    parser.add_argument('--storage', help='Database backend: a MySQL server, or an embedded SQLite file',
+                        choices=[MYSQL_STORAGE, SQLITE_STORAGE], default=MYSQL_STORAGE)
     parser.add_argument('--print', help='Show the created DB and its tables', action='store_true')
     parser.add_argument('--delete', help='Clean database for tests', action='store_true')
     parser.add_argument('--reset', help='Reset database for tests', action='store_true')
-    # parser.add_argument('--top10', help='Prints the 10 most common tags', action='store_true')
+    parser.add_argument('--top', metavar='N', help='Prints the N most common tags', type=int)
+    parser.add_argument('--days', help='With --top, count only the articles of the last DAYS days', type=int)
+    parser.add_argument('--rebuild-tag-counts', help='Recount the tag counts summary table from the articles',
+                        action='store_true')
     args = parser.parse_args()
+    if args.storage == MYSQL_STORAGE and args.password is None:
+        parser.error('the following arguments are required with the mysql storage: -p/--password')
+    storage.select_backend(args.storage)
     try:
         initialize_database(args.username, args.password, args.host, args.database)
         if args.reset:
@@ -127,12 +271,18 @@ def main():
             show_and_describe_tables(args.username, args.password, args.host, args.database)
         if args.delete:
             drop_database(args.username, args.password, args.host, args.database)
-        # if args.top10:
-        #     print(select_top_ten_tags(args.username, args.password, args.host, args.database))
-    except pymysql.err.Error as err:
+        if args.rebuild_tag_counts:
+            rebuild_tag_counts(args.username, args.password, args.host, args.database)
+        if args.top:
+            print(select_top_tags(args.username, args.password, args.host, args.database, args.top, args.days))
+    except storage.DatabaseError as err:
         sql_logger.error(err.args)
         print(err.args)
         exit(1)
+    finally:
+        for stats in storage.storage_stats():
+            sql_logger.info(f'Storage connection stats: {stats}')
+        storage.close_storages()
 
 
 if __name__ == '__main__':
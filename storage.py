@@ -0,0 +1,379 @@
+import os
+import sqlite3
+import pymysql
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import lru_cache
+import db_pool
+from config import *
+
+# errors raised by either backend, for the except clauses of code that works with both
+IntegrityError = (pymysql.err.IntegrityError, sqlite3.IntegrityError)
+DatabaseError = (pymysql.err.Error, sqlite3.Error)
+
+
+class RowNotFoundError(pymysql.err.DatabaseError):
+    """A row that a unique key conflict reported as existing could not be read back."""
+
+# stored the way MySQL returns TIMESTAMP columns as text, so both backends sort and compare dates the same,
+# and read back as datetime like pymysql does
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()))
+
+_backend = MYSQL_STORAGE
+_storages = {}
+
+
+def select_backend(kind):
+    """
+    chooses the backend get_storage returns for the rest of the run (worker processes inherit it)
+    :param kind: MYSQL_STORAGE or SQLITE_STORAGE
+    """
+    global _backend
+    if kind not in (MYSQL_STORAGE, SQLITE_STORAGE):
+        raise ValueError(f'Unknown storage backend: {kind}')
+    _backend = kind
+
+
+class MySqlStorage:
+    """
+        The MySQL server backend, lending connections from the shared connection pools.
+
+        Attributes
+        ----------
+        dialect: str
+            MYSQL_STORAGE, picks the dialect specific sql.
+        host: str
+            url of database server.
+        user: str
+            username of mysql.
+        password: str
+            password of mysql.
+        database: str
+            Name of the database.
+
+        Methods
+        -------
+        connection():
+            Context manager that lends a connection.
+
+        create_database():
+            Creates the database if it doesn't exist.
+
+        drop_database():
+            Deletes the database.
+
+        table_names(cursor):
+            Returns the names of the tables.
+
+        stats():
+            Returns a dictionary of the connection statistics.
+
+        close():
+            Closes the idle connections.
+        """
+    dialect = MYSQL_STORAGE
+
+    def __init__(self, host, user, password, database):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.database = database
+
+    def connection(self):
+        """:return: context manager lending a pooled connection to the database"""
+        return db_pool.get_pool(self.host, self.user, self.password, self.database).connection()
+
+    def create_database(self):
+        """creates the database on the server if it doesn't exist already"""
+        with db_pool.get_pool(self.host, self.user, self.password).connection() as connection_instance:
+            with connection_instance.cursor() as cursor:
+                cursor.execute(CREATE_DATABASE + self.database)
+
+    def drop_database(self):
+        """deletes the whole database"""
+        with db_pool.get_pool(self.host, self.user, self.password).connection() as connection_instance:
+            with connection_instance.cursor() as cursor:
+                cursor.execute(f'DROP DATABASE {self.database}')
+        db_pool.get_pool(self.host, self.user, self.password, self.database).close()
+
+    def table_names(self, cursor):
+        """
+        :param cursor: the cursor object
+        :return: list of table names
+        """
+        cursor.execute('SHOW TABLES')
+        return [row['Tables_in_' + self.database] for row in cursor.fetchall()]
+
+    def stats(self):
+        """:return: dictionary of the connection statistics"""
+        stats = db_pool.get_pool(self.host, self.user, self.password, self.database).stats()
+        stats['backend'] = self.dialect
+        return stats
+
+    def close(self):
+        """closes the idle connections"""
+        db_pool.close_pools()
+
+
+@lru_cache(maxsize=None)
+def sqlite_sql(sql):
+    """
+    translates the MySQL flavored sql the rest of the code uses to SQLite
+    :param sql: sql with %s placeholders
+    :return: sql with ? placeholders
+    """
+    return sql.replace('%s', '?').replace('INSERT IGNORE', 'INSERT OR IGNORE')
+
+
+def sqlite_args(args):
+    """
+    :param args: query arguments the way pymysql accepts them (a sequence, or a single value)
+    :return: sequence of arguments, strings without trailing spaces: MySQL ignores them when comparing, and
+             the SQLITE_COLLATION columns don't
+    """
+    if args is None:
+        return []
+    if isinstance(args, dict):
+        return {name: sqlite_value(value) for name, value in args.items()}
+    if isinstance(args, (list, tuple)):
+        return [sqlite_value(value) for value in args]
+    return [sqlite_value(args)]
+
+
+def sqlite_value(value):
+    """:return: the value to bind, a string without its trailing spaces"""
+    return value.rstrip(' ') if isinstance(value, str) else value
+
+
+class SqliteCursor:
+    """
+        A cursor over a SQLite connection with the pymysql cursor interface the rest of the code uses:
+        %s placeholders, rows as dictionaries (or tuples for streaming cursors), lastrowid and executemany.
+        """
+
+    def __init__(self, connection, dict_rows=True):
+        self.connection = connection
+        self._cursor = connection.raw.cursor()
+        self._dict_rows = dict_rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, sql, args=None):
+        """
+        :param sql: sql with %s placeholders
+        :param args: query arguments
+        :return: number of affected rows
+        """
+        self._cursor.execute(sqlite_sql(sql), sqlite_args(args))
+        return self._cursor.rowcount
+
+    def executemany(self, sql, args):
+        """
+        :param sql: sql with %s placeholders
+        :param args: list of query arguments
+        :return: number of affected rows
+        """
+        self._cursor.executemany(sqlite_sql(sql), [sqlite_args(row) for row in args])
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def _row(self, row):
+        if row is None or not self._dict_rows:
+            return row
+        return dict(zip([column[0] for column in self._cursor.description], row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        return [self._row(row) for row in self._cursor.fetchmany(size or self._cursor.arraysize)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return (self._row(row) for row in self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+
+def dialect_of(connection_instance):
+    """
+    :param connection_instance: connection object of either backend
+    :return: MYSQL_STORAGE or SQLITE_STORAGE, to pick dialect specific sql
+    """
+    return getattr(connection_instance, 'dialect', MYSQL_STORAGE)
+
+
+class SqliteConnection:
+    """
+        A SQLite connection with the pymysql connection interface. Transactions are opened implicitly by
+        the first write and last until commit, so every batch the scraper saves is one transaction.
+        """
+    dialect = SQLITE_STORAGE
+
+    def __init__(self, path):
+        self.raw = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False,
+                                   detect_types=sqlite3.PARSE_DECLTYPES)
+        for pragma in SQLITE_PRAGMAS:
+            self.raw.execute(pragma)
+
+    def cursor(self, cursorclass=None):
+        """
+        :param cursorclass: a pymysql streaming cursor class to get rows as tuples, None for dictionaries
+        :return: SqliteCursor
+        """
+        return SqliteCursor(self, dict_rows=cursorclass is None)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+
+class SqliteStorage:
+    """
+        The embedded SQLite backend: a single database file in WAL mode, so readers don't block the writer,
+        with synchronous=NORMAL since WAL keeps committed batches safe from application crashes.
+        Connections are kept open and reused for the whole run.
+
+        Attributes
+        ----------
+        dialect: str
+            SQLITE_STORAGE, picks the dialect specific sql.
+        path: str
+            Database file.
+
+        Methods
+        -------
+        connection():
+            Context manager that lends a connection.
+
+        create_database():
+            Nothing to do, the file is created by the first connection.
+
+        drop_database():
+            Deletes the database file.
+
+        table_names(cursor):
+            Returns the names of the tables.
+
+        stats():
+            Returns a dictionary of the connection statistics.
+
+        close():
+            Closes the idle connections.
+        """
+    dialect = SQLITE_STORAGE
+
+    def __init__(self, path):
+        self.path = path
+        self._idle = []
+        self._stats = {'created': 0, 'reused': 0, 'in_use': 0}
+
+    @contextmanager
+    def connection(self):
+        """
+        lends a connection for the duration of a with block, rolling back whatever wasn't committed
+        :return: SqliteConnection
+        """
+        if self._idle:
+            connection_instance = self._idle.pop()
+            self._stats['reused'] += 1
+        else:
+            connection_instance = SqliteConnection(self.path)
+            self._stats['created'] += 1
+            sql_logger.info(f'Opened SQLite database {self.path}.')
+        self._stats['in_use'] += 1
+        try:
+            yield connection_instance
+        finally:
+            self._stats['in_use'] -= 1
+            connection_instance.rollback()
+            self._idle.append(connection_instance)
+
+    def create_database(self):
+        """the database file is created when it's first opened"""
+
+    def drop_database(self):
+        """deletes the database file and its write ahead log"""
+        self.close()
+        for path in (self.path, self.path + '-wal', self.path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def table_names(self, cursor):
+        """
+        :param cursor: the cursor object
+        :return: list of table names
+        """
+        cursor.execute(SQLITE_LIST_TABLES)
+        return [row['name'] for row in cursor.fetchall()]
+
+    def stats(self):
+        """:return: dictionary of the connection statistics"""
+        return dict(self._stats, idle=len(self._idle), database=self.path, backend=self.dialect)
+
+    def close(self):
+        """closes the idle connections"""
+        idle, self._idle = self._idle, []
+        for connection_instance in idle:
+            connection_instance.close()
+
+
+def sqlite_path(database):
+    """
+    :param database: database name or file
+    :return: file of the SQLite database
+    """
+    return database if os.path.splitext(database)[1] else database + SQLITE_SUFFIX
+
+
+def get_storage(host, user, password, database):
+    """
+    returns the storage of this process for the selected backend, creating it on first use.
+    for SQLite the database name is the file (SQLITE_SUFFIX is added if it has no extension).
+    :param host: url of database server (MySQL only)
+    :param user: username of mysql (MySQL only)
+    :param password: password of mysql (MySQL only)
+    :param database: database name
+    :return: MySqlStorage or SqliteStorage
+    """
+    key = (os.getpid(), _backend, host, user, password, database)
+    if key not in _storages:
+        if _backend == MYSQL_STORAGE:
+            _storages[key] = MySqlStorage(host, user, password, database)
+        else:
+            _storages[key] = SqliteStorage(sqlite_path(database))
+    return _storages[key]
+
+
+def storage_stats():
+    """:return: list of the statistics of every storage in this process"""
+    return [storage.stats() for key, storage in _storages.items() if key[0] == os.getpid()]
+
+
+def close_storages():
+    """closes the idle connections of every storage in this process"""
+    for key, storage in _storages.items():
+        if key[0] == os.getpid():
+            storage.close()